@@ -0,0 +1,228 @@
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from media import MEDIA_KINDS
+from sketches import SKETCH_CHUNK_SIZE
+
+# Часовой пояс, в котором считаются границы дней и часов
+DEFAULT_TIMEZONE = 'UTC'
+
+# Периоды группировки: частота pandas и формат подписи
+PERIODS = {
+    'hour': ('H', '%Y-%m-%d %H:00'),
+    'day': ('D', '%Y-%m-%d'),
+    'week': ('W-SUN', '%Y-%m-%d'),
+    'month': ('M', '%Y-%m'),
+}
+
+# Сколько авторов оставлять в топах статистики (их имена разрешаются и показываются)
+TOP_USERS_N = 10
+
+# Коды типов медиа в колоночном накопителе (0 — без медиа)
+_MEDIA_CODES = {kind: code for code, kind in enumerate(MEDIA_KINDS, start=1)}
+
+class MessageColumns:
+    """Колоночный накопитель полей сообщений
+
+    Вместо словаря на каждое сообщение хранятся только сырые значения
+    в типизированных массивах; агрегирование выполняется один раз в pandas.
+    С author_sketch (AuthorSketch) отправители не накапливаются: они
+    учитываются в скетче порциями по SKETCH_CHUNK_SIZE по мере добавления
+    сообщений, поэтому память на авторов не зависит от длины окна.
+    """
+
+    def __init__(self, author_sketch=None):
+        self.dates = array('q')
+        self.views = array('q')
+        self.reactions = array('q')
+        self.replies = array('q')
+        # 0 — сообщение без отправителя
+        self.sender_ids = array('q')
+        # Код типа медиа по _MEDIA_CODES
+        self.media = array('b')
+        self.author_sketch = author_sketch
+        # Отправители и реакции, еще не учтенные в скетче
+        self._pending_senders = array('q')
+        self._pending_reactions = array('q')
+
+    def __len__(self):
+        return len(self.dates)
+
+    def append(self, record):
+        self.dates.append(int(record['date'].timestamp()))
+        self.views.append(record['views'])
+        self.reactions.append(record['reactions'])
+        self.replies.append(record['replies'])
+        if self.author_sketch is None:
+            self.sender_ids.append(record['sender_id'] or 0)
+        else:
+            self._pending_senders.append(record['sender_id'] or 0)
+            self._pending_reactions.append(record['reactions'])
+            if len(self._pending_senders) >= SKETCH_CHUNK_SIZE:
+                self.flush_authors()
+        media = record.get('media')
+        self.media.append(_MEDIA_CODES[media['kind']] if media else 0)
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def flush_authors(self):
+        """Учет накопленной порции отправителей в скетче авторов"""
+        if self.author_sketch is None or not self._pending_senders:
+            return
+        self.author_sketch.update(
+            np.frombuffer(self._pending_senders, dtype=np.int64),
+            np.frombuffer(self._pending_reactions, dtype=np.int64)
+        )
+        self._pending_senders = array('q')
+        self._pending_reactions = array('q')
+
+    def to_frame(self, tz=DEFAULT_TIMEZONE):
+        """DataFrame без копирования массивов; даты в указанном часовом поясе
+
+        Со скетчем авторов столбца sender_id нет.
+        """
+        columns = {
+            'date': pd.to_datetime(np.frombuffer(self.dates, dtype=np.int64), unit='s', utc=True).tz_convert(tz),
+            'views': np.frombuffer(self.views, dtype=np.int64),
+            'reactions': np.frombuffer(self.reactions, dtype=np.int64),
+            'replies': np.frombuffer(self.replies, dtype=np.int64),
+            'media': np.frombuffer(self.media, dtype=np.int8),
+        }
+        if self.author_sketch is None:
+            columns['sender_id'] = np.frombuffer(self.sender_ids, dtype=np.int64)
+        return pd.DataFrame(columns)
+
+def _bucket_index(dates, period):
+    """Начало периода для каждой даты (с учетом часового пояса дат)"""
+    freq = PERIODS[period][0]
+    tz = dates.dt.tz
+    starts = dates.dt.tz_localize(None).dt.to_period(freq).dt.start_time
+    return starts.dt.tz_localize(tz, ambiguous=True, nonexistent='shift_forward')
+
+def _period_range(start_date, end_date, period, tz):
+    """Все периоды окна, включая пустые"""
+    freq = PERIODS[period][0]
+    start = pd.Timestamp(start_date).tz_convert(tz).tz_localize(None)
+    end = pd.Timestamp(end_date).tz_convert(tz).tz_localize(None)
+    starts = pd.period_range(start, end, freq=freq).start_time
+    return starts.tz_localize(tz, ambiguous=True, nonexistent='shift_forward')
+
+def aggregate_periods(frame, start_date, end_date, period='day'):
+    """Сообщения, просмотры, реакции и ответы по периодам окна
+
+    Возвращает DataFrame с индексом — началом периода в часовом поясе дат
+    и столбцами messages, views, reactions, replies.
+    """
+    tz = frame['date'].dt.tz
+    grouped = frame.groupby(_bucket_index(frame['date'], period)).agg(
+        messages=('views', 'size'),
+        views=('views', 'sum'),
+        reactions=('reactions', 'sum'),
+        replies=('replies', 'sum'),
+    )
+    index = _period_range(start_date, end_date, period, tz)
+    return grouped.reindex(index, fill_value=0).astype(np.int64)
+
+def aggregate_rollup_periods(hours, authors, start_date, end_date, period='day', tz=DEFAULT_TIMEZONE):
+    """Сообщения, просмотры, реакции, ответы и число авторов по периодам окна
+
+    hours и authors — почасовые агрегаты хранилища (столбцы из
+    MessageStore.rollup_hours и rollup_hour_authors). Часы распределяются по
+    периодам в часовом поясе tz, поэтому результат совпадает с aggregate_periods
+    по сообщениям с точностью до часа на границах окна.
+    """
+    def hour_dates(values):
+        return pd.Series(pd.to_datetime(np.asarray(values, dtype=np.int64), unit='s', utc=True).tz_convert(tz))
+
+    counters = pd.DataFrame({column: np.asarray(values, dtype=np.int64) for column, values in hours.items() if column != 'date'})
+    grouped = counters.groupby(_bucket_index(hour_dates(hours['date']), period)).sum()
+    senders = pd.Series(np.asarray(authors['sender_id'], dtype=np.int64))
+    grouped['authors'] = senders.groupby(_bucket_index(hour_dates(authors['date']), period)).nunique()
+    index = _period_range(start_date, end_date, period, tz)
+    return grouped.reindex(index).fillna(0).astype(np.int64)
+
+def aggregate_senders(frame):
+    """Число сообщений и реакций по отправителям, по убыванию числа сообщений"""
+    senders = frame[frame['sender_id'] != 0]
+    return senders.groupby('sender_id').agg(
+        count=('views', 'size'),
+        reactions=('reactions', 'sum'),
+    ).sort_values('count', ascending=False, kind='stable')
+
+def aggregate_media(frame):
+    """Число сообщений с медиа каждого типа, по убыванию"""
+    codes = frame['media'].to_numpy()
+    counts = np.bincount(codes, minlength=len(MEDIA_KINDS) + 1)[1:]
+    order = np.argsort(-counts, kind='stable')
+    return {MEDIA_KINDS[i]: int(counts[i]) for i in order if counts[i]}
+
+def _series(periods, column, label_format):
+    return {
+        'dates': [start.strftime(label_format) for start in periods.index],
+        'values': periods[column].tolist(),
+    }
+
+def _sketch_top_users(author_sketch):
+    """Топ авторов и их число по заполненному скетчу (AuthorSketch)"""
+    top_users = {
+        str(sender_id): {'name': f"User {sender_id}", 'count': count}
+        for sender_id, count, _ in author_sketch.by_messages.top(TOP_USERS_N)
+    }
+    top_users_by_reactions = {
+        str(sender_id): {'name': f"User {sender_id}", 'reactions': reactions}
+        for sender_id, reactions, _ in author_sketch.by_reactions.top(TOP_USERS_N)
+    }
+    return top_users, top_users_by_reactions, author_sketch.count()
+
+def build_messages_stats(columns, start_date, end_date, tz=DEFAULT_TIMEZONE, period='day'):
+    """Статистика сообщений в формате, который ожидает интерфейс
+
+    Итоги, ряды *_per_day (по выбранному периоду), словари top_users,
+    top_users_by_reactions с именами-заглушками — TOP_USERS_N авторов по убыванию,
+    число всех авторов (total_authors) и число сообщений с медиа по типам (media).
+    Если у columns есть скетч авторов, авторы считаются приближенно
+    с ограниченной памятью: число авторов — оценка, а заполненный скетч
+    возвращается в author_sketch для слияния.
+    """
+    frame = columns.to_frame(tz)
+    periods = aggregate_periods(frame, start_date, end_date, period)
+    label_format = PERIODS[period][1]
+
+    author_sketch = columns.author_sketch
+    if author_sketch is not None:
+        columns.flush_authors()
+        top_users, top_users_by_reactions, total_authors = _sketch_top_users(author_sketch)
+    else:
+        senders = aggregate_senders(frame)
+        top_users = {}
+        top = senders.head(TOP_USERS_N)
+        for sender_id, count in zip(top.index.tolist(), top['count'].tolist()):
+            top_users[str(sender_id)] = {'name': f"User {sender_id}", 'count': count}
+        by_reactions = senders.sort_values('reactions', ascending=False, kind='stable').head(TOP_USERS_N)
+        top_users_by_reactions = {}
+        for sender_id, reactions in zip(by_reactions.index.tolist(), by_reactions['reactions'].tolist()):
+            top_users_by_reactions[str(sender_id)] = {'name': f"User {sender_id}", 'reactions': reactions}
+        total_authors = len(senders)
+
+    stats = {
+        'total_messages': len(frame),
+        'total_views': int(frame['views'].sum()),
+        'total_reactions': int(frame['reactions'].sum()),
+        'total_replies': int(frame['replies'].sum()),
+        'period': period,
+        'messages_per_day': _series(periods, 'messages', label_format),
+        'views_per_day': _series(periods, 'views', label_format),
+        'reactions_per_day': _series(periods, 'reactions', label_format),
+        'replies_per_day': _series(periods, 'replies', label_format),
+        'top_users': top_users,
+        'top_users_by_reactions': top_users_by_reactions,
+        'media': aggregate_media(frame),
+        'total_authors': total_authors,
+    }
+    if author_sketch is not None:
+        stats['author_sketch'] = author_sketch
+    return stats
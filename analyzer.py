@@ -0,0 +1,769 @@
+import concurrent.futures
+import logging
+import queue
+import re
+from datetime import datetime, timedelta, timezone
+
+import telethon
+from telethon.tl import types
+from telethon.tl.functions.channels import GetChannelsRequest, GetFullChannelRequest
+import pandas as pd
+
+from scheduler import ErrorCollector, run_bounded, DEFAULT_CONCURRENCY
+from aggregation import MessageColumns, build_messages_stats, DEFAULT_TIMEZONE
+from result_cache import make_result_key
+from session_pool import run_pooled
+from metrics import FetchMetrics
+from entity_cache import get_account_id
+from media import extract_media_record
+from reposts import extract_repost_sources
+from sketches import AuthorSketch
+
+logger = logging.getLogger(__name__)
+
+# Окно актуализации просмотров, реакций и ответов уже сохраненных сообщений
+REFRESH_WINDOW_HOURS = 48
+# Размер пачки сообщений при записи в хранилище
+STORE_BATCH_SIZE = 500
+# Максимум ID в одном запросе получения пользователей
+SENDER_BATCH_SIZE = 100
+# Максимум каналов в одном запросе GetChannelsRequest
+CHANNELS_BATCH_SIZE = 100
+# Промахов кэша каналов, начиная с которых имена ищутся среди диалогов аккаунта
+DIALOG_SCAN_MIN_MISSES = 5
+
+class Reporter:
+    """Интерфейс вывода ошибок и прогресса анализа
+
+    Функции анализа принимают error_container (error/warning/info)
+    и progress_bar (progress); объект Reporter подходит для обоих.
+    В интерфейсе их роль играют st.empty() и st.progress().
+    """
+
+    def error(self, message):
+        pass
+
+    def warning(self, message):
+        pass
+
+    def info(self, message):
+        pass
+
+    def progress(self, value, text=None):
+        pass
+
+class LogReporter(Reporter):
+    """Вывод ошибок и прогресса в logging для пакетного режима"""
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self._last_text = None
+
+    def error(self, message):
+        logger.error("%s%s", self.prefix, message)
+
+    def warning(self, message):
+        logger.warning("%s%s", self.prefix, message)
+
+    def info(self, message):
+        logger.info("%s%s", self.prefix, message)
+
+    def progress(self, value, text=None):
+        if text and text != self._last_text:
+            self._last_text = text
+            logger.info("%s[%3.0f%%] %s", self.prefix, value * 100, text)
+
+class QueueReporter(Reporter):
+    """Потокобезопасная передача ошибок и прогресса в другой поток
+
+    Анализ в цикле событий ClientService пишет в очередь, а поток Streamlit
+    переносит события в элементы интерфейса через drain().
+    """
+
+    def __init__(self):
+        self._events = queue.SimpleQueue()
+
+    def error(self, message):
+        self._events.put(('error', message))
+
+    def warning(self, message):
+        self._events.put(('warning', message))
+
+    def info(self, message):
+        self._events.put(('info', message))
+
+    def progress(self, value, text=None):
+        self._events.put(('progress', (value, text)))
+
+    def drain(self, error_container, progress_bar=None):
+        """Передача накопленных событий в error_container и progress_bar"""
+        while True:
+            try:
+                kind, payload = self._events.get_nowait()
+            except queue.Empty:
+                return
+            if kind == 'progress':
+                if progress_bar is not None:
+                    progress_bar.progress(*payload)
+            else:
+                getattr(error_container, kind)(payload)
+
+    def wait(self, future, error_container, progress_bar=None, poll_interval=0.1):
+        """Ожидание future с переносом событий; возвращает результат future"""
+        while True:
+            try:
+                result = future.result(timeout=poll_interval)
+                break
+            except concurrent.futures.TimeoutError:
+                self.drain(error_container, progress_bar)
+        self.drain(error_container, progress_bar)
+        return result
+
+def parse_group_links(text):
+    """Список ссылок из текста: по одной на строку, через запятую или пробел
+
+    Пустые строки и комментарии (#) пропускаются, повторы удаляются
+    с сохранением порядка.
+    """
+    links = []
+    seen = set()
+    for line in text.splitlines():
+        line = line.split('#', 1)[0]
+        for link in re.split(r'[\s,;]+', line):
+            if link and link.lower() not in seen:
+                seen.add(link.lower())
+                links.append(link)
+    return links
+
+def parse_group_name(group_link):
+    """Имя группы из ссылки: t.me/name, @name или name"""
+    if 't.me/' in group_link:
+        group_name = group_link.split('t.me/')[1].split('/')[0].split('?')[0]
+    elif group_link.startswith('@'):
+        group_name = group_link[1:]
+    else:
+        group_name = group_link
+    
+    # Удаление + из имени группы (если есть)
+    return group_name.replace('+', '')
+
+async def get_group_entity(client, group_link, error_container, metrics=None, entity_cache=None):
+    """Получение entity группы по ссылке
+
+    С entity_cache (EntityCache) имя разрешается запросом к Telegram,
+    только если его нет в кэше аккаунта.
+    """
+    metrics = metrics or FetchMetrics()
+    try:
+        if not group_link:
+            error_container.error("Укажите ссылку на группу или канал")
+            return None
+        
+        # Извлечение имени группы из ссылки
+        group_name = parse_group_name(group_link)
+        
+        account_id = None
+        if entity_cache is not None:
+            account_id = await get_account_id(client)
+            entity = entity_cache.get(account_id, group_name)
+            if entity is not None:
+                return entity
+        
+        try:
+            # Получение entity группы
+            with metrics.stage('entity'):
+                entity = await client.get_entity(group_name)
+            if entity_cache is not None:
+                entity_cache.put(account_id, group_name, entity)
+            return entity
+        except telethon.errors.UsernameNotOccupiedError:
+            error_container.error(f"Группа или канал с именем {group_name} не существует")
+            return None
+        except telethon.errors.UsernameInvalidError:
+            error_container.error(f"Недопустимое имя пользователя: {group_name}")
+            return None
+        except telethon.errors.InviteHashInvalidError:
+            error_container.error("Недействительный хэш приглашения")
+            return None
+        except telethon.errors.ChannelPrivateError:
+            error_container.error("Этот канал/группа является приватным. Сначала вступите в группу.")
+            return None
+    except telethon.errors.FloodWaitError:
+        # Ожидание обрабатывает вызывающий код (планировщик или run_analysis)
+        raise
+    except Exception as e:
+        error_container.error(f"Ошибка при получении информации о группе: {str(e)}")
+        return None
+
+async def prefetch_group_entities(client, group_links, entity_cache, metrics=None):
+    """Пакетное заполнение кэша каналов перед анализом многих каналов
+
+    Устаревшие записи обновляются по ID одним GetChannelsRequest на
+    CHANNELS_BATCH_SIZE каналов, а при DIALOG_SCAN_MIN_MISSES и более промахах
+    имена ищутся среди диалогов аккаунта (сотня диалогов за запрос).
+    Оставшиеся имена разрешаются по одному в get_group_entity. Возвращает
+    число каналов, найденных без разрешения имени.
+    """
+    metrics = metrics or FetchMetrics()
+    account_id = await get_account_id(client)
+    names = {parse_group_name(group_link).lower() for group_link in group_links if group_link}
+    found, stale, missing = entity_cache.lookup(account_id, names)
+    
+    stale_channels = {name: entity for name, entity in stale.items() if isinstance(entity, types.Channel)}
+    missing.update(name for name in stale if name not in stale_channels)
+    by_id = {}
+    for name, entity in stale_channels.items():
+        by_id.setdefault(entity.id, []).append(name)
+    unique_channels = {entity.id: entity for entity in stale_channels.values()}
+    input_channels = [types.InputChannel(entity.id, entity.access_hash) for entity in unique_channels.values()]
+    refreshed = 0
+    for i in range(0, len(input_channels), CHANNELS_BATCH_SIZE):
+        with metrics.stage('entity'):
+            result = await client(GetChannelsRequest(input_channels[i:i + CHANNELS_BATCH_SIZE]))
+        for chat in result.chats:
+            if isinstance(chat, types.Channel) and not chat.min and chat.id in by_id:
+                for name in by_id.pop(chat.id):
+                    entity_cache.put(account_id, name, chat)
+                    refreshed += 1
+    # Недоступные по старому access_hash каналы разрешаются заново
+    missing.update(name for names in by_id.values() for name in names)
+    
+    if len(missing) >= DIALOG_SCAN_MIN_MISSES:
+        async for dialog in client.iter_dialogs():
+            entity = dialog.entity
+            username = (getattr(entity, 'username', None) or '').lower()
+            if username in missing:
+                entity_cache.put(account_id, username, entity)
+                missing.discard(username)
+                refreshed += 1
+                if not missing:
+                    break
+    return len(found) + refreshed
+
+async def get_channel_full_info(client, group_entity, metrics=None, entity_cache=None):
+    """Полная информация о канале: members_count, description, linked_chat_id
+
+    С entity_cache запрос GetFullChannelRequest выполняется, только если
+    снимок информации устарел.
+    """
+    metrics = metrics or FetchMetrics()
+    if entity_cache is not None:
+        info = entity_cache.get_info(group_entity.id)
+        if info is not None:
+            return info
+    with metrics.stage('full_channel'):
+        full_entity = await client(GetFullChannelRequest(channel=group_entity))
+    full_chat = full_entity.full_chat
+    info = {
+        'members_count': getattr(full_chat, 'participants_count', None),
+        'description': getattr(full_chat, 'about', None),
+        'linked_chat_id': getattr(full_chat, 'linked_chat_id', None),
+    }
+    if entity_cache is not None:
+        entity_cache.put_info(group_entity.id, info)
+    return info
+
+async def get_group_info(client, group_entity, error_container, metrics=None, entity_cache=None):
+    """Получение подробной информации о группе или канале"""
+    metrics = metrics or FetchMetrics()
+    try:
+        if hasattr(group_entity, 'megagroup') or hasattr(group_entity, 'gigagroup') or hasattr(group_entity, 'broadcast'):
+            # Это канал или супергруппа
+            full_info = await get_channel_full_info(client, group_entity, metrics, entity_cache)
+            
+            # Базовая информация
+            info = {
+                'title': group_entity.title,
+                'username': group_entity.username if hasattr(group_entity, 'username') else "Отсутствует",
+                'type': 'Канал' if getattr(group_entity, 'broadcast', False) else 'Супергруппа',
+                'id': group_entity.id,
+                'members_count': full_info['members_count'] if full_info['members_count'] is not None else "Неизвестно",
+                'description': full_info['description'] if full_info['description'] is not None else "Отсутствует",
+                'linked_chat_id': full_info['linked_chat_id'],
+                'creation_date': group_entity.date.strftime('%d.%m.%Y %H:%M:%S') if hasattr(group_entity, 'date') else "Неизвестно",
+                'verified': getattr(group_entity, 'verified', False),
+                'restricted': getattr(group_entity, 'restricted', False),
+                'scam': getattr(group_entity, 'scam', False),
+                'fake': getattr(group_entity, 'fake', False),
+            }
+        else:
+            # Это обычная группа
+            info = {
+                'title': group_entity.title if hasattr(group_entity, 'title') else "Неизвестно",
+                'username': group_entity.username if hasattr(group_entity, 'username') else "Отсутствует",
+                'type': 'Группа',
+                'id': group_entity.id,
+                'members_count': "Неизвестно", # Для обычных групп требуется отдельный запрос
+                'description': "Отсутствует", # Для обычных групп требуется отдельный запрос
+                'creation_date': group_entity.date.strftime('%d.%m.%Y %H:%M:%S') if hasattr(group_entity, 'date') else "Неизвестно",
+                'verified': getattr(group_entity, 'verified', False),
+                'restricted': getattr(group_entity, 'restricted', False),
+                'scam': getattr(group_entity, 'scam', False),
+                'fake': getattr(group_entity, 'fake', False),
+            }
+        
+        return info
+    except telethon.errors.ChannelPrivateError:
+        error_container.error("Этот канал/группа является приватным. Сначала вступите в группу.")
+        return None
+    except telethon.errors.FloodWaitError:
+        raise
+    except Exception as e:
+        error_container.error(f"Ошибка при получении информации о группе: {str(e)}")
+        return None
+
+async def get_last_message_id(client, group_entity):
+    """ID последнего сообщения канала (0, если сообщений нет)"""
+    messages = await client.get_messages(group_entity, limit=1)
+    return messages[0].id if messages else 0
+
+async def resolve_message_id_bounds(client, group_entity, start_date, end_date):
+    """Определение границ ID сообщений (min_id, max_id) для временного окна
+
+    Границы исключающие: в окно попадают сообщения с min_id < id < max_id.
+    Возвращает None, если в окне нет сообщений.
+    """
+    # Последнее сообщение до начала окна задает нижнюю границу
+    before_start = await client.get_messages(group_entity, limit=1, offset_date=start_date)
+    min_id = before_start[0].id if before_start else 0
+    
+    # Последнее сообщение до конца окна задает верхнюю границу
+    before_end = await client.get_messages(group_entity, limit=1, offset_date=end_date)
+    if not before_end or before_end[0].id <= min_id:
+        return None
+    max_id = before_end[0].id + 1
+    
+    return min_id, max_id
+
+def id_span_progress(message_id, min_id, max_id):
+    """Доля пройденного окна по положению ID сообщения между границами"""
+    if max_id - min_id <= 1:
+        return 1.0
+    return min(1.0, max(0.0, (message_id - min_id) / (max_id - min_id - 1)))
+
+def iter_window_messages(client, group_entity, min_id, max_id):
+    """Итератор сообщений окна от старых к новым в пределах границ ID"""
+    return client.iter_messages(
+        group_entity,
+        min_id=min_id,
+        max_id=max_id,
+        reverse=True,
+        limit=None
+    )
+
+def reaction_key(reaction):
+    """Ключ реакции: эмодзи, custom:<id> для своих эмодзи, paid для платных"""
+    emoticon = getattr(reaction, 'emoticon', None)
+    if emoticon:
+        return emoticon
+    document_id = getattr(reaction, 'document_id', None)
+    if document_id is not None:
+        return f"custom:{document_id}"
+    return 'paid'
+
+def reactions_breakdown(message):
+    """Число реакций каждого типа: {ключ реакции: количество}"""
+    if not getattr(message, 'reactions', None):
+        return {}
+    breakdown = {}
+    for result in message.reactions.results:
+        key = reaction_key(result.reaction)
+        breakdown[key] = breakdown.get(key, 0) + result.count
+    return breakdown
+
+def extract_message_record(message):
+    """Извлечение из сообщения полей, необходимых для статистики"""
+    breakdown = reactions_breakdown(message)
+    return {
+        'id': message.id,
+        'date': message.date,
+        'views': getattr(message, 'views', None) or 0,
+        'reactions': sum(breakdown.values()),
+        'replies': message.replies.replies if getattr(message, 'replies', None) else 0,
+        'sender_id': message.sender_id,
+        'text': message.message or '',
+        'reactions_detail': breakdown,
+        'media': extract_media_record(message),
+        'reposts': extract_repost_sources(message),
+    }
+
+def format_sender_name(sender, sender_id):
+    """Отображаемое имя отправителя"""
+    if sender is None:
+        return f"User {sender_id}"
+    # У каналов и групп вместо имени заголовок
+    sender_name = getattr(sender, 'first_name', None) or getattr(sender, 'title', None) or f"User {sender_id}"
+    if getattr(sender, 'last_name', None):
+        sender_name += f" {sender.last_name}"
+    if getattr(sender, 'username', None):
+        sender_name += f" (@{sender.username})"
+    return sender_name
+
+def collect_page_sender_name(message, sender_names):
+    """Запоминание имени отправителя, пришедшего вместе со страницей сообщений"""
+    sender = getattr(message, 'sender', None)
+    if message.sender_id and sender is not None and message.sender_id not in sender_names:
+        sender_names[message.sender_id] = format_sender_name(sender, message.sender_id)
+
+async def resolve_sender_names(client, sender_ids, sender_cache=None, known_names=None, metrics=None):
+    """Пакетное получение имен отправителей
+
+    Имена берутся из known_names (пришли со страницами сообщений), затем из кэша;
+    в сеть уходят только промахи, пачками по SENDER_BATCH_SIZE.
+    """
+    metrics = metrics or FetchMetrics()
+    with metrics.stage('senders'):
+        return await _resolve_sender_names(client, sender_ids, sender_cache, known_names, metrics)
+
+async def _resolve_sender_names(client, sender_ids, sender_cache, known_names, metrics):
+    names = {}
+    known_names = known_names or {}
+    fresh_names = {}
+    missing = set()
+    for sender_id in sender_ids:
+        if sender_id in known_names:
+            fresh_names[sender_id] = known_names[sender_id]
+        else:
+            missing.add(sender_id)
+    names.update(fresh_names)
+    
+    if sender_cache is not None and missing:
+        cached, missing = sender_cache.get_many(missing)
+        names.update(cached)
+    
+    missing = list(missing)
+    for i in range(0, len(missing), SENDER_BATCH_SIZE):
+        batch = missing[i:i + SENDER_BATCH_SIZE]
+        try:
+            entities = await client.get_entity(batch)
+        except (ValueError, TypeError):
+            # Часть ID неизвестна сессии: запрашиваем по одному, пропуская ошибки
+            entities = []
+            for sender_id in batch:
+                try:
+                    entities.append(await client.get_entity(sender_id))
+                except Exception:
+                    pass
+        for entity in entities:
+            fresh_names[entity.id] = format_sender_name(entity, entity.id)
+        for sender_id in batch:
+            names[sender_id] = fresh_names.get(sender_id, f"User {sender_id}")
+    
+    if sender_cache is not None:
+        sender_cache.put_many(fresh_names)
+    
+    return names
+
+async def sync_channel_messages(client, store, group_entity, start_date, refresh_hours=REFRESH_WINDOW_HOURS, sender_cache=None, progress_bar=None, metrics=None):
+    """Инкрементальная загрузка сообщений канала в локальное хранилище
+
+    Загружаются только сообщения новее сохраненного high-water mark, а также
+    сообщения за последние refresh_hours часов, у которых меняются просмотры,
+    реакции и ответы. Возвращает количество загруженных сообщений.
+    """
+    metrics = metrics or FetchMetrics()
+    channel_id = group_entity.id
+    now = datetime.now(timezone.utc)
+    state = store.get_sync_state(channel_id)
+    store.set_channel_info(channel_id, getattr(group_entity, 'title', None), getattr(group_entity, 'username', None))
+    
+    bounds = await resolve_message_id_bounds(client, group_entity, start_date, now)
+    if bounds is None:
+        if state is None or state['covered_from'] > start_date:
+            store.set_sync_state(channel_id, state['high_water_id'] if state else 0, start_date)
+        return 0
+    min_id, max_id = bounds
+    
+    if state is not None and state['covered_from'] <= start_date:
+        # История окна уже сохранена: догружаем новые сообщения и окно актуализации
+        covered_from = state['covered_from']
+        refresh_id = store.get_last_id_before(channel_id, now - timedelta(hours=refresh_hours))
+        # Если все сохраненные сообщения моложе окна актуализации, обновляется все окно
+        resume_id = min(state['high_water_id'], refresh_id if refresh_id is not None else min_id)
+        min_id = max(min_id, resume_id)
+    else:
+        covered_from = start_date
+    metrics.expect(min_id, max_id)
+    
+    fetched = 0
+    batch = []
+    sender_names = {}
+    with metrics.stage('fetch'):
+        async for message in iter_window_messages(client, group_entity, min_id, max_id):
+            batch.append(extract_message_record(message))
+            collect_page_sender_name(message, sender_names)
+            
+            if len(batch) >= STORE_BATCH_SIZE:
+                store.upsert_messages(channel_id, batch)
+                fetched += len(batch)
+                batch = []
+                if progress_bar:
+                    progress_bar.progress(id_span_progress(message.id, min_id, max_id), f"Синхронизировано {fetched} сообщений")
+        
+        if batch:
+            store.upsert_messages(channel_id, batch)
+            fetched += len(batch)
+    metrics.add_messages(fetched)
+    if sender_cache is not None:
+        sender_cache.put_many(sender_names)
+    store.set_sync_state(channel_id, max(max_id - 1, state['high_water_id'] if state else 0), covered_from)
+    
+    return fetched
+
+def apply_sender_names(stats, names):
+    """Подстановка имен отправителей в статистику пользователей"""
+    for sender_id, name in names.items():
+        key = str(sender_id)
+        # Топы по сообщениям и по реакциям могут не совпадать
+        for users in (stats['top_users'], stats['top_users_by_reactions']):
+            if key in users:
+                users[key]['name'] = name
+
+def stats_sender_ids(stats):
+    """ID отправителей из топов статистики (только их имена показываются)"""
+    return [int(sender_id) for sender_id in stats['top_users'].keys() | stats['top_users_by_reactions'].keys()]
+
+async def get_messages_stats(client, group_entity, days_count, error_container, progress_bar=None, store=None, sender_cache=None, on_record=None, tz=DEFAULT_TIMEZONE, on_message=None, metrics=None, author_sketch=None):
+    """Сбор статистики сообщений
+
+    Если передано локальное хранилище, из Telegram загружаются только новые
+    и недавно изменившиеся сообщения, а статистика считается по хранилищу.
+    Имена отправителей разрешаются после обхода сообщений через sender_cache.
+    on_record, если передан, вызывается для каждой записи сообщения окна
+    (выгрузка сырых сообщений, отбор постов для загрузки комментариев).
+    on_message получает сами сообщения Telegram (выгрузка с именами
+    отправителей и пересылок, загрузка медиафайлов); в этом случае окно
+    загружается из Telegram целиком, без хранилища, так как из записей
+    хранилища объекты сообщений не восстанавливаются.
+    Сообщения накапливаются в колоночном виде и агрегируются один раз;
+    границы дней считаются в часовом поясе tz. Время этапов, число запросов
+    и сообщений записываются в metrics (FetchMetrics), если он передан.
+    С author_sketch (пустой AuthorSketch) топ и число авторов считаются
+    приближенно с ограниченной памятью — для групп с очень большим числом авторов.
+    """
+    metrics = metrics or FetchMetrics()
+    try:
+        # Определение временного диапазона (даты сообщений Telegram в UTC)
+        end_date = datetime.now(timezone.utc)
+        start_date = end_date - timedelta(days=days_count)
+        
+        # Со скетчем отправители учитываются порциями во время обхода, а не накапливаются
+        columns = MessageColumns(author_sketch)
+        
+        if store is not None and on_message is None:
+            if progress_bar:
+                progress_bar.progress(0.6, "Синхронизация с локальным хранилищем...")
+            await sync_channel_messages(client, store, group_entity, start_date, sender_cache=sender_cache, progress_bar=progress_bar, metrics=metrics)
+            
+            with metrics.stage('aggregation'):
+                for record in store.load_messages(group_entity.id, start_date, end_date, with_text=on_record is not None):
+                    columns.append(record)
+                    if on_record is not None:
+                        on_record(record)
+                stats = build_messages_stats(columns, start_date, end_date, tz)
+            
+            names = await resolve_sender_names(client, stats_sender_ids(stats), sender_cache, metrics=metrics)
+            apply_sender_names(stats, names)
+            
+            if progress_bar:
+                progress_bar.progress(1.0, "Сбор статистики завершен!")
+            return stats
+        
+        # Границы окна по ID определяются один раз, дальше загружаются
+        # только страницы внутри окна, а не вся история канала
+        bounds = await resolve_message_id_bounds(client, group_entity, start_date, end_date)
+        if bounds is None:
+            if progress_bar:
+                progress_bar.progress(1.0, "Сообщений за период не найдено")
+            with metrics.stage('aggregation'):
+                return build_messages_stats(columns, start_date, end_date, tz)
+        min_id, max_id = bounds
+        # Оценка объема окна по разнице ID; прогресс считается по положению
+        # ID текущего сообщения, поэтому удаленные сообщения его не искажают
+        metrics.expect(min_id, max_id)
+        expected = metrics.expected_messages
+        
+        # Получение сообщений
+        messages_iter = iter_window_messages(client, group_entity, min_id, max_id)
+        
+        # Обработка сообщений
+        messages_processed = 0
+        page_sender_names = {}
+        with metrics.stage('fetch'):
+            async for message in messages_iter:
+                # Прекращаем, как только вышли за пределы диапазона
+                if message.date > end_date:
+                    break
+                
+                # Обновление индикатора прогресса
+                messages_processed += 1
+                if messages_processed % 100 == 0 and progress_bar:
+                    progress_bar.progress(
+                        min(0.99, id_span_progress(message.id, min_id, max_id)),
+                        f"Обработано {messages_processed} из ~{expected} сообщений"
+                    )
+                
+                record = extract_message_record(message)
+                columns.append(record)
+                collect_page_sender_name(message, page_sender_names)
+                if on_record is not None:
+                    on_record(record)
+                if on_message is not None:
+                    on_message(message)
+        metrics.add_messages(messages_processed)
+        
+        with metrics.stage('aggregation'):
+            stats = build_messages_stats(columns, start_date, end_date, tz)
+        
+        # Имена отправителей разрешаются одним проходом вне цикла загрузки
+        names = await resolve_sender_names(client, stats_sender_ids(stats), sender_cache, page_sender_names, metrics)
+        apply_sender_names(stats, names)
+        
+        if progress_bar:
+            progress_bar.progress(1.0, "Сбор статистики завершен!")
+        
+        return stats
+    except telethon.errors.FloodWaitError:
+        raise
+    except Exception as e:
+        error_container.error(f"Ошибка при сборе статистики сообщений: {str(e)}")
+        return None
+
+async def analyze_channel(client, group_link, days_count, store=None, sender_cache=None, tz=DEFAULT_TIMEZONE, on_record=None, reporter=None, on_message=None, result_cache=None, metrics=None, entity_cache=None, sketch_errors=None):
+    """Полный анализ одного канала для пакетного режима
+
+    Ошибки собираются отдельно для каждого канала и поднимаются исключением,
+    FloodWaitError передается планировщику без изменений. Прогресс, если
+    передан reporter, выводится через него. С result_cache повторный анализ
+    канала без новых сообщений стоит одного запроса последнего сообщения;
+    при потоковых обработчиках (on_record, on_message) кэш не используется.
+    Замеры запуска возвращаются в result['metrics']. С entity_cache канал
+    и информация о нем берутся из кэша без запросов к Telegram. С sketch_errors
+    (ошибка топа, ошибка числа авторов) авторы считаются приближенно (AuthorSketch).
+    """
+    metrics = metrics or FetchMetrics()
+    # Запросы к API всех этапов учитываются в metrics
+    with metrics.track():
+        errors = ErrorCollector()
+        group_entity = await get_group_entity(client, group_link, errors, metrics, entity_cache)
+        if group_entity is None:
+            raise RuntimeError(errors.text() or "Не удалось получить доступ к группе")
+        
+        result_key = None
+        if result_cache is not None and on_record is None and on_message is None:
+            last_message_id = await get_last_message_id(client, group_entity)
+            result_key = make_result_key(group_entity.id, days_count, tz, last_message_id, sketch_errors)
+            cached = result_cache.get(result_key)
+            if cached is not None:
+                metrics.finish()
+                return dict(cached, metrics=metrics.to_dict())
+        
+        group_info = await get_group_info(client, group_entity, errors, metrics, entity_cache)
+        if group_info is None:
+            raise RuntimeError(errors.text() or "Не удалось получить информацию о группе")
+        
+        author_sketch = AuthorSketch(*sketch_errors) if sketch_errors else None
+        stats = await get_messages_stats(client, group_entity, days_count, errors, reporter, store, sender_cache, on_record, tz, on_message, metrics, author_sketch)
+        if stats is None:
+            raise RuntimeError(errors.text() or "Не удалось получить статистику сообщений")
+        
+        metrics.finish()
+        result = {'info': group_info, 'stats': stats, 'metrics': metrics.to_dict()}
+        if result_key is not None:
+            result_cache.put(result_key, result)
+        return result
+
+async def analyze_channels(client, group_links, days_count, concurrency=DEFAULT_CONCURRENCY, store=None, sender_cache=None, on_done=None, tz=DEFAULT_TIMEZONE, on_message=None, result_cache=None, pool=None, entity_cache=None, sketch_errors=None):
+    """Одновременный анализ нескольких каналов
+
+    Без пула каналы обрабатываются на одном клиенте не более concurrency
+    одновременно. С пулом аккаунтов (SessionPool) каналы распределяются
+    между аккаунтами, а при FloodWait переносятся на свободный аккаунт.
+    on_message, если передан, вызывается как on_message(group_link, message, client)
+    с клиентом аккаунта, получившего сообщение.
+    Замеры каждого канала, включая ожидание FloodWait, — в result['metrics'].
+    С entity_cache каналы, которых нет в кэше, сначала ищутся пакетно
+    (prefetch_group_entities) на основном клиенте. С sketch_errors скетчи
+    авторов каналов (stats['author_sketch']) можно слить (merge_author_sketches).
+    """
+    if entity_cache is not None:
+        await prefetch_group_entities(client, group_links, entity_cache)
+    channel_metrics = {group_link: FetchMetrics() for group_link in group_links}
+    
+    def on_flood_wait(group_link, seconds):
+        channel_metrics[group_link].flood_wait(seconds)
+    
+    async def analyze(channel_client, group_link):
+        def channel_on_message(message):
+            on_message(group_link, message, channel_client)
+        
+        return await analyze_channel(
+            channel_client, group_link, days_count, store, sender_cache, tz,
+            on_message=None if on_message is None else channel_on_message,
+            result_cache=result_cache,
+            metrics=channel_metrics[group_link],
+            entity_cache=entity_cache,
+            sketch_errors=sketch_errors
+        )
+    
+    if pool is not None:
+        return await run_pooled(group_links, analyze, pool, on_done=on_done, on_flood_wait=on_flood_wait)
+    
+    async def worker(group_link):
+        return await analyze(client, group_link)
+    
+    return await run_bounded(group_links, worker, concurrency=concurrency, on_done=on_done, on_flood_wait=on_flood_wait)
+
+def build_comparison_frame(results):
+    """Сводная таблица по успешно обработанным каналам"""
+    rows = []
+    for group_link, result, error in results:
+        if error is not None:
+            continue
+        info, stats = result['info'], result['stats']
+        total_messages = stats['total_messages']
+        rows.append({
+            'Канал': info['title'],
+            'Ссылка': group_link,
+            'Тип': info['type'],
+            'Участники': info['members_count'] if isinstance(info['members_count'], int) else None,
+            'Сообщения': total_messages,
+            'Просмотры': stats['total_views'],
+            'Реакции': stats['total_reactions'],
+            'Ответы': stats['total_replies'],
+            'Авторы': stats.get('total_authors'),
+            'Просмотров на сообщение': round(stats['total_views'] / total_messages, 1) if total_messages else 0,
+            'Реакций на сообщение': round(stats['total_reactions'] / total_messages, 2) if total_messages else 0,
+        })
+    return pd.DataFrame(rows)
+
+def build_daily_comparison_frame(results, metric='messages_per_day'):
+    """Значения метрики по дням: строки — даты, столбцы — каналы"""
+    columns = {}
+    for group_link, result, error in results:
+        if error is not None:
+            continue
+        series = result['stats'][metric]
+        columns[result['info']['title']] = pd.Series(series['values'], index=pd.to_datetime(series['dates']))
+    return pd.DataFrame(columns)
+
+def build_daily_stats_frame(results):
+    """Статистика по дням в длинном формате: строка на канал и день"""
+    frames = []
+    for group_link, result, error in results:
+        if error is not None:
+            continue
+        stats = result['stats']
+        frames.append(pd.DataFrame({
+            'channel': result['info']['title'],
+            'channel_id': result['info']['id'],
+            'link': group_link,
+            'date': stats['messages_per_day']['dates'],
+            'messages': stats['messages_per_day']['values'],
+            'views': stats['views_per_day']['values'],
+            'reactions': stats['reactions_per_day']['values'],
+            'replies': stats['replies_per_day']['values'],
+        }))
+    if not frames:
+        return pd.DataFrame(columns=['channel', 'channel_id', 'link', 'date', 'messages', 'views', 'reactions', 'replies'])
+    return pd.concat(frames, ignore_index=True)
@@ -1,56 +1,92 @@
 import asyncio
+import os
+import shutil
+import tempfile
+import time
 import telethon
-from telethon import TelegramClient
-from telethon.tl.functions.channels import GetFullChannelRequest
+from telethon.sessions import StringSession
 import pandas as pd
 import streamlit as st
-import matplotlib.pyplot as plt
-import re
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
-# Настройка русской локали для matplotlib
-import matplotlib as mpl
-mpl.rcParams['font.family'] = 'DejaVu Sans'
+from message_store import MessageStore, DEFAULT_STORE_PATH, DEFAULT_SEARCH_LIMIT
+from sender_cache import SenderCache
+from entity_cache import EntityCache
+from scheduler import DEFAULT_CONCURRENCY
+from comments import scrape_comments, build_posts_comments_frame
+from aggregation import DEFAULT_TIMEZONE, PERIODS
+from export import extract_export_record, open_export_writer
+from result_cache import ResultCache, make_result_key
+from client_service import ClientService, phone_account, string_session_account
+from session_pool import SessionPool
+from live import LiveAggregates, LiveMonitor, LIVE_REFRESH_SECONDS
+from backfill import backfill_channels
+from metrics import FetchMetrics, STAGES, metrics_frame_rows
+from text_search import make_snippet
+from charts import CHART_MAX_BARS, CHART_PERIOD_LABELS, build_counts_figure, build_stats_figures, downsample_frame
+from text_analytics import TextColumns, analyze_texts
+from reposts import format_lag
+from rollups import ROLLUP_METRICS, build_channels_comparison_frame, build_period_comparison_frame, change_percent, compare_periods, previous_period, rollup_frame
+from sketches import DEFAULT_DISTINCT_ERROR, DEFAULT_TOP_ERROR, AuthorSketch, merge_author_sketches
+from media import DEFAULT_MEDIA_DIR, DEFAULT_MEDIA_MAX_SIZE, DOWNLOADABLE_KINDS, MEDIA_KIND_LABELS, MediaDownloader
+from analyzer import (
+    REFRESH_WINDOW_HOURS,
+    QueueReporter,
+    parse_group_links,
+    get_group_entity,
+    get_group_info,
+    get_last_message_id,
+    resolve_sender_names,
+    get_messages_stats,
+    analyze_channels,
+    build_comparison_frame,
+    build_daily_comparison_frame,
+)
 
-async def create_client(api_id, api_hash, phone, error_container):
-    """Создание клиента Telegram API с обработкой ошибок"""
+# Варианты выгрузки сообщений в интерфейсе
+EXPORT_CHOICES = {'Нет': None, 'JSONL': 'jsonl', 'CSV': 'csv', 'Parquet': 'parquet', 'XLSX': 'xlsx'}
+EXPORT_MIME_TYPES = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'parquet': 'application/octet-stream',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+async def create_client_by_phone(service, api_id, api_hash, phone, error_container, auth_code=None, password=None):
+    """Авторизованный клиент аккаунта по номеру телефона с обработкой ошибок
+
+    Клиент берется из ClientService и живет между запусками, поэтому
+    код подтверждения, запрошенный в одном запуске, вводится в следующем.
+    """
     if not api_id or not api_hash or not phone:
         error_container.error("Пожалуйста, заполните все поля API настроек")
         return None
     
     try:
-        # Создание клиента
-        client = TelegramClient('session_name', int(api_id), api_hash)
-        await client.connect()
+        # Клиент аккаунта (создается при первом обращении)
+        account, session = phone_account(phone)
+        client = await service.get_session_client(account, session, api_id, api_hash)
         
         # Проверка авторизации
         if not await client.is_user_authorized():
             try:
-                # Отправка кода подтверждения
-                sent_code = await client.send_code_request(phone)
-                
-                # Запрос кода у пользователя
-                code = st.text_input("Введите код подтверждения, отправленный в Telegram")
+                if not auth_code:
+                    # Отправка кода подтверждения
+                    await client.send_code_request(phone)
+                    error_container.info("Введите код подтверждения, отправленный в Telegram, и запустите анализ снова")
+                    return None
                 
-                if code:
-                    try:
-                        # Попытка входа с введенным кодом
-                        await client.sign_in(phone, code)
-                        st.success("Успешная авторизация!")
-                    except telethon.errors.SessionPasswordNeededError:
-                        # Если требуется пароль двухфакторной аутентификации
-                        password = st.text_input("Введите пароль двухфакторной аутентификации", type="password")
-                        if password:
-                            await client.sign_in(password=password)
-                            st.success("Успешная авторизация с 2FA!")
-                        else:
-                            error_container.warning("Требуется пароль двухфакторной аутентификации")
-                            return None
-                    except Exception as e:
-                        error_container.error(f"Ошибка при вводе кода: {str(e)}")
+                try:
+                    # Попытка входа с введенным кодом
+                    await client.sign_in(phone, auth_code)
+                except telethon.errors.SessionPasswordNeededError:
+                    # Если требуется пароль двухфакторной аутентификации
+                    if not password:
+                        error_container.warning("Требуется пароль двухфакторной аутентификации")
                         return None
-                else:
-                    error_container.info("Введите код подтверждения, отправленный в Telegram")
+                    await client.sign_in(password=password)
+                except Exception as e:
+                    error_container.error(f"Ошибка при вводе кода: {str(e)}")
                     return None
             except telethon.errors.FloodWaitError as e:
                 error_container.error(f"Слишком много попыток входа. Подождите {e.seconds} секунд")
@@ -79,90 +115,37 @@ async def create_client(api_id, api_hash, phone, error_container):
         error_container.error(f"Ошибка при создании клиента: {str(e)}")
         return None
 
-async def get_group_entity(client, group_link, error_container):
-    """Получение entity группы по ссылке"""
-    try:
-        if not group_link:
-            error_container.error("Укажите ссылку на группу или канал")
-            return None
-        
-        # Извлечение имени группы из ссылки
-        group_name = None
-        if 't.me/' in group_link:
-            group_name = group_link.split('t.me/')[1].split('/')[0].split('?')[0]
-        elif group_link.startswith('@'):
-            group_name = group_link[1:]
-        else:
-            group_name = group_link
-        
-        # Удаление + из имени группы (если есть)
-        group_name = group_name.replace('+', '')
-        
-        try:
-            # Получение entity группы
-            entity = await client.get_entity(group_name)
-            return entity
-        except telethon.errors.UsernameNotOccupiedError:
-            error_container.error(f"Группа или канал с именем {group_name} не существует")
-            return None
-        except telethon.errors.UsernameInvalidError:
-            error_container.error(f"Недопустимое имя пользователя: {group_name}")
-            return None
-        except telethon.errors.InviteHashInvalidError:
-            error_container.error("Недействительный хэш приглашения")
-            return None
-        except telethon.errors.ChannelPrivateError:
-            error_container.error("Этот канал/группа является приватным. Сначала вступите в группу.")
-            return None
-    except Exception as e:
-        error_container.error(f"Ошибка при получении информации о группе: {str(e)}")
+async def create_client_by_session(service, api_id, api_hash, session_string, error_container):
+    """Авторизованный клиент по строке сессии"""
+    if not api_id or not api_hash or not session_string or not session_string.strip():
+        error_container.error("Пожалуйста, заполните API ID, API Hash и строку сессии")
         return None
-
-async def get_group_info(client, group_entity, error_container):
-    """Получение подробной информации о группе или канале"""
+    
+    account = string_session_account(session_string)
     try:
-        if hasattr(group_entity, 'megagroup') or hasattr(group_entity, 'gigagroup') or hasattr(group_entity, 'broadcast'):
-            # Это канал или супергруппа
-            full_entity = await client(GetFullChannelRequest(channel=group_entity))
-            
-            # Базовая информация
-            info = {
-                'title': group_entity.title,
-                'username': group_entity.username if hasattr(group_entity, 'username') else "Отсутствует",
-                'type': 'Канал' if getattr(group_entity, 'broadcast', False) else 'Супергруппа',
-                'id': group_entity.id,
-                'members_count': full_entity.full_chat.participants_count if hasattr(full_entity.full_chat, 'participants_count') else "Неизвестно",
-                'description': full_entity.full_chat.about if hasattr(full_entity.full_chat, 'about') else "Отсутствует",
-                'creation_date': group_entity.date.strftime('%d.%m.%Y %H:%M:%S') if hasattr(group_entity, 'date') else "Неизвестно",
-                'verified': getattr(group_entity, 'verified', False),
-                'restricted': getattr(group_entity, 'restricted', False),
-                'scam': getattr(group_entity, 'scam', False),
-                'fake': getattr(group_entity, 'fake', False),
-            }
-        else:
-            # Это обычная группа
-            info = {
-                'title': group_entity.title if hasattr(group_entity, 'title') else "Неизвестно",
-                'username': group_entity.username if hasattr(group_entity, 'username') else "Отсутствует",
-                'type': 'Группа',
-                'id': group_entity.id,
-                'members_count': "Неизвестно", # Для обычных групп требуется отдельный запрос
-                'description': "Отсутствует", # Для обычных групп требуется отдельный запрос
-                'creation_date': group_entity.date.strftime('%d.%m.%Y %H:%M:%S') if hasattr(group_entity, 'date') else "Неизвестно",
-                'verified': getattr(group_entity, 'verified', False),
-                'restricted': getattr(group_entity, 'restricted', False),
-                'scam': getattr(group_entity, 'scam', False),
-                'fake': getattr(group_entity, 'fake', False),
-            }
-        
-        return info
-    except telethon.errors.ChannelPrivateError:
-        error_container.error("Этот канал/группа является приватным. Сначала вступите в группу.")
+        client = await service.get_session_client(account, StringSession(session_string.strip()), api_id, api_hash)
+        if not await client.is_user_authorized():
+            await service.drop_client(account)
+            error_container.error("Строка сессии недействительна или сессия завершена")
+            return None
+        return client
+    except ValueError:
+        error_container.error("API ID должен быть числом или строка сессии повреждена")
         return None
     except Exception as e:
-        error_container.error(f"Ошибка при получении информации о группе: {str(e)}")
+        await service.drop_client(account)
+        error_container.error(f"Ошибка при создании клиента: {str(e)}")
         return None
 
+async def create_session_pool(service, api_id, api_hash, client, account, session_strings, error_container):
+    """Пул из основного и дополнительных аккаунтов; None, если дополнительных нет"""
+    clients = {account: client}
+    for session_string in session_strings:
+        extra_client = await create_client_by_session(service, api_id, api_hash, session_string, error_container)
+        if extra_client is not None:
+            clients[string_session_account(session_string)] = extra_client
+    return SessionPool(clients) if len(clients) > 1 else None
+
 def render_group_info(group_info):
     """Отображение информации о группе"""
     st.subheader(f"Информация о группе: {group_info['title']}")
@@ -198,153 +181,65 @@ def render_group_info(group_info):
         st.markdown("**Описание:**")
         st.markdown(f"> {group_info['description']}")
 
-async def get_messages_stats(client, group_entity, days_count, error_container, progress_bar=None):
-    """Сбор статистики сообщений"""
-    try:
-        # Определение временного диапазона
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days_count)
-        
-        # Инициализация статистики
-        stats = {
-            'total_messages': 0,
-            'total_views': 0,
-            'total_reactions': 0,
-            'total_replies': 0,
-            'messages_per_day': {'dates': [], 'values': []},
-            'views_per_day': {'dates': [], 'values': []},
-            'reactions_per_day': {'dates': [], 'values': []},
-            'replies_per_day': {'dates': [], 'values': []},
-            'top_users': {},
-            'top_users_by_reactions': {}
-        }
-        
-        # Инициализация данных по дням
-        current_date = start_date
-        while current_date <= end_date:
-            date_str = current_date.strftime('%Y-%m-%d')
-            stats['messages_per_day']['dates'].append(date_str)
-            stats['messages_per_day']['values'].append(0)
-            stats['views_per_day']['dates'].append(date_str)
-            stats['views_per_day']['values'].append(0)
-            stats['reactions_per_day']['dates'].append(date_str)
-            stats['reactions_per_day']['values'].append(0)
-            stats['replies_per_day']['dates'].append(date_str)
-            stats['replies_per_day']['values'].append(0)
-            current_date += timedelta(days=1)
-        
-        # Получение сообщений
-        messages_iter = client.iter_messages(
-            group_entity,
-            offset_date=end_date,
-            reverse=True,
-            limit=None
+def render_comparison(results, total_authors=None):
+    """Сравнительная панель по нескольким каналам
+
+    total_authors — оценка числа разных авторов во всех каналах (по слитым скетчам).
+    """
+    failures = [(group_link, error) for group_link, result, error in results if error is not None]
+    frame = build_comparison_frame(results)
+    
+    st.subheader("Сравнение каналов")
+    columns = st.columns(4 if total_authors is not None else 3)
+    with columns[0]:
+        st.metric("Обработано каналов", len(frame))
+    with columns[1]:
+        st.metric("Ошибок", len(failures))
+    with columns[2]:
+        st.metric("Всего сообщений", int(frame['Сообщения'].sum()) if not frame.empty else 0)
+    if total_authors is not None:
+        with columns[3]:
+            st.metric("Авторов во всех каналах", f"~{total_authors}")
+    
+    if not frame.empty:
+        frame = frame.sort_values('Сообщения', ascending=False, ignore_index=True)
+        st.dataframe(frame, use_container_width=True)
+        st.download_button(
+            "Скачать таблицу (CSV)",
+            frame.to_csv(index=False).encode('utf-8'),
+            file_name="channels_comparison.csv",
+            mime="text/csv"
         )
         
-        # Обработка сообщений
-        messages_processed = 0
-        async for message in messages_iter:
-            # Прекращаем, если вышли за пределы диапазона
-            if message.date < start_date:
-                continue
-            if message.date > end_date:
-                break
-            
-            # Обновление индикатора прогресса
-            messages_processed += 1
-            if messages_processed % 100 == 0 and progress_bar:
-                progress_percent = min(0.99, messages_processed / 1000)  # Предполагаемый максимум - 1000 сообщений
-                progress_bar.progress(progress_percent, f"Обработано {messages_processed} сообщений")
-            
-            # Общая статистика
-            stats['total_messages'] += 1
-            
-            # Просмотры (только для каналов)
-            if hasattr(message, 'views') and message.views:
-                stats['total_views'] += message.views
-            
-            # Реакции
-            reactions_count = 0
-            if hasattr(message, 'reactions') and message.reactions:
-                for reaction in message.reactions.results:
-                    reactions_count += reaction.count
-                stats['total_reactions'] += reactions_count
-            
-            # Ответы
-            if hasattr(message, 'replies') and message.replies:
-                stats['total_replies'] += message.replies.replies
-            
-            # Статистика по дням
-            msg_date = message.date.strftime('%Y-%m-%d')
-            day_index = stats['messages_per_day']['dates'].index(msg_date) if msg_date in stats['messages_per_day']['dates'] else -1
-            
-            if day_index >= 0:
-                stats['messages_per_day']['values'][day_index] += 1
-                
-                if hasattr(message, 'views') and message.views:
-                    stats['views_per_day']['values'][day_index] += message.views
-                
-                if reactions_count > 0:
-                    stats['reactions_per_day']['values'][day_index] += reactions_count
-                
-                if hasattr(message, 'replies') and message.replies:
-                    stats['replies_per_day']['values'][day_index] += message.replies.replies
-            
-            # Статистика по пользователям
-            if message.sender_id:
-                sender_id = str(message.sender_id)
-                
-                # Добавляем пользователя, если его нет в статистике
-                if sender_id not in stats['top_users']:
-                    try:
-                        sender = await message.get_sender()
-                        sender_name = sender.first_name
-                        if hasattr(sender, 'last_name') and sender.last_name:
-                            sender_name += f" {sender.last_name}"
-                        if hasattr(sender, 'username') and sender.username:
-                            sender_name += f" (@{sender.username})"
-                    except:
-                        sender_name = f"User {sender_id}"
-                    
-                    stats['top_users'][sender_id] = {
-                        'name': sender_name,
-                        'count': 0
-                    }
-                    
-                    stats['top_users_by_reactions'][sender_id] = {
-                        'name': sender_name,
-                        'reactions': 0
-                    }
-                
-                # Увеличиваем счетчики
-                stats['top_users'][sender_id]['count'] += 1
-                
-                if reactions_count > 0:
-                    stats['top_users_by_reactions'][sender_id]['reactions'] += reactions_count
-        
-        # Сортировка пользователей
-        stats['top_users'] = {k: v for k, v in sorted(
-            stats['top_users'].items(), 
-            key=lambda item: item[1]['count'], 
-            reverse=True
-        )}
-        
-        stats['top_users_by_reactions'] = {k: v for k, v in sorted(
-            stats['top_users_by_reactions'].items(), 
-            key=lambda item: item[1]['reactions'], 
-            reverse=True
-        )}
+        st.subheader("Сообщения по каналам")
+        st.bar_chart(frame.set_index('Канал')['Сообщения'])
         
-        if progress_bar:
-            progress_bar.progress(1.0, "Сбор статистики завершен!")
+        messages_frame, period = downsample_frame(build_daily_comparison_frame(results, 'messages_per_day'))
+        st.subheader(f"Активность {CHART_PERIOD_LABELS[period]}")
+        st.line_chart(messages_frame)
         
-        return stats
-    except Exception as e:
-        error_container.error(f"Ошибка при сборе статистики сообщений: {str(e)}")
-        return None
+        if frame['Просмотры'].sum() > 0:
+            views_frame, period = downsample_frame(build_daily_comparison_frame(results, 'views_per_day'))
+            st.subheader(f"Просмотры {CHART_PERIOD_LABELS[period]}")
+            st.line_chart(views_frame)
+    
+    if failures:
+        st.subheader("Ошибки")
+        for group_link, error in failures:
+            if isinstance(error, telethon.errors.FloodWaitError):
+                st.error(f"{group_link}: превышен лимит запросов, требуется ожидание {error.seconds} с")
+            else:
+                st.error(f"{group_link}: {error}")
+
+def render_message_stats(stats, figures=None):
+    """Отображение статистики сообщений
 
-def render_message_stats(stats):
-    """Отображение статистики сообщений"""
+    figures — результат build_stats_figures; если не передан, графики
+    строятся заново.
+    """
+    if figures is None:
+        figures = build_stats_figures(stats)
+    
     st.subheader("Общая статистика")
     
     col1, col2, col3, col4 = st.columns(4)
@@ -361,107 +256,390 @@ def render_message_stats(stats):
     with col4:
         st.metric("Всего ответов", stats['total_replies'])
     
-    # График сообщений по дням
-    st.subheader("Активность по дням")
+    # Активность: одна фигура с панелями по метрикам, длинные периоды укрупняются
+    st.subheader(f"Активность {CHART_PERIOD_LABELS[figures['period']]}")
+    if figures['period'] != stats.get('period', 'day'):
+        st.caption(f"Ряд укрупнен до периода «{CHART_PERIOD_LABELS[figures['period']]}», чтобы уместить не более {CHART_MAX_BARS} столбцов")
+    st.plotly_chart(figures['activity'], use_container_width=True)
     
-    fig, ax = plt.subplots(figsize=(10, 5))
+    # Сообщения с медиа по типам
+    if stats.get('media'):
+        st.subheader("Медиа")
+        st.dataframe(
+            pd.DataFrame({
+                'Тип': [MEDIA_KIND_LABELS[kind] for kind in stats['media']],
+                'Сообщений': list(stats['media'].values()),
+            }),
+            hide_index=True
+        )
     
-    # Форматируем даты для лучшего отображения
-    dates = [datetime.strptime(date, '%Y-%m-%d').strftime('%d.%m') for date in stats['messages_per_day']['dates']]
+    # Топ пользователей
+    if figures['top_users'] is not None:
+        st.subheader("Топ пользователей")
+        st.plotly_chart(figures['top_users'], use_container_width=True)
+        sketch = stats.get('author_sketch')
+        if sketch is not None:
+            st.caption(
+                f"Авторов: ~{stats['total_authors']} (ошибка до {sketch.distinct.relative_error:.1%}). "
+                f"Топ приближенный: число сообщений автора завышено не больше чем на {sketch.by_messages.error_bound}"
+            )
+        elif 'total_authors' in stats:
+            st.caption(f"Авторов: {stats['total_authors']}")
+
+def render_period_comparison(comparison, days_count):
+    """Показатели окна по сравнению с предыдущим окном той же длины"""
+    st.subheader(f"По сравнению с предыдущими {days_count} днями")
+    current, previous = comparison['current'], comparison['previous']
+    for column, (metric, label) in zip(st.columns(len(ROLLUP_METRICS)), ROLLUP_METRICS.items()):
+        percent = change_percent(current[metric], previous[metric])
+        with column:
+            st.metric(label, current[metric], delta=f"{percent:+.1f}%" if percent is not None else None)
+    st.caption("По агрегатам локального хранилища")
+
+def render_comments(comments_frame, failures):
+    """Отображение таблицы постов и комментариев"""
+    st.subheader("Комментарии")
     
-    x = range(len(dates))
-    plt.bar(x, stats['messages_per_day']['values'], color='blue', alpha=0.7, label='Сообщения')
-    plt.xticks(x, dates, rotation=45)
-    plt.xlabel('Дата')
-    plt.ylabel('Количество сообщений')
-    plt.title('Активность сообщений по дням')
-    plt.tight_layout()
+    comments_only = comments_frame[comments_frame['kind'] == 'comment']
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Постов с комментариями", int((comments_frame['kind'] == 'post').sum()))
+    with col2:
+        st.metric("Комментариев", len(comments_only))
+    with col3:
+        st.metric("Комментаторов", comments_only['sender_id'].nunique())
     
-    st.pyplot(fig)
+    st.dataframe(comments_frame, use_container_width=True)
+    st.download_button(
+        "Скачать посты и комментарии (CSV)",
+        comments_frame.to_csv(index=False).encode('utf-8'),
+        file_name="posts_comments.csv",
+        mime="text/csv"
+    )
     
-    # График просмотров по дням
-    if sum(stats['views_per_day']['values']) > 0:
-        st.subheader("Просмотры по дням")
-        
-        fig, ax = plt.subplots(figsize=(10, 5))
-        
-        plt.bar(x, stats['views_per_day']['values'], color='green', alpha=0.7, label='Просмотры')
-        plt.xticks(x, dates, rotation=45)
-        plt.xlabel('Дата')
-        plt.ylabel('Количество просмотров')
-        plt.title('Просмотры сообщений по дням')
-        plt.tight_layout()
-        
-        st.pyplot(fig)
+    if failures:
+        st.warning(f"Не удалось загрузить ветки комментариев: {len(failures)} (посты {', '.join(str(post_id) for post_id, error in failures[:10])})")
+
+def render_text_analytics(text):
+    """Ключевые слова, биграммы, хэштеги, упоминания, ссылки и реакции"""
+    st.subheader("Анализ текста")
+    st.caption(f"Сообщений: {text['messages']}; формы одного слова объединены")
     
-    # График реакций по дням
-    if sum(stats['reactions_per_day']['values']) > 0:
-        st.subheader("Реакции по дням")
-        
-        fig, ax = plt.subplots(figsize=(10, 5))
-        
-        plt.bar(x, stats['reactions_per_day']['values'], color='purple', alpha=0.7, label='Реакции')
-        plt.xticks(x, dates, rotation=45)
-        plt.xlabel('Дата')
-        plt.ylabel('Количество реакций')
-        plt.title('Реакции на сообщения по дням')
-        plt.tight_layout()
-        
-        st.pyplot(fig)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.write("Ключевые слова")
+        figure = build_counts_figure(text['keywords'], 'word')
+        if figure is not None:
+            st.plotly_chart(figure, use_container_width=True)
+    with col2:
+        st.write("Биграммы")
+        figure = build_counts_figure(text['bigrams'], 'bigram', '#2ca02c')
+        if figure is not None:
+            st.plotly_chart(figure, use_container_width=True)
     
-    # График ответов по дням
-    if sum(stats['replies_per_day']['values']) > 0:
-        st.subheader("Ответы по дням")
-        
-        fig, ax = plt.subplots(figsize=(10, 5))
-        
-        plt.bar(x, stats['replies_per_day']['values'], color='orange', alpha=0.7, label='Ответы')
-        plt.xticks(x, dates, rotation=45)
-        plt.xlabel('Дата')
-        plt.ylabel('Количество ответов')
-        plt.title('Ответы на сообщения по дням')
-        plt.tight_layout()
-        
-        st.pyplot(fig)
+    col1, col2, col3 = st.columns(3)
+    for column, key, label in ((col1, 'hashtag', "Хэштеги"), (col2, 'mention', "Упоминания"), (col3, 'domain', "Ссылки (домены)")):
+        with column:
+            st.write(label)
+            st.dataframe(text[f'{key}s'], use_container_width=True, hide_index=True)
     
-    # Топ пользователей
-    if stats['top_users']:
-        st.subheader("Топ 10 активных пользователей")
-        
-        top_10_users = list(stats['top_users'].items())[:10]
-        
-        user_names = [user[1]['name'] for user in top_10_users]
-        user_counts = [user[1]['count'] for user in top_10_users]
-        
-        fig, ax = plt.subplots(figsize=(10, 6))
+    if not text['reactions'].empty:
+        st.write("Реакции")
+        figure = build_counts_figure(text['reactions'].head(20), 'reaction', '#9467bd')
+        st.plotly_chart(figure, use_container_width=True)
+    
+    with st.expander("По дням"):
+        st.write("Ключевые слова")
+        st.dataframe(text['keywords_per_day'], use_container_width=True, hide_index=True)
+        st.write("Биграммы")
+        st.dataframe(text['bigrams_per_day'], use_container_width=True, hide_index=True)
+        st.write("Реакции")
+        st.dataframe(text['reactions_per_day'], use_container_width=True, hide_index=True)
+
+def render_media_downloads(downloads):
+    """Итоги загрузки медиафайлов"""
+    st.subheader("Медиафайлы")
+    stats = downloads['stats']
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Загружено", stats['downloaded'])
+    with col2:
+        st.metric("Из кэша", stats['cached'])
+    with col3:
+        st.metric("Пропущено по размеру", stats['skipped'])
+    with col4:
+        st.metric("Ошибок", stats['failed'])
+    st.caption(f"Файлы сохранены в каталог {os.path.abspath(downloads['directory'])}; загружено {stats['bytes'] / 1024 / 1024:.1f} МБ, повторов одного файла: {stats['duplicates']}")
+    if downloads['errors']:
+        st.warning(f"Не удалось загрузить файлов: {len(downloads['errors'])} ({downloads['errors'][0][1]})")
+
+def render_reposts(reposts):
+    """Источники репостов канала и каналы, которые его репостят"""
+    if not reposts['sources'] and not reposts['targets']:
+        return
+    st.subheader("Репосты")
+    
+    def edges_frame(edges, key):
+        return pd.DataFrame({
+            'Канал': [edge[key] for edge in edges],
+            'Репостов': [edge['count'] for edge in edges],
+            'Пересылок': [edge['forwards'] for edge in edges],
+            'Ссылок': [edge['links'] for edge in edges],
+            'Средняя задержка': [format_lag(edge['avg_lag']) for edge in edges],
+            'Последний': [edge['last_date'].strftime('%Y-%m-%d') for edge in edges],
+        })
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.write("Откуда канал берет посты")
+        st.dataframe(edges_frame(reposts['sources'], 'source'), use_container_width=True, hide_index=True)
+    with col2:
+        st.write("Кто репостит канал")
+        st.dataframe(edges_frame(reposts['targets'], 'target'), use_container_width=True, hide_index=True)
+    st.caption("По всем сообщениям локального хранилища, включая прошлые запуски")
+
+def render_export(export):
+    """Кнопка скачивания выгруженных сообщений"""
+    st.subheader("Выгрузка сообщений")
+    st.write(f"Выгружено сообщений: {export['count']}")
+    if not os.path.exists(export['path']):
+        st.warning("Файл выгрузки больше не доступен, запустите анализ повторно")
+        return
+    with open(export['path'], 'rb') as export_file:
+        st.download_button(
+            f"Скачать сообщения ({export['format'].upper()})",
+            export_file,
+            file_name=os.path.basename(export['path']),
+            mime=EXPORT_MIME_TYPES[export['format']]
+        )
+
+def remove_export(analysis):
+    """Удаление временного каталога выгрузки результата, который больше не показывается"""
+    if analysis and 'export' in analysis:
+        shutil.rmtree(os.path.dirname(analysis['export']['path']), ignore_errors=True)
+
+def render_metrics(analysis, render_seconds):
+    """Замеры запуска: время этапов, скорость загрузки, запросы и FloodWait"""
+    if analysis['kind'] == 'multi':
+        rows = [
+            dict(channel=group_link, **{key: value for key, value in result['metrics'].items() if key != 'stages'})
+            for group_link, result, error in analysis['results']
+            if error is None and 'metrics' in result
+        ]
+        if not rows:
+            return
+        with st.expander("Производительность"):
+            st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+            st.caption(f"Отрисовка: {render_seconds:.2f} с")
+        return
+    
+    metrics = analysis.get('metrics')
+    if not metrics:
+        return
+    with st.expander("Производительность"):
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Время анализа", f"{metrics['elapsed_seconds']:.1f} с")
+        with col2:
+            st.metric("Сообщений/с", f"{metrics['messages_per_second']:.0f}")
+        with col3:
+            st.metric("Запросов к API", metrics['api_calls'])
+        with col4:
+            st.metric("Ожидание FloodWait", f"{metrics['flood_wait_seconds']} с")
+        if metrics['expected_messages'] is not None:
+            st.caption(f"Загружено сообщений: {metrics['messages']} (оценка по ID: ~{metrics['expected_messages']})")
+        stages = pd.DataFrame(metrics_frame_rows(metrics) + [
+            {'stage': STAGES['render'], 'seconds': round(render_seconds, 3), 'count': 1}
+        ])
+        st.dataframe(stages, use_container_width=True, hide_index=True)
+
+def render_analysis(analysis):
+    """Отображение сохраненного результата анализа"""
+    render_started = time.perf_counter()
+    if analysis['kind'] == 'multi':
+        render_comparison(analysis['results'], analysis.get('total_authors'))
+    else:
+        if 'group_info' in analysis:
+            render_group_info(analysis['group_info'])
+        if 'stats' in analysis:
+            st.subheader("Анализ сообщений")
+            st.write(f"Статистика за последние {analysis['days_count']} дней")
+            # Графики строятся при первой отрисовке и хранятся вместе с результатом
+            if 'figures' not in analysis:
+                analysis['figures'] = build_stats_figures(analysis['stats'])
+            render_message_stats(analysis['stats'], analysis['figures'])
+        if 'period_comparison' in analysis:
+            render_period_comparison(analysis['period_comparison'], analysis['days_count'])
+        if 'reposts' in analysis:
+            render_reposts(analysis['reposts'])
+        if 'text_analytics' in analysis:
+            render_text_analytics(analysis['text_analytics'])
+        if 'comments_frame' in analysis:
+            render_comments(analysis['comments_frame'], analysis['comment_failures'])
+        if 'error' in analysis:
+            st.error(analysis['error'])
+    
+    if 'export' in analysis:
+        render_export(analysis['export'])
+    
+    if 'media_downloads' in analysis:
+        render_media_downloads(analysis['media_downloads'])
+    
+    if 'pool_stats' in analysis:
+        with st.expander("Нагрузка по аккаунтам"):
+            st.dataframe(pd.DataFrame(analysis['pool_stats']), use_container_width=True)
+    
+    render_metrics(analysis, time.perf_counter() - render_started)
+
+def render_live_dashboard(monitor):
+    """Панель live-режима по текущему состоянию агрегатов"""
+    snapshot = monitor.aggregates.snapshot()
+    titles = {channel_id: entity.title for channel_id, entity in monitor.channels.items()}
+    
+    st.subheader(f"🔴 Live: {', '.join(titles.values())}")
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        st.metric("Сообщений за окно", snapshot['total_messages'])
+    with col2:
+        st.metric("Просмотров", f"{snapshot['total_views']:,}".replace(',', ' '))
+    with col3:
+        st.metric("Реакций", snapshot['total_reactions'])
+    with col4:
+        st.metric("Новых комментариев", snapshot['comments'])
+    with col5:
+        st.metric("Поступило за минуту", snapshot['messages_last_minute'])
+    
+    st.bar_chart(pd.Series(snapshot['messages_per_day']['values'], index=snapshot['messages_per_day']['dates'], name='Сообщения'))
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**Топ пользователей**")
+        st.dataframe(
+            pd.DataFrame(list(snapshot['top_users'].values()), columns=['name', 'count']),
+            use_container_width=True,
+            hide_index=True
+        )
+    with col2:
+        st.markdown("**Последние сообщения**")
+        recent = pd.DataFrame(snapshot['recent'], columns=['date', 'kind', 'channel_id', 'sender', 'text'])
+        recent['channel_id'] = recent['channel_id'].map(titles)
+        st.dataframe(recent, use_container_width=True, hide_index=True)
+
+async def stop_live_monitor(monitor):
+    """Отписка от событий в цикле клиента"""
+    monitor.stop()
+
+def get_result_cache():
+    """Кэш результатов анализа текущей сессии"""
+    if 'result_cache' not in st.session_state:
+        st.session_state.result_cache = ResultCache()
+    return st.session_state.result_cache
+
+@st.cache_resource
+def get_client_service():
+    """Сервис клиентов Telegram, общий для всех сессий приложения"""
+    return ClientService()
+
+def render_rollups(tz):
+    """Показатели сохраненных сообщений за любой период и их сравнение по агрегатам хранилища"""
+    with MessageStore(DEFAULT_STORE_PATH) as store:
+        channels = store.list_channels()
+        if not channels:
+            st.caption("В хранилище пока нет сообщений: запустите анализ с локальным хранилищем")
+            return
         
-        plt.barh(range(len(user_names)), user_counts, color='blue', alpha=0.7)
-        plt.yticks(range(len(user_names)), user_names)
-        plt.xlabel('Количество сообщений')
-        plt.title('Топ 10 активных пользователей')
-        plt.tight_layout()
+        col1, col2, col3, col4 = st.columns([3, 2, 1, 2])
+        with col1:
+            channel_ids = st.multiselect("Каналы", list(channels), format_func=channels.get, key='rollup_channels')
+        with col2:
+            today = datetime.now(timezone.utc).date()
+            period = st.date_input("Период", value=(today - timedelta(days=6), today), key='rollup_period')
+        with col3:
+            grain = st.selectbox("Шаг", list(PERIODS), index=1, format_func=CHART_PERIOD_LABELS.get, key='rollup_grain')
+        with col4:
+            compare = st.radio("Сравнение", ["С предыдущим периодом", "Каналов между собой"], key='rollup_compare')
+        if not channel_ids or len(period) != 2:
+            return
         
-        st.pyplot(fig)
+        start_date = datetime.combine(period[0], datetime.min.time(), tzinfo=timezone.utc)
+        end_date = datetime.combine(period[1], datetime.max.time(), tzinfo=timezone.utc)
+        started = time.perf_counter()
+        frame = rollup_frame(store, channel_ids, start_date, end_date, grain, tz)
+        if compare == "Каналов между собой":
+            comparison = build_channels_comparison_frame(store, channel_ids, start_date, end_date, channels)
+        else:
+            comparison = build_period_comparison_frame(compare_periods(store, channel_ids, start_date, end_date))
+        elapsed = time.perf_counter() - started
     
-    # Топ пользователей по реакциям
-    if stats['top_users_by_reactions'] and sum(user['reactions'] for user in stats['top_users_by_reactions'].values()) > 0:
-        st.subheader("Топ 10 пользователей по реакциям")
+    previous_start, previous_end = previous_period(start_date, end_date)
+    st.caption(
+        f"Предыдущий период: {previous_start:%Y-%m-%d} — {previous_end:%Y-%m-%d}; "
+        f"посчитано по агрегатам за {elapsed * 1000:.0f} мс"
+    )
+    st.dataframe(comparison, use_container_width=True, hide_index=True)
+    frame.index = frame.index.strftime(PERIODS[grain][1])
+    st.line_chart(frame.rename(columns=ROLLUP_METRICS)[[ROLLUP_METRICS['messages'], ROLLUP_METRICS['authors']]])
+
+def render_search():
+    """Полнотекстовый поиск по постам и комментариям из локального хранилища"""
+    with MessageStore(DEFAULT_STORE_PATH) as store:
+        channels = store.list_channels()
+        if not channels:
+            st.caption("В хранилище пока нет сохраненных текстов: запустите анализ с локальным хранилищем")
+            return
         
-        top_10_users_reactions = list(stats['top_users_by_reactions'].items())[:10]
+        query = st.text_input(
+            "Запрос",
+            placeholder='выборы "новые каналы" полит* -спорт',
+            help="Слова ищутся с учетом словоформ; \"фраза\" — слова подряд, "
+                 "слово* — по началу слова, -слово — исключить"
+        )
+        col1, col2, col3 = st.columns([2, 2, 1])
+        with col1:
+            channel_ids = st.multiselect("Каналы", list(channels), format_func=channels.get, placeholder="Все каналы")
+        with col2:
+            period = st.date_input("Период", value=(), help="Пусто — за все время")
+        with col3:
+            kinds = st.multiselect("Тип", ['post', 'comment'], format_func={'post': "Посты", 'comment': "Комментарии"}.get)
+        if not query:
+            return
         
-        user_names = [user[1]['name'] for user in top_10_users_reactions]
-        user_reactions = [user[1]['reactions'] for user in top_10_users_reactions]
+        start_date = end_date = None
+        if len(period) >= 1:
+            start_date = datetime.combine(period[0], datetime.min.time(), tzinfo=timezone.utc)
+        if len(period) == 2:
+            end_date = datetime.combine(period[1], datetime.max.time(), tzinfo=timezone.utc)
         
-        if sum(user_reactions) > 0:  # Проверяем, есть ли вообще реакции
-            fig, ax = plt.subplots(figsize=(10, 6))
-            
-            plt.barh(range(len(user_names)), user_reactions, color='purple', alpha=0.7)
-            plt.yticks(range(len(user_names)), user_names)
-            plt.xlabel('Количество реакций')
-            plt.title('Топ 10 пользователей по полученным реакциям')
-            plt.tight_layout()
-            
-            st.pyplot(fig)
+        started = time.perf_counter()
+        results = store.search(query, channel_ids, start_date, end_date, kinds)
+        elapsed = time.perf_counter() - started
+    
+    st.caption(f"Найдено: {len(results)}{'+' if len(results) >= DEFAULT_SEARCH_LIMIT else ''} за {elapsed * 1000:.0f} мс")
+    if results:
+        st.dataframe(
+            pd.DataFrame([
+                {
+                    'Дата': result['date'],
+                    'Канал': result['channel'] or result['channel_id'],
+                    'Тип': "Комментарий" if result['kind'] == 'comment' else "Пост",
+                    'Пост': result['post_id'],
+                    'Текст': make_snippet(result['text'], query),
+                }
+                for result in results
+            ]),
+            use_container_width=True,
+            hide_index=True
+        )
+
+@st.cache_resource
+def get_entity_cache():
+    """Кэш каналов и сведений о них, общий для всех сессий приложения"""
+    return EntityCache()
+
+@st.cache_resource
+def get_sender_cache():
+    """Кэш имен отправителей, общий для всех сессий приложения"""
+    return SenderCache()
 
 def main():
     st.set_page_config(
@@ -486,9 +664,11 @@ def main():
         
         error_container = st.empty()
         
+        # API ID и API Hash нужны для обоих способов авторизации
+        api_id = st.text_input("API ID", placeholder="12345", type="password")
+        api_hash = st.text_input("API Hash", placeholder="0123456789abcdef0123456789abcdef", type="password")
+        
         if auth_tab == "По номеру телефона":
-            api_id = st.text_input("API ID", placeholder="12345", type="password")
-            api_hash = st.text_input("API Hash", placeholder="0123456789abcdef0123456789abcdef", type="password")
             phone = st.text_input("Номер телефона", placeholder="+79123456789")
             
             st.markdown("""
@@ -511,75 +691,429 @@ def main():
                                      key="auth_code_input")
             
             session_state.auth_code = auth_code
+            
+            password = st.text_input("Пароль 2FA (если включен)", type="password")
         
         else:  # По строке сессии
-            session_string = st.text_area("Строка сессии", placeholder="Вставьте строку сессии...", height=100, type="password")
+            session_string = st.text_area("Строка сессии", placeholder="Вставьте строку сессии...", height=100)
+        
+        group_links_text = st.text_area(
+            "Ссылки на группы или каналы",
+            placeholder="https://t.me/example или @example\nпо одной ссылке на строку",
+            height=100
+        )
+        links_file = st.file_uploader("Или загрузите файл со ссылками", type=['txt', 'csv'])
+        group_links = parse_group_links(group_links_text)
+        if links_file is not None:
+            group_links = parse_group_links(group_links_text + "\n" + links_file.getvalue().decode('utf-8', errors='ignore'))
+        if len(group_links) > 1:
+            st.caption(f"Каналов к анализу: {len(group_links)}")
+        with st.expander("Дополнительные аккаунты"):
+            extra_sessions_text = st.text_area(
+                "Строки сессий",
+                placeholder="По одной строке сессии на строку",
+                height=100,
+                help="Каналы и ветки комментариев распределяются между всеми аккаунтами; "
+                     "при FloodWait задача переносится на свободный аккаунт"
+            )
+        extra_sessions = [line.strip() for line in extra_sessions_text.splitlines() if line.strip()]
+        
+        concurrency = st.slider(
+            "Каналов одновременно",
+            min_value=1,
+            max_value=20,
+            value=DEFAULT_CONCURRENCY,
+            help="Число каналов, обрабатываемых параллельно. При FloodWait все запросы приостанавливаются."
+        )
+        long_range = st.checkbox(
+            "Длинный период (дозагрузка истории)",
+            value=False,
+            help="История загружается в локальное хранилище диапазонами с контрольными точками; "
+                 "прерванная загрузка продолжается при следующем запуске с того же места"
+        )
+        if long_range:
+            days_count = st.number_input("Период анализа (дней)", min_value=1, max_value=3650, value=365)
+        else:
+            days_count = st.slider("Период анализа (дней)", min_value=1, max_value=30, value=7)
+        timezone_name = st.selectbox(
+            "Часовой пояс",
+            [DEFAULT_TIMEZONE, 'Europe/Moscow', 'Europe/Kaliningrad', 'Asia/Yekaterinburg', 'Asia/Novosibirsk', 'Asia/Vladivostok'],
+            help="Часовой пояс, в котором считаются границы дней"
+        )
+        use_store = st.checkbox(
+            "Локальное хранилище сообщений",
+            value=True,
+            help="Загружать из Telegram только новые сообщения и обновлять счетчики "
+                 f"за последние {REFRESH_WINDOW_HOURS} ч. Для длинного периода включено всегда."
+        ) or long_range
         
-        group_link = st.text_input("Ссылка на группу или канал", placeholder="https://t.me/example или @example")
-        days_count = st.slider("Период анализа (дней)", min_value=1, max_value=30, value=7)
+        export_label = st.selectbox(
+            "Выгрузка сообщений",
+            list(EXPORT_CHOICES),
+            help="Сообщения записываются в файл по мере загрузки; при выгрузке "
+                 "окно загружается из Telegram целиком, без локального хранилища"
+        )
+        export_format = EXPORT_CHOICES[export_label]
+        
+        with_comments = st.checkbox(
+            "Загружать комментарии",
+            value=False,
+            help="Загрузка веток обсуждения постов с ответами (только для одного канала)"
+        )
+        
+        download_media = st.checkbox(
+            "Загружать медиафайлы",
+            value=False,
+            help="Файлы загружаются в фоне, не задерживая обход сообщений, в каталог "
+                 f"{DEFAULT_MEDIA_DIR}; одинаковые файлы сохраняются один раз. "
+                 "При загрузке окно загружается из Telegram целиком, без локального хранилища"
+        )
+        if download_media:
+            media_kinds = st.multiselect(
+                "Типы файлов",
+                DOWNLOADABLE_KINDS,
+                default=['photo', 'video'],
+                format_func=MEDIA_KIND_LABELS.get
+            )
+            media_max_size = st.number_input(
+                "Наибольший размер файла (МБ)",
+                min_value=1,
+                max_value=2000,
+                value=DEFAULT_MEDIA_MAX_SIZE // (1024 * 1024)
+            ) * 1024 * 1024
+        
+        with_text = st.checkbox(
+            "Анализ текста",
+            value=False,
+            help="Ключевые слова и биграммы по дням, хэштеги, упоминания, ссылки и распределение реакций (только для одного канала)"
+        )
+        
+        approx_authors = st.checkbox(
+            "Приближенный подсчет авторов",
+            value=False,
+            help="Для групп с сотнями тысяч авторов: топ и число авторов считаются скетчами "
+                 "(Space-Saving, HyperLogLog) с ограниченной памятью вместо словаря на каждого автора"
+        )
+        sketch_errors = None
+        if approx_authors:
+            top_error = st.number_input(
+                "Ошибка топа (% сообщений)",
+                min_value=0.01,
+                max_value=10.0,
+                value=DEFAULT_TOP_ERROR * 100,
+                help="Наибольшее завышение числа сообщений автора в долях от всех сообщений"
+            )
+            distinct_error = st.number_input(
+                "Ошибка числа авторов (%)",
+                min_value=0.2,
+                max_value=20.0,
+                value=DEFAULT_DISTINCT_ERROR * 100
+            )
+            sketch_errors = (top_error / 100, distinct_error / 100)
         
         run_button = st.button("Запустить анализ", type="primary")
+        
+        st.subheader("Live-режим")
+        live_col1, live_col2 = st.columns(2)
+        with live_col1:
+            live_start_button = st.button(
+                "Следить",
+                disabled='live_monitor' in st.session_state,
+                help="Прием новых постов и комментариев указанных каналов в реальном времени"
+            )
+        with live_col2:
+            live_stop_button = st.button("Остановить", disabled='live_monitor' not in st.session_state)
+        
+        if st.button("Сбросить кэш результатов", help="Следующий анализ заново загрузит данные и сведения о каналах из Telegram"):
+            get_result_cache().invalidate()
+            get_entity_cache().invalidate()
+            remove_export(st.session_state.pop('analysis', None))
+    
+    def authorize_client(service, reporter, progress_bar=None):
+        """Создание и авторизация клиента выбранным способом: (клиент, ключ аккаунта)"""
+        if auth_tab == "По номеру телефона":
+            authorize = create_client_by_phone(service, api_id, api_hash, phone, reporter, session_state.auth_code, password)
+            account = phone_account(phone)[0] if phone else None
+        else:
+            authorize = create_client_by_session(service, api_id, api_hash, session_string, reporter)
+            account = string_session_account(session_string) if session_string else None
+        return reporter.wait(service.submit(authorize), error_container, progress_bar), account
+    
+    # Запуск и остановка live-режима
+    live_monitor = st.session_state.get('live_monitor')
+    if live_stop_button and live_monitor is not None:
+        get_client_service().run(stop_live_monitor(live_monitor))
+        st.session_state.pop('live_monitor', None)
+        live_monitor = None
+    if live_start_button and live_monitor is None:
+        service = get_client_service()
+        reporter = QueueReporter()
+        client, account = authorize_client(service, reporter)
+        if client:
+            live_monitor = LiveMonitor(
+                client,
+                LiveAggregates(days_count, timezone_name),
+                MessageStore(DEFAULT_STORE_PATH) if use_store else None,
+                get_entity_cache()
+            )
+            subscribed = reporter.wait(service.submit(live_monitor.start(group_links, reporter)), error_container)
+            if subscribed:
+                st.session_state.live_monitor = live_monitor
+            else:
+                live_monitor.stop()
+                live_monitor = None
+                error_container.error("Не удалось подписаться ни на один канал")
+    
+    # Поиск работает по локальному хранилищу, без авторизации и обращения к Telegram
+    with st.expander("🔍 Поиск по сохраненным сообщениям"):
+        render_search()
+    with st.expander("📈 Показатели сохраненных сообщений за любой период"):
+        render_rollups(timezone_name)
     
     # Основной контейнер для результатов
     result_container = st.container()
+    result_cache = get_result_cache()
     
     # Обработка запроса
     if run_button:
         with result_container:
             progress_bar = st.progress(0, "Подготовка...")
             
-            # Создание и авторизация клиента
-            if auth_tab == "По номеру телефона":
-                client = create_client_by_phone(api_id, api_hash, phone, error_container, session_state.auth_code)
-            else:
-                client = create_client_by_session(session_string, error_container)
+            # Корутины выполняются в цикле общего сервиса клиентов, а ошибки
+            # и прогресс передаются в интерфейс через очередь
+            service = get_client_service()
+            reporter = QueueReporter()
+            client, account = authorize_client(service, reporter, progress_bar)
             
             if client:
                 progress_bar.progress(0.2, "Авторизация выполнена")
                 
                 # Запуск асинхронных функций
-                async def run_analysis():
+                async def collect_single_analysis(group_link, metrics):
+                    analysis = {'kind': 'single', 'days_count': days_count}
+                    
+                    # Получение данных о группе
+                    reporter.progress(0.3, "Получение информации о группе...")
+                    group_entity = await get_group_entity(client, group_link, reporter, metrics, get_entity_cache())
+                    if not group_entity:
+                        analysis['error'] = "Не удалось получить доступ к группе"
+                        return analysis
+                    
+                    # Без выгрузки результат можно взять из кэша, если в канале нет новых сообщений
+                    result_key = None
+                    if writer is None and not download_media:
+                        last_message_id = await get_last_message_id(client, group_entity)
+                        result_key = make_result_key(group_entity.id, days_count, timezone_name, last_message_id, with_comments, with_text, sketch_errors)
+                        cached = result_cache.get(result_key)
+                        if cached is not None:
+                            reporter.progress(1.0, "Результат взят из кэша")
+                            metrics.finish()
+                            return dict(cached, metrics=metrics.to_dict())
+                    
+                    # Информация о группе
+                    group_info = await get_group_info(client, group_entity, reporter, metrics, get_entity_cache())
+                    if not group_info:
+                        analysis['error'] = "Не удалось получить информацию о группе"
+                        return analysis
+                    analysis['group_info'] = group_info
+                    reporter.progress(0.4, "Группа найдена")
+                    
+                    # Анализ сообщений
+                    reporter.progress(0.5, "Анализ сообщений...")
+                    store = MessageStore(DEFAULT_STORE_PATH) if use_store else None
+                    commented_posts = []
+                    text_columns = TextColumns() if with_text else None
+                    
+                    def collect_record(record):
+                        if with_comments and record['replies']:
+                            commented_posts.append(record)
+                        if text_columns is not None:
+                            text_columns.append(record)
+                    
                     try:
-                        await client.connect()
+                        messages_stats = await get_messages_stats(client, group_entity, days_count, reporter, reporter, store, get_sender_cache(), collect_record if with_comments or with_text else None, timezone_name, on_message=handle_message if streaming else None, metrics=metrics, author_sketch=AuthorSketch(*sketch_errors) if sketch_errors else None)
                         
-                        # Получение данных о группе
-                        progress_bar.progress(0.3, "Получение информации о группе...")
-                        group_entity = await get_group_entity(client, group_link, error_container)
+                        if messages_stats and text_columns is not None:
+                            reporter.progress(0.9, f"Анализ текста {len(text_columns)} сообщений...")
+                            # Подсчет занимает процессор, поэтому выполняется вне цикла событий
+                            analysis['text_analytics'] = await asyncio.get_running_loop().run_in_executor(
+                                None, analyze_texts, text_columns, timezone_name
+                            )
                         
-                        if group_entity:
-                            # Информация о группе
-                            group_info = await get_group_info(client, group_entity, error_container)
+                        if messages_stats and commented_posts:
+                            reporter.progress(0.0, f"Загрузка комментариев к {len(commented_posts)} постам...")
+                            threads_done = 0
                             
-                            if group_info:
-                                progress_bar.progress(0.4, "Группа найдена")
-                                render_group_info(group_info)
-                                
-                                # Анализ сообщений
-                                progress_bar.progress(0.5, "Анализ сообщений...")
-                                st.subheader("Анализ сообщений")
-                                st.write(f"Сбор статистики за последние {days_count} дней")
-                                
-                                messages_stats = await get_messages_stats(client, group_entity, days_count, error_container, progress_bar)
-                                
-                                if messages_stats:
-                                    render_message_stats(messages_stats)
-                                else:
-                                    st.error("Не удалось получить статистику сообщений")
-                            else:
-                                st.error("Не удалось получить информацию о группе")
-                        else:
-                            st.error("Не удалось получить доступ к группе")
+                            def on_thread_done(post, comments, error):
+                                nonlocal threads_done
+                                threads_done += 1
+                                reporter.progress(threads_done / len(commented_posts), f"Загружено веток: {threads_done} из {len(commented_posts)}")
+                            
+                            comments, comment_failures = await scrape_comments(client, group_entity, commented_posts, store, on_done=on_thread_done, pool=pool, group_link=group_link, entity_cache=get_entity_cache())
+                            sender_ids = {comment['sender_id'] for comment in comments if comment['sender_id']}
+                            sender_ids.update(post['sender_id'] for post in commented_posts if post['sender_id'])
+                            sender_names = await resolve_sender_names(client, sender_ids, get_sender_cache(), metrics=metrics)
+                            analysis['comments_frame'] = build_posts_comments_frame(commented_posts, comments, sender_names)
+                            analysis['comment_failures'] = comment_failures
+                        if messages_stats and store is not None:
+                            # Граф репостов обновлен при записи сообщений в хранилище
+                            analysis['reposts'] = {
+                                'sources': store.top_repost_sources(group_entity.id),
+                                'targets': store.top_repost_targets(group_entity.id),
+                            }
+                            # Сравнение с прошлым окном, если его история есть в хранилище
+                            end_date = datetime.now(timezone.utc)
+                            start_date = end_date - timedelta(days=days_count)
+                            sync_state = store.get_sync_state(group_entity.id)
+                            if not streaming and sync_state and sync_state['covered_from'] <= previous_period(start_date, end_date)[0]:
+                                analysis['period_comparison'] = compare_periods(store, [group_entity.id], start_date, end_date)
+                    finally:
+                        if store is not None:
+                            store.close()
+                    
+                    if not messages_stats:
+                        analysis['error'] = "Не удалось получить статистику сообщений"
+                        return analysis
+                    analysis['stats'] = messages_stats
+                    metrics.finish()
+                    analysis['metrics'] = metrics.to_dict()
+                    
+                    if result_key is not None:
+                        result_cache.put(result_key, analysis)
+                    return analysis
+                
+                async def run_single_analysis(group_link):
+                    metrics = FetchMetrics()
+                    # Запросы к API всех этапов учитываются в metrics
+                    with metrics.track():
+                        return await collect_single_analysis(group_link, metrics)
+                
+                async def run_multi_analysis(group_links):
+                    reporter.progress(0.3, f"Анализ {len(group_links)} каналов...")
+                    done = 0
                     
+                    def on_done(group_link, result, error):
+                        nonlocal done
+                        done += 1
+                        reporter.progress(0.3 + 0.7 * done / len(group_links), f"Обработано каналов: {done} из {len(group_links)}")
+                    
+                    store = MessageStore(DEFAULT_STORE_PATH) if use_store else None
+                    try:
+                        results = await analyze_channels(
+                            client, group_links, days_count, concurrency, store, get_sender_cache(), on_done, timezone_name,
+                            on_message=handle_channel_message if streaming else None,
+                            result_cache=result_cache,
+                            pool=pool,
+                            entity_cache=get_entity_cache(),
+                            sketch_errors=sketch_errors
+                        )
+                    finally:
+                        if store is not None:
+                            store.close()
+                    
+                    analysis = {'kind': 'multi', 'results': results}
+                    # Скетчи авторов каналов сливаются в оценку числа авторов всех каналов
+                    merged = merge_author_sketches(
+                        result['stats']['author_sketch'] for _, result, error in results
+                        if error is None and 'author_sketch' in result['stats']
+                    )
+                    if merged is not None:
+                        analysis['total_authors'] = merged.count()
+                    return analysis
+                
+                pool = None
+                downloader = None
+                
+                async def run_backfill():
+                    start_date = datetime.now(timezone.utc) - timedelta(days=days_count)
+                    with MessageStore(DEFAULT_STORE_PATH) as store:
+                        await backfill_channels(client, group_links, start_date, store, reporter=reporter, sender_cache=get_sender_cache(), entity_cache=get_entity_cache())
+                
+                async def run_analysis():
+                    nonlocal pool, downloader
+                    try:
+                        if download_media:
+                            downloader = MediaDownloader(client, DEFAULT_MEDIA_DIR, max_size=media_max_size, kinds=media_kinds)
+                            downloader.start()
+                        if extra_sessions:
+                            reporter.progress(0.25, "Подключение дополнительных аккаунтов...")
+                            pool = await create_session_pool(service, api_id, api_hash, client, account, extra_sessions, reporter)
+                        if long_range:
+                            await run_backfill()
+                        if len(group_links) > 1:
+                            analysis = await run_multi_analysis(group_links)
+                        else:
+                            analysis = await run_single_analysis(group_links[0] if group_links else "")
+                    except telethon.errors.FloodWaitError as e:
+                        return {'kind': 'error', 'error': f"Превышен лимит запросов к Telegram. Подождите {e.seconds} секунд"}
                     finally:
-                        await client.disconnect()
+                        if downloader is not None:
+                            reporter.progress(0.99, "Завершение загрузки медиафайлов...")
+                            await downloader.close()
+                    if downloader is not None:
+                        analysis = dict(analysis, media_downloads={
+                            'directory': downloader.directory,
+                            'stats': downloader.stats,
+                            'errors': downloader.errors,
+                        })
+                    if pool is not None:
+                        analysis = dict(analysis, pool_stats=pool.stats())
+                    return analysis
+                
+                # Потоковая выгрузка сообщений во временный файл
+                writer = None
+                if export_format:
+                    export_dir = tempfile.mkdtemp(prefix='tg_export_')
+                    writer = open_export_writer(os.path.join(export_dir, f"messages.{export_format}"), export_format)
+                
+                # Сообщения передаются в выгрузку и в очередь загрузки медиа по мере обхода
+                streaming = writer is not None or download_media
                 
-                # Запуск асинхронного анализа
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
+                def handle_channel_message(group_link, message, channel_client=None):
+                    if writer is not None:
+                        writer.write(extract_export_record(message, group_link))
+                    if downloader is not None:
+                        # Файл загружается аккаунтом, получившим сообщение
+                        downloader.submit(message, group_link, client=channel_client)
+                
+                def handle_message(message):
+                    handle_channel_message(group_links[0], message)
+                
+                # Запуск анализа на долгоживущем клиенте
+                analysis = None
                 try:
-                    loop.run_until_complete(run_analysis())
+                    analysis = reporter.wait(service.submit(run_analysis()), error_container, progress_bar)
+                except Exception as e:
+                    error_container.error(f"Ошибка при анализе: {str(e)}")
                 finally:
-                    loop.close()
+                    if writer is not None:
+                        writer.close()
+                        # Выгрузка прерванного анализа не показывается и удаляется сразу
+                        if analysis is None:
+                            shutil.rmtree(export_dir, ignore_errors=True)
+                
+                if analysis is not None:
+                    # Выгрузка относится к этому запуску, кэшированный результат не меняется
+                    analysis = dict(analysis)
+                    if writer is not None:
+                        analysis['export'] = {'path': writer.path, 'format': export_format, 'count': writer.count}
+                    # Выгрузка предыдущего запуска больше недоступна для скачивания
+                    remove_export(st.session_state.get('analysis'))
+                    st.session_state.analysis = analysis
+    
+    # Результаты хранятся в сессии: изменение виджетов перерисовывает их без обращения к Telegram
+    if 'analysis' in st.session_state:
+        with result_container:
+            render_analysis(st.session_state.analysis)
+    
+    # Панель live-режима обновляется из состояния в памяти до следующего
+    # действия пользователя (любой виджет прерывает цикл перерисовкой)
+    if live_monitor is not None:
+        live_placeholder = st.empty()
+        while live_monitor.running:
+            with live_placeholder.container():
+                render_live_dashboard(live_monitor)
+            time.sleep(LIVE_REFRESH_SECONDS)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,177 @@
+from datetime import datetime, timezone
+
+import telethon
+
+from scheduler import run_bounded
+from analyzer import (
+    STORE_BATCH_SIZE,
+    Reporter,
+    collect_page_sender_name,
+    extract_message_record,
+    get_group_entity,
+    prefetch_group_entities,
+    iter_window_messages,
+    resolve_message_id_bounds,
+)
+
+# Число ID сообщений в одном диапазоне дозагрузки
+BACKFILL_CHUNK_SIZE = 5000
+# Диапазонов одного канала, загружаемых одновременно
+DEFAULT_BACKFILL_CONCURRENCY = 3
+
+def plan_chunks(min_id, max_id, chunk_size=BACKFILL_CHUNK_SIZE):
+    """Разбиение исключающих границ (min_id, max_id) на непересекающиеся диапазоны
+
+    Возвращает список (low_id, high_id), в диапазон входят сообщения
+    с low_id < id <= high_id.
+    """
+    return [
+        (low_id, min(low_id + chunk_size, max_id - 1))
+        for low_id in range(min_id, max_id - 1, chunk_size)
+    ]
+
+async def backfill_chunk(client, store, group_entity, chunk, sender_names=None):
+    """Загрузка одного диапазона в хранилище с контрольной точкой на каждую пачку
+
+    Загрузка начинается с сохраненной позиции диапазона, поэтому повтор
+    после FloodWait или перезапуска не запрашивает уже сохраненные сообщения.
+    Возвращает число загруженных сообщений.
+    """
+    channel_id = group_entity.id
+    cursor_id = chunk['cursor_id']
+    fetched = 0
+    batch = []
+    async for message in iter_window_messages(client, group_entity, cursor_id, chunk['high_id'] + 1):
+        batch.append(extract_message_record(message))
+        if sender_names is not None:
+            collect_page_sender_name(message, sender_names)
+        cursor_id = message.id
+
+        if len(batch) >= STORE_BATCH_SIZE:
+            store.checkpoint_backfill_chunk(channel_id, chunk['low_id'], batch, cursor_id)
+            chunk['cursor_id'] = cursor_id
+            fetched += len(batch)
+            batch = []
+
+    store.checkpoint_backfill_chunk(channel_id, chunk['low_id'], batch, chunk['high_id'], done=True)
+    chunk['cursor_id'] = chunk['high_id']
+    chunk['done'] = True
+    return fetched + len(batch)
+
+def backfill_progress(chunks):
+    """Сводка по диапазонам задания: доля выполненных и частичные итоги"""
+    total_ids = sum(chunk['high_id'] - chunk['low_id'] for chunk in chunks)
+    done_ids = sum(chunk['cursor_id'] - chunk['low_id'] for chunk in chunks)
+    return {
+        'chunks': len(chunks),
+        'chunks_done': sum(chunk['done'] for chunk in chunks),
+        'progress': done_ids / total_ids if total_ids else 1.0,
+        'messages': sum(chunk['messages'] for chunk in chunks),
+        'views': sum(chunk['views'] for chunk in chunks),
+        'reactions': sum(chunk['reactions'] for chunk in chunks),
+        'replies': sum(chunk['replies'] for chunk in chunks),
+    }
+
+async def plan_backfill(client, store, group_entity, start_date):
+    """Создание задания дозагрузки или его расширение до start_date
+
+    Задание одно на канал: его диапазоны ID фиксируются при создании,
+    поэтому при перезапуске загрузка продолжается по тем же диапазонам.
+    Сообщения новее задания догружает обычная синхронизация хранилища.
+    """
+    channel_id = group_entity.id
+    store.set_channel_info(channel_id, getattr(group_entity, 'title', None), getattr(group_entity, 'username', None))
+    job = store.get_backfill_job(channel_id)
+    if job is None:
+        bounds = await resolve_message_id_bounds(client, group_entity, start_date, datetime.now(timezone.utc))
+        if bounds is None:
+            return None
+        min_id, max_id = bounds
+        store.save_backfill_job(channel_id, start_date, min_id, max_id, plan_chunks(min_id, max_id))
+    elif start_date < job['start_date']:
+        # Более ранняя история добавляется диапазонами ниже уже запланированных
+        bounds = await resolve_message_id_bounds(client, group_entity, start_date, job['start_date'])
+        min_id = bounds[0] if bounds is not None else job['min_id']
+        chunks = plan_chunks(min_id, job['min_id'] + 1) if min_id < job['min_id'] else []
+        store.save_backfill_job(channel_id, start_date, min(min_id, job['min_id']), job['max_id'], chunks)
+    return store.get_backfill_job(channel_id)
+
+def mark_backfill_covered(store, channel_id, job):
+    """Перенос завершенного задания в состояние синхронизации хранилища
+
+    История считается непрерывной, если уже сохраненный участок начинается
+    не позже создания задания, то есть стыкуется с его диапазонами.
+    """
+    state = store.get_sync_state(channel_id)
+    if state is None:
+        store.set_sync_state(channel_id, job['max_id'] - 1, job['start_date'])
+    elif state['covered_from'] > job['start_date'] and state['covered_from'] <= job['created_at']:
+        store.set_sync_state(channel_id, max(state['high_water_id'], job['max_id'] - 1), job['start_date'])
+
+async def backfill_channel(client, store, group_entity, start_date, concurrency=DEFAULT_BACKFILL_CONCURRENCY, reporter=None, sender_cache=None):
+    """Возобновляемая дозагрузка истории канала начиная с start_date
+
+    История делится на диапазоны ID по BACKFILL_CHUNK_SIZE, которые
+    загружаются одновременно (не более concurrency). Каждая пачка сообщений
+    сохраняется вместе с позицией диапазона, поэтому сбой, FloodWait или
+    перезапуск теряют не больше одной пачки. Возвращает сводку
+    backfill_progress и список диапазонов, загрузить которые не удалось.
+    """
+    reporter = reporter or Reporter()
+    channel_id = group_entity.id
+    job = await plan_backfill(client, store, group_entity, start_date)
+    if job is None:
+        return backfill_progress([]), []
+
+    chunks = store.get_backfill_chunks(channel_id)
+    pending = [chunk for chunk in chunks if not chunk['done']]
+    sender_names = {}
+
+    def on_done(chunk, fetched, error):
+        summary = backfill_progress(chunks)
+        reporter.progress(
+            min(0.99, summary['progress']),
+            f"Дозагрузка истории: {summary['chunks_done']} из {summary['chunks']} диапазонов"
+        )
+
+    async def worker(chunk):
+        return await backfill_chunk(client, store, group_entity, chunk, sender_names)
+
+    outcomes = await run_bounded(pending, worker, concurrency=concurrency, on_done=on_done)
+    failures = [(chunk, error) for chunk, _, error in outcomes if error is not None]
+    if sender_cache is not None:
+        sender_cache.put_many(sender_names)
+
+    chunks = store.get_backfill_chunks(channel_id)
+    if all(chunk['done'] for chunk in chunks):
+        mark_backfill_covered(store, channel_id, job)
+    return backfill_progress(chunks), failures
+
+async def backfill_channels(client, group_links, start_date, store, concurrency=DEFAULT_BACKFILL_CONCURRENCY, reporter=None, sender_cache=None, entity_cache=None):
+    """Дозагрузка истории нескольких каналов по очереди
+
+    Возвращает {ссылка: сводка} для каналов, история которых загружена
+    полностью; ошибки выводятся через reporter. С entity_cache каналы
+    разрешаются через кэш (EntityCache).
+    """
+    reporter = reporter or Reporter()
+    completed = {}
+    if entity_cache is not None:
+        await prefetch_group_entities(client, group_links, entity_cache)
+    for group_link in group_links:
+        try:
+            group_entity = await get_group_entity(client, group_link, reporter, entity_cache=entity_cache)
+            if group_entity is None:
+                continue
+            summary, failures = await backfill_channel(client, store, group_entity, start_date, concurrency, reporter, sender_cache)
+        except telethon.errors.FloodWaitError as e:
+            reporter.warning(f"{group_link}: дозагрузка прервана FloodWait на {e.seconds} с, продолжится при следующем запуске")
+            continue
+        if failures:
+            reporter.warning(
+                f"{group_link}: не загружено диапазонов: {len(failures)} ({failures[0][1]}); "
+                "они будут догружены при следующем запуске"
+            )
+        else:
+            completed[group_link] = summary
+    return completed
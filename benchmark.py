@@ -0,0 +1,367 @@
+"""Офлайн-бенчмарк сбора статистики на синтетическом канале
+
+Пример:
+    python -m benchmark --sizes 1000 100000 1000000 --latency 0.01 --json bench.json
+
+Вместо Telegram используется FakeClient с синтетическими каналами заданного
+размера, плотности реакций и ответов, числа авторов, задержки запросов
+и FloodWait каждые N запросов. Для каждого размера запускается
+analyze_channel (поиск канала, GetFullChannelRequest, загрузка страниц,
+имена отправителей, агрегирование) и отрисовка статистики из app.py,
+если установлен Streamlit. В отчете — время, пиковая память (tracemalloc)
+и число запросов к API по счетчикам клиента.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+
+import numpy as np
+import telethon
+from telethon.tl.functions.channels import GetFullChannelRequest
+
+from scheduler import run_bounded
+from message_store import MessageStore
+from metrics import FetchMetrics, TELEGRAM_PAGE_SIZE, count_api_call
+from analyzer import analyze_channel, build_daily_stats_frame
+from sketches import DEFAULT_DISTINCT_ERROR, DEFAULT_TOP_ERROR
+
+# Размеры каналов по умолчанию (сообщений)
+BENCHMARK_SIZES = (1_000, 100_000, 1_000_000)
+# Имя синтетического канала
+BENCHMARK_CHANNEL = 'benchmark'
+# Эмодзи реакций синтетических сообщений
+BENCHMARK_EMOJI = ('👍', '❤', '🔥', '😁', '👎')
+
+class FakeUser:
+    __slots__ = ('id', 'first_name', 'last_name', 'username')
+
+    def __init__(self, user_id):
+        self.id = user_id
+        self.first_name = f"Author {user_id}"
+        self.last_name = None
+        self.username = f"author{user_id}"
+
+class FakeChannel:
+    __slots__ = ('id', 'title', 'username', 'broadcast', 'megagroup', 'date', 'verified', 'restricted', 'scam', 'fake')
+
+    def __init__(self, channel_id, username, date):
+        self.id = channel_id
+        self.title = f"Synthetic {username}"
+        self.username = username
+        self.broadcast = True
+        self.megagroup = False
+        self.date = date
+        self.verified = False
+        self.restricted = False
+        self.scam = False
+        self.fake = False
+
+class FakeReaction:
+    __slots__ = ('emoticon',)
+
+    def __init__(self, emoticon):
+        self.emoticon = emoticon
+
+class FakeReactionCount:
+    __slots__ = ('reaction', 'count')
+
+    def __init__(self, emoticon, count):
+        self.reaction = FakeReaction(emoticon)
+        self.count = count
+
+class FakeReactions:
+    __slots__ = ('results',)
+
+    def __init__(self, results):
+        self.results = results
+
+class FakeReplies:
+    __slots__ = ('replies',)
+
+    def __init__(self, replies):
+        self.replies = replies
+
+class FakeMessage:
+    __slots__ = ('id', 'date', 'message', 'views', 'reactions', 'replies', 'sender_id', 'sender', 'fwd_from', 'media')
+
+    def __init__(self, message_id, date, views, reactions, replies, sender):
+        self.id = message_id
+        self.date = date
+        self.message = f"Synthetic message {message_id}"
+        self.views = views
+        self.reactions = reactions
+        self.replies = replies
+        self.sender_id = sender.id if sender is not None else None
+        self.sender = sender
+        self.fwd_from = None
+        self.media = None
+
+class SyntheticChannel:
+    """Синтетическая история канала в колоночном виде
+
+    Сообщения хранятся массивами numpy и превращаются в объекты только
+    при выдаче страницы, поэтому канал на миллион сообщений занимает
+    десятки мегабайт. Сообщения равномерно распределены по последним
+    days дням; deleted_ratio задает долю пропусков в ID.
+    """
+
+    def __init__(self, size, days=30, reaction_density=0.5, max_reactions=50, reply_density=0.2,
+                 max_replies=30, authors=1000, deleted_ratio=0.05, seed=0, channel_id=1_000_000):
+        rng = np.random.default_rng(seed)
+        now = int(datetime.now(timezone.utc).timestamp())
+        self.entity = FakeChannel(channel_id, BENCHMARK_CHANNEL, datetime.fromtimestamp(now - days * 86400 * 2, tz=timezone.utc))
+        self.ids = np.cumsum(1 + rng.binomial(1, deleted_ratio, size) if deleted_ratio else np.ones(size, dtype=np.int64))
+        self.dates = np.linspace(now - days * 86400 + 3600, now - 60, size).astype(np.int64)
+        self.views = rng.integers(100, 10_000, size)
+        self.reactions = np.where(rng.random(size) < reaction_density, rng.integers(1, max_reactions + 1, size), 0)
+        self.replies = np.where(rng.random(size) < reply_density, rng.integers(1, max_replies + 1, size), 0)
+        # У ID авторов смещение, чтобы не пересекаться с ID канала
+        self.sender_ids = rng.integers(1, authors + 1, size) + 10_000_000
+
+    def __len__(self):
+        return len(self.ids)
+
+    def message(self, index, users, with_sender=True):
+        count = int(self.reactions[index])
+        reactions = None
+        if count:
+            split = [count - count // 2, count // 2]
+            reactions = FakeReactions([
+                FakeReactionCount(BENCHMARK_EMOJI[(index + i) % len(BENCHMARK_EMOJI)], value)
+                for i, value in enumerate(split) if value
+            ])
+        replies = int(self.replies[index])
+        sender_id = int(self.sender_ids[index])
+        if sender_id not in users:
+            users[sender_id] = FakeUser(sender_id)
+        return FakeMessage(
+            int(self.ids[index]),
+            datetime.fromtimestamp(int(self.dates[index]), tz=timezone.utc),
+            int(self.views[index]),
+            reactions,
+            FakeReplies(replies) if replies else None,
+            users[sender_id] if with_sender else None,
+        )
+
+class FakeClient:
+    """Заменитель TelegramClient для бенчмарка
+
+    Реализует методы, которые вызывает анализ: get_entity, get_messages,
+    iter_messages, get_sender и вызов GetFullChannelRequest. Каждый запрос
+    считается в api_calls, ждет latency секунд и каждый flood_every-й
+    запрос получает FloodWait на flood_seconds секунд. Как и TelegramClient,
+    при FloodWait не дольше flood_sleep_threshold клиент ждет и повторяет
+    запрос, поэтому загрузка продолжается с последнего полученного
+    сообщения; более долгий FloodWait поднимается FloodWaitError.
+    """
+
+    def __init__(self, channels, latency=0.0, flood_every=0, flood_seconds=1, page_senders=True, flood_sleep_threshold=60):
+        self.channels = {channel.entity.username: channel for channel in channels}
+        self._by_id = {channel.entity.id: channel for channel in channels}
+        self.latency = latency
+        self.flood_every = flood_every
+        self.flood_seconds = flood_seconds
+        self.page_senders = page_senders
+        self.flood_sleep_threshold = flood_sleep_threshold
+        self.api_calls = Counter()
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0
+        self._users = {}
+
+    async def _request(self, name):
+        self.api_calls[name] += 1
+        # Как у клиента после instrument_client: запрос учитывается в замерах задачи
+        count_api_call()
+        if self.flood_every and sum(self.api_calls.values()) % self.flood_every == 0:
+            self.flood_waits += 1
+            if self.flood_seconds > self.flood_sleep_threshold:
+                raise telethon.errors.FloodWaitError(request=None, capture=self.flood_seconds)
+            self.flood_wait_seconds += self.flood_seconds
+            await asyncio.sleep(self.flood_seconds)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _channel(self, entity):
+        return self._by_id[entity.id]
+
+    async def get_entity(self, entity):
+        await self._request('get_entity')
+        if isinstance(entity, list):
+            return [self._users.setdefault(user_id, FakeUser(user_id)) for user_id in entity]
+        if isinstance(entity, str):
+            if entity not in self.channels:
+                raise ValueError(f"No user has \"{entity}\" as username")
+            return self.channels[entity].entity
+        if entity in self._by_id:
+            return self._by_id[entity].entity
+        return self._users.setdefault(entity, FakeUser(entity))
+
+    async def get_sender(self, message):
+        if message.sender is None:
+            await self._request('get_entity')
+            message.sender = self._users.setdefault(message.sender_id, FakeUser(message.sender_id))
+        return message.sender
+
+    async def get_messages(self, entity, limit=1, offset_date=None):
+        """Последние limit сообщений, более ранних чем offset_date"""
+        await self._request('get_messages')
+        channel = self._channel(entity)
+        end = len(channel) if offset_date is None else int(np.searchsorted(channel.dates, offset_date.timestamp(), 'left'))
+        return [channel.message(index, self._users) for index in range(end - 1, max(end - limit, 0) - 1, -1)]
+
+    def iter_messages(self, entity, limit=None, min_id=0, max_id=0, reverse=False, **kwargs):
+        """Сообщения с min_id < id < max_id страницами по TELEGRAM_PAGE_SIZE"""
+        channel = self._channel(entity)
+        low = int(np.searchsorted(channel.ids, min_id, 'right'))
+        high = int(np.searchsorted(channel.ids, max_id, 'left')) if max_id else len(channel)
+        if limit is not None:
+            high = min(high, low + limit) if reverse else high
+            low = low if reverse else max(low, high - limit)
+        return self._iter_pages(channel, low, high, reverse)
+
+    async def _iter_pages(self, channel, low, high, reverse):
+        indexes = range(low, high) if reverse else range(high - 1, low - 1, -1)
+        for start in range(0, len(indexes), TELEGRAM_PAGE_SIZE):
+            await self._request('GetHistoryRequest')
+            for index in indexes[start:start + TELEGRAM_PAGE_SIZE]:
+                yield channel.message(index, self._users, self.page_senders)
+
+    async def __call__(self, request):
+        await self._request(type(request).__name__)
+        if isinstance(request, GetFullChannelRequest):
+            return _Namespace(full_chat=_Namespace(participants_count=len(self._users), about="Synthetic channel", linked_chat_id=None))
+        raise NotImplementedError(type(request).__name__)
+
+class _Namespace:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+def render_stats(stats):
+    """Отрисовка статистики как в интерфейсе; None, если Streamlit недоступен"""
+    try:
+        import app
+    except ImportError as e:
+        print(f"Отрисовка не замеряется: {e}", file=sys.stderr)
+        return None
+    # Вне `streamlit run` вызовы st.* работают без сервера и только предупреждают
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    start = time.perf_counter()
+    app.render_message_stats(stats)
+    return time.perf_counter() - start
+
+def run_case(size, args):
+    """Один прогон: analyze_channel на синтетическом канале из size сообщений"""
+    channel = SyntheticChannel(
+        size, args.days, args.reaction_density, args.max_reactions, args.reply_density,
+        args.max_replies, args.authors, args.deleted_ratio, args.seed
+    )
+    client = FakeClient(
+        [channel], args.latency, args.flood_every, args.flood_seconds, not args.no_page_senders, args.flood_sleep_threshold
+    )
+    metrics = FetchMetrics()
+    store_dir = tempfile.mkdtemp(prefix='tg_bench_') if args.strategy == 'store' else None
+    store = MessageStore(os.path.join(store_dir, 'messages.db')) if store_dir else None
+
+    async def worker(group_link):
+        return await analyze_channel(
+            client, group_link, args.days, store, metrics=metrics,
+            sketch_errors=(DEFAULT_TOP_ERROR, DEFAULT_DISTINCT_ERROR) if args.approx_authors else None
+        )
+
+    gc.collect()
+    if not args.no_tracemalloc:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        outcomes = asyncio.run(run_bounded(
+            [BENCHMARK_CHANNEL], worker, concurrency=1, max_retries=args.max_retries,
+            on_flood_wait=lambda item, seconds: metrics.flood_wait(seconds)
+        ))
+        wall = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if not args.no_tracemalloc else None
+    finally:
+        if not args.no_tracemalloc:
+            tracemalloc.stop()
+        if store is not None:
+            store.close()
+
+    _, result, error = outcomes[0]
+    row = {
+        'size': size,
+        'strategy': args.strategy,
+        'approx_authors': args.approx_authors,
+        'wall_seconds': round(wall, 3),
+        'peak_memory_mb': round(peak / 2**20, 1) if peak is not None else None,
+        'api_calls': sum(client.api_calls.values()),
+        'api_calls_by_method': dict(client.api_calls),
+        'flood_waits': client.flood_waits,
+        'flood_wait_seconds': client.flood_wait_seconds,
+        'error': str(error) if error is not None else None,
+    }
+    if error is None:
+        row['messages'] = result['stats']['total_messages']
+        row['metrics'] = result['metrics']
+        frame_start = time.perf_counter()
+        build_daily_stats_frame([(BENCHMARK_CHANNEL, result, None)])
+        row['frame_seconds'] = round(time.perf_counter() - frame_start, 3)
+        render_seconds = None if args.no_render else render_stats(result['stats'])
+        row['render_seconds'] = round(render_seconds, 3) if render_seconds is not None else None
+    return row
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmark', description="Офлайн-бенчмарк сбора статистики")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(BENCHMARK_SIZES), help="Размеры каналов (сообщений)")
+    parser.add_argument('--days', type=int, default=30, help="Длина окна анализа; сообщения распределены по нему")
+    parser.add_argument('--strategy', choices=('window', 'store'), default='window', help="Загрузка окна целиком или через локальное хранилище")
+    parser.add_argument('--reaction-density', type=float, default=0.5, help="Доля сообщений с реакциями")
+    parser.add_argument('--max-reactions', type=int, default=50)
+    parser.add_argument('--reply-density', type=float, default=0.2, help="Доля сообщений с ответами")
+    parser.add_argument('--max-replies', type=int, default=30)
+    parser.add_argument('--authors', type=int, default=1000, help="Число разных авторов")
+    parser.add_argument('--approx-authors', action='store_true', help="Топ и число авторов скетчами (AuthorSketch)")
+    parser.add_argument('--deleted-ratio', type=float, default=0.05, help="Доля пропусков в ID")
+    parser.add_argument('--latency', type=float, default=0.0, help="Задержка каждого запроса (секунды)")
+    parser.add_argument('--flood-every', type=int, default=0, help="FloodWait каждые N запросов (0 — без FloodWait)")
+    parser.add_argument('--flood-seconds', type=int, default=1)
+    parser.add_argument('--flood-sleep-threshold', type=int, default=60, help="FloodWait не дольше этого ждать внутри клиента и повторять запрос")
+    parser.add_argument('--max-retries', type=int, default=3, help="Повторов после FloodWait")
+    parser.add_argument('--no-page-senders', action='store_true', help="Страницы без отправителей: имена через get_entity")
+    parser.add_argument('--no-render', action='store_true', help="Не замерять отрисовку")
+    parser.add_argument('--no-tracemalloc', action='store_true', help="Не замерять память (tracemalloc замедляет прогон)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Файл для результатов в JSON")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    rows = []
+    header = f"{'size':>9} {'wall, s':>9} {'msg/s':>10} {'peak, MB':>9} {'API':>7} {'flood':>6} {'render, s':>10}"
+    print(header)
+    for size in args.sizes:
+        row = run_case(size, args)
+        rows.append(row)
+        if row['error']:
+            print(f"{size:>9} ошибка: {row['error']}")
+            continue
+        peak = f"{row['peak_memory_mb']:.1f}" if row['peak_memory_mb'] is not None else '-'
+        render = f"{row['render_seconds']:.3f}" if row['render_seconds'] is not None else '-'
+        print(
+            f"{size:>9} {row['wall_seconds']:>9.3f} {row['metrics']['messages_per_second']:>10.0f} "
+            f"{peak:>9} {row['api_calls']:>7} {row['flood_waits']:>6} {render:>10}"
+        )
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+    return 1 if any(row['error'] for row in rows) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
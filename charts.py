@@ -0,0 +1,161 @@
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from aggregation import PERIODS, TOP_USERS_N
+
+# Наибольшее число столбцов на графике; более длинные ряды укрупняются
+CHART_MAX_BARS = 120
+# Порядок укрупнения периодов: час -> день -> неделя -> месяц
+CHART_PERIODS = ('hour', 'day', 'week', 'month')
+# Подписи периодов графика
+CHART_PERIOD_LABELS = {'hour': "по часам", 'day': "по дням", 'week': "по неделям", 'month': "по месяцам"}
+
+# Метрики графика активности: поле статистики, подпись и цвет
+CHART_METRICS = (
+    ('messages', 'messages_per_day', "Сообщения", '#1f77b4'),
+    ('views', 'views_per_day', "Просмотры", '#2ca02c'),
+    ('reactions', 'reactions_per_day', "Реакции", '#9467bd'),
+    ('replies', 'replies_per_day', "Ответы", '#ff7f0e'),
+)
+
+def build_stats_frame(stats):
+    """Ряды статистики в одном DataFrame: индекс — начало периода, столбцы — метрики"""
+    index = pd.to_datetime(stats['messages_per_day']['dates'])
+    return pd.DataFrame(
+        {column: stats[field]['values'] for column, field, _, _ in CHART_METRICS},
+        index=index
+    )
+
+def resample_frame(frame, period):
+    """Сумма значений по более крупным периодам (индекс — начало периода)"""
+    freq = PERIODS[period][0]
+    return frame.groupby(frame.index.to_period(freq).start_time).sum()
+
+def choose_chart_period(frame, period='day', max_bars=CHART_MAX_BARS):
+    """Наименьший период не мельче исходного, при котором столбцов не больше max_bars"""
+    if frame.empty:
+        return period
+    start, end = frame.index.min(), frame.index.max()
+    candidates = CHART_PERIODS[CHART_PERIODS.index(period):]
+    for candidate in candidates:
+        freq = PERIODS[candidate][0]
+        if len(pd.period_range(start, end, freq=freq)) <= max_bars:
+            return candidate
+    return candidates[-1]
+
+def downsample_frame(frame, period='day', max_bars=CHART_MAX_BARS):
+    """Укрупнение ряда до периода, при котором он помещается в max_bars столбцов"""
+    chart_period = choose_chart_period(frame, period, max_bars)
+    if chart_period != period:
+        frame = resample_frame(frame, chart_period)
+    return frame, chart_period
+
+def build_activity_figure(stats, max_bars=CHART_MAX_BARS):
+    """Один график с панелью на каждую ненулевую метрику и общей осью времени
+
+    Возвращает (figure, period) — период, до которого укрупнен ряд.
+    """
+    frame, period = downsample_frame(build_stats_frame(stats), stats.get('period', 'day'), max_bars)
+    metrics = [
+        (column, label, color) for column, _, label, color in CHART_METRICS
+        if column == 'messages' or frame[column].sum() > 0
+    ]
+    figure = make_subplots(
+        rows=len(metrics),
+        cols=1,
+        shared_xaxes=True,
+        vertical_spacing=0.06,
+        subplot_titles=[label for _, label, _ in metrics]
+    )
+    label_format = PERIODS[period][1]
+    for row, (column, label, color) in enumerate(metrics, start=1):
+        figure.add_trace(
+            go.Bar(
+                x=frame.index,
+                y=frame[column],
+                name=label,
+                marker_color=color,
+                customdata=[start.strftime(label_format) for start in frame.index],
+                hovertemplate=f"%{{customdata}}<br>{label}: %{{y:,}}<extra></extra>",
+            ),
+            row=row,
+            col=1
+        )
+    figure.update_layout(
+        height=220 * len(metrics) + 60,
+        showlegend=False,
+        bargap=0.1,
+        margin=dict(l=10, r=10, t=40, b=10),
+        separators=', ',
+    )
+    return figure, period
+
+def build_top_users_figure(stats, top_n=TOP_USERS_N):
+    """Топ пользователей по сообщениям и по реакциям; None, если отправителей нет"""
+    if not stats['top_users']:
+        return None
+    by_count = list(stats['top_users'].values())[:top_n]
+    by_reactions = [user for user in list(stats['top_users_by_reactions'].values())[:top_n] if user['reactions'] > 0]
+
+    columns = 2 if by_reactions else 1
+    titles = [f"Топ {top_n} по сообщениям"] + ([f"Топ {top_n} по реакциям"] if by_reactions else [])
+    figure = make_subplots(rows=1, cols=columns, subplot_titles=titles, horizontal_spacing=0.25)
+    # Самые активные сверху
+    figure.add_trace(
+        go.Bar(
+            x=[user['count'] for user in reversed(by_count)],
+            y=[user['name'] for user in reversed(by_count)],
+            orientation='h',
+            marker_color='#1f77b4',
+            name="Сообщения",
+        ),
+        row=1,
+        col=1
+    )
+    if by_reactions:
+        figure.add_trace(
+            go.Bar(
+                x=[user['reactions'] for user in reversed(by_reactions)],
+                y=[user['name'] for user in reversed(by_reactions)],
+                orientation='h',
+                marker_color='#9467bd',
+                name="Реакции",
+            ),
+            row=1,
+            col=2
+        )
+    figure.update_layout(
+        height=30 * max(len(by_count), len(by_reactions)) + 120,
+        showlegend=False,
+        margin=dict(l=10, r=10, t=40, b=10),
+    )
+    return figure
+
+def build_stats_figures(stats):
+    """Все графики статистики канала; строятся один раз и хранятся с результатом"""
+    activity, period = build_activity_figure(stats)
+    return {
+        'activity': activity,
+        'period': period,
+        'top_users': build_top_users_figure(stats),
+    }
+
+def build_counts_figure(frame, label_column, color='#1f77b4'):
+    """Горизонтальные столбцы топа (label_column, count); None для пустой таблицы"""
+    if frame.empty:
+        return None
+    # Самые частые сверху
+    frame = frame.iloc[::-1]
+    figure = go.Figure(go.Bar(
+        x=frame['count'],
+        y=frame[label_column].astype(str),
+        orientation='h',
+        marker_color=color,
+    ))
+    figure.update_layout(
+        height=24 * len(frame) + 80,
+        showlegend=False,
+        margin=dict(l=10, r=10, t=20, b=10),
+    )
+    return figure
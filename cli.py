@@ -0,0 +1,320 @@
+"""Пакетный запуск анализа без Streamlit
+
+Пример:
+    python -m cli @channel1 https://t.me/channel2 --days 7 --output out --format parquet
+
+API ID и API Hash берутся из --api-id/--api-hash или переменных окружения
+TG_API_ID/TG_API_HASH; сессия — файл --session, файл сессии интерфейса
+для номера --phone или строка сессии --session-string/TG_SESSION_STRING.
+Дополнительные аккаунты (--pool-file, строки сессий по одной на строку)
+образуют пул, между которым распределяются каналы.
+С --backfill история периода (любой длины) сначала дозагружается
+в хранилище диапазонами ID с контрольными точками; прерванная загрузка
+продолжается при следующем запуске с того же места.
+С --text-analytics по текстам сообщений считаются ключевые слова и биграммы
+по дням, хэштеги, упоминания, домены ссылок и распределение реакций.
+С --messages сырые сообщения всех каналов выгружаются в файл messages,
+с --download-media медиафайлы загружаются в фоне во время обхода сообщений.
+Обоим нужны сами сообщения Telegram, поэтому с ними окно загружается
+из Telegram целиком, без локального хранилища.
+С хранилищем в файл reposts записываются ребра графа репостов
+(источник -> канал) для обработанных каналов.
+С --approx-authors топ и число авторов считаются скетчами (Space-Saving,
+HyperLogLog) с заданной ошибкой, а число авторов всех каналов — по их слиянию.
+Разрешенные ссылки на каналы и сведения о каналах кэшируются в entities.db,
+поэтому повторный запуск не разрешает имена каналов заново.
+Сессия должна быть авторизована заранее: код подтверждения не запрашивается.
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pandas as pd
+from telethon.sessions import StringSession
+
+from client_service import ClientService, phone_account, string_session_account
+from message_store import MessageStore, DEFAULT_STORE_PATH
+from sender_cache import SenderCache, DEFAULT_SENDER_CACHE_PATH
+from entity_cache import EntityCache, DEFAULT_ENTITY_CACHE_PATH
+from scheduler import DEFAULT_CONCURRENCY, run_bounded
+from session_pool import SessionPool, run_pooled
+from aggregation import DEFAULT_TIMEZONE
+from export import EXPORT_FORMATS, extract_export_record, open_export_writer
+from backfill import DEFAULT_BACKFILL_CONCURRENCY, backfill_channels
+from metrics import FetchMetrics, write_metrics_json, write_metrics_prometheus
+from text_analytics import TextColumns, analyze_texts, build_text_frames
+from sketches import DEFAULT_DISTINCT_ERROR, DEFAULT_TOP_ERROR, merge_author_sketches
+from media import DEFAULT_MEDIA_CONCURRENCY, DEFAULT_MEDIA_DIR, DEFAULT_MEDIA_MAX_SIZE, DOWNLOADABLE_KINDS, MediaDownloader
+from analyzer import (
+    LogReporter,
+    analyze_channel,
+    prefetch_group_entities,
+    build_comparison_frame,
+    build_daily_stats_frame,
+    parse_group_links,
+)
+
+logger = logging.getLogger('cli')
+
+# Файл сессии по умолчанию
+DEFAULT_SESSION = 'session_name'
+# Столбцы файла ребер графа репостов
+REPOST_EDGE_COLUMNS = [
+    'target_id', 'target', 'source_id', 'source_username', 'source', 'count', 'forwards', 'links',
+    'avg_lag', 'min_lag', 'first_date', 'last_date',
+]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m cli',
+        description="Сбор статистики групп и каналов Telegram без интерфейса"
+    )
+    parser.add_argument('channels', nargs='*', help="Ссылки или имена каналов (@example, https://t.me/example)")
+    parser.add_argument('-f', '--channels-file', help="Файл со ссылками, по одной на строку")
+    parser.add_argument('-d', '--days', type=int, default=7, help="Период анализа в днях (по умолчанию 7)")
+    parser.add_argument('-o', '--output', required=True, help="Каталог для результатов")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help="Формат файлов (по умолчанию csv)")
+    parser.add_argument('--messages', action='store_true', help="Выгрузить сырые сообщения (окно загружается из Telegram целиком)")
+    parser.add_argument('--api-id', default=os.environ.get('TG_API_ID'))
+    parser.add_argument('--api-hash', default=os.environ.get('TG_API_HASH'))
+    parser.add_argument('--session', default=DEFAULT_SESSION, help="Путь к файлу сессии Telethon")
+    parser.add_argument('--phone', default=os.environ.get('TG_PHONE'), help="Номер аккаунта, вошедшего через интерфейс (его файл сессии)")
+    parser.add_argument('--session-string', default=os.environ.get('TG_SESSION_STRING'), help="Строка сессии вместо файла")
+    parser.add_argument('--pool-file', help="Файл со строками сессий дополнительных аккаунтов")
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help="Локальное хранилище сообщений")
+    parser.add_argument('--no-store', action='store_true', help="Загружать окно целиком, без локального хранилища")
+    parser.add_argument('--backfill', action='store_true', help="Перед анализом дозагрузить историю периода в хранилище с контрольными точками (продолжается после сбоя)")
+    parser.add_argument('--backfill-concurrency', type=int, default=DEFAULT_BACKFILL_CONCURRENCY, help="Диапазонов истории одного канала одновременно")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help="Каналов одновременно")
+    parser.add_argument('--metrics', choices=('json', 'prometheus'), help="Записать замеры по каналам в metrics.json или metrics.prom")
+    parser.add_argument('--text-analytics', action='store_true', help="Анализ текста: файлы keywords, ngrams, entities и reactions")
+    parser.add_argument('--download-media', nargs='?', const=DEFAULT_MEDIA_DIR, metavar='DIR', help=f"Загружать медиафайлы в каталог (по умолчанию {DEFAULT_MEDIA_DIR})")
+    parser.add_argument('--media-types', nargs='+', choices=DOWNLOADABLE_KINDS, default=list(DOWNLOADABLE_KINDS), help="Типы загружаемых файлов")
+    parser.add_argument('--media-max-size', type=float, default=DEFAULT_MEDIA_MAX_SIZE / 1024 / 1024, help="Наибольший размер файла, МБ")
+    parser.add_argument('--media-concurrency', type=int, default=DEFAULT_MEDIA_CONCURRENCY, help="Файлов одновременно")
+    parser.add_argument('--approx-authors', action='store_true', help="Топ и число авторов считать скетчами с ограниченной памятью (для очень больших групп)")
+    parser.add_argument('--top-error', type=float, default=DEFAULT_TOP_ERROR, help="Ошибка приближенного топа: доля от всех сообщений")
+    parser.add_argument('--distinct-error', type=float, default=DEFAULT_DISTINCT_ERROR, help="Относительная ошибка приближенного числа авторов")
+    parser.add_argument('--tz', default=DEFAULT_TIMEZONE, help="Часовой пояс границ дней")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+def write_frame(frame, path, output_format):
+    """Запись DataFrame в файл выбранного формата"""
+    path = Path(f"{path}.{output_format}")
+    if output_format == 'parquet':
+        frame.to_parquet(path, index=False)
+    elif output_format == 'xlsx':
+        frame.to_excel(path, index=False, engine='xlsxwriter')
+    elif output_format == 'jsonl':
+        frame.to_json(path, orient='records', lines=True, date_format='iso', force_ascii=False)
+    else:
+        frame.to_csv(path, index=False)
+    return path
+
+async def connect_account(service, args, account, session):
+    """Подключение авторизованной сессии; None, если сессия не авторизована"""
+    client = await service.get_session_client(account, session, args.api_id, args.api_hash)
+    if not await client.is_user_authorized():
+        await service.drop_client(account)
+        return None
+    return client
+
+async def create_batch_clients(service, args):
+    """Авторизованные клиенты: {ключ аккаунта: клиент}, основной аккаунт первым"""
+    if args.session_string:
+        accounts = [(string_session_account(args.session_string), StringSession(args.session_string.strip()))]
+    elif args.phone:
+        accounts = [phone_account(args.phone)]
+    else:
+        accounts = [(f"file:{args.session}", args.session)]
+    if args.pool_file:
+        for line in Path(args.pool_file).read_text(encoding='utf-8').splitlines():
+            if line.strip():
+                accounts.append((string_session_account(line), StringSession(line.strip())))
+
+    clients = {}
+    for account, session in accounts:
+        client = await connect_account(service, args, account, session)
+        if client is None:
+            logger.warning("Аккаунт %s не авторизован и пропущен", account)
+        else:
+            clients[account] = client
+    return clients
+
+async def run(service, args, group_links):
+    clients = await create_batch_clients(service, args)
+    if not clients:
+        logger.error("Сессия не авторизована: выполните вход через интерфейс или передайте строку сессии")
+        return 2
+    client = next(iter(clients.values()))
+    pool = SessionPool(clients) if len(clients) > 1 else None
+
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+    store = None if args.no_store else MessageStore(args.store)
+    sender_cache = SenderCache(DEFAULT_SENDER_CACHE_PATH)
+    entity_cache = EntityCache(DEFAULT_ENTITY_CACHE_PATH)
+    # Сообщения всех каналов пишутся в один файл по мере загрузки
+    writer = open_export_writer(output / f"messages.{args.format}", args.format) if args.messages else None
+    done = 0
+    channel_metrics = {group_link: FetchMetrics() for group_link in group_links}
+    channel_texts = {group_link: TextColumns() for group_link in group_links} if args.text_analytics else None
+    downloader = None
+
+    async def analyze(channel_client, group_link):
+        def on_message(message):
+            if writer is not None:
+                writer.write(extract_export_record(message, group_link))
+            if downloader is not None:
+                # Ссылки на файлы действуют только для аккаунта, получившего сообщение
+                downloader.submit(message, group_link, client=channel_client)
+
+        reporter = LogReporter(prefix=f"{group_link}: ")
+        return await analyze_channel(
+            channel_client, group_link, args.days, store, sender_cache, args.tz,
+            on_record=None if channel_texts is None else channel_texts[group_link].append,
+            reporter=reporter, on_message=None if writer is None and downloader is None else on_message,
+            metrics=channel_metrics[group_link],
+            entity_cache=entity_cache,
+            sketch_errors=(args.top_error, args.distinct_error) if args.approx_authors else None
+        )
+
+    async def worker(group_link):
+        return await analyze(client, group_link)
+
+    def on_flood_wait(group_link, seconds):
+        channel_metrics[group_link].flood_wait(seconds)
+        logger.warning("%s: FloodWait %d с", group_link, seconds)
+
+    def on_done(group_link, result, error):
+        nonlocal done
+        done += 1
+        if error is not None:
+            logger.error("[%d/%d] %s: %s", done, len(group_links), group_link, error)
+        else:
+            logger.info(
+                "[%d/%d] %s: %d сообщений за %.1f с (%.0f сообщ./с, запросов %d, FloodWait %d с)",
+                done, len(group_links), group_link, result['stats']['total_messages'],
+                result['metrics']['elapsed_seconds'], result['metrics']['messages_per_second'],
+                result['metrics']['api_calls'], result['metrics']['flood_wait_seconds']
+            )
+
+    repost_edges = None
+    try:
+        if args.download_media:
+            downloader = MediaDownloader(
+                client, args.download_media, args.media_concurrency,
+                int(args.media_max_size * 1024 * 1024), args.media_types
+            )
+            downloader.start()
+        if args.backfill:
+            start_date = datetime.now(timezone.utc) - timedelta(days=args.days)
+            completed = await backfill_channels(
+                client, group_links, start_date, store, args.backfill_concurrency,
+                LogReporter(prefix="backfill: "), sender_cache, entity_cache
+            )
+            logger.info("История загружена полностью для %d из %d каналов", len(completed), len(group_links))
+        cached = await prefetch_group_entities(client, group_links, entity_cache)
+        logger.info("Каналы из кэша: %d из %d", cached, len(group_links))
+        if pool is not None:
+            logger.info("Каналы распределяются между %d аккаунтами", len(pool))
+            results = await run_pooled(group_links, analyze, pool, on_done=on_done, on_flood_wait=on_flood_wait)
+            for account_stats in pool.stats():
+                logger.info("Аккаунт %(account)s: задач %(tasks)d, FloodWait %(flood_waits)d (%(flood_wait_seconds)d с)", account_stats)
+        else:
+            results = await run_bounded(group_links, worker, concurrency=args.concurrency, on_done=on_done, on_flood_wait=on_flood_wait)
+        if downloader is not None:
+            logger.info("Ожидание загрузки медиафайлов...")
+            await downloader.close()
+            logger.info(
+                "Медиафайлы: загружено %(downloaded)d (%(bytes)d байт), из кэша %(cached)d, "
+                "пропущено по размеру %(skipped)d, ошибок %(failed)d", downloader.stats
+            )
+        merged = merge_author_sketches(
+            result['stats']['author_sketch'] for _, result, error in results
+            if error is None and 'author_sketch' in result['stats']
+        )
+        if merged is not None:
+            logger.info("Авторов во всех каналах: ~%d", merged.count())
+        if store is not None:
+            repost_edges = store.get_repost_edges(
+                result['info']['id'] for _, result, error in results if error is None
+            )
+    finally:
+        if downloader is not None:
+            # После ошибки воркеры останавливаются без ожидания очереди
+            await downloader.abort()
+        sender_cache.close()
+        entity_cache.close()
+        if store is not None:
+            store.close()
+        if writer is not None:
+            writer.close()
+
+    written = [
+        write_frame(build_comparison_frame(results), output / 'channels', args.format),
+        write_frame(build_daily_stats_frame(results), output / 'daily', args.format),
+    ]
+    if writer is not None:
+        written.append(writer.path)
+    if repost_edges is not None:
+        written.append(write_frame(pd.DataFrame(repost_edges, columns=REPOST_EDGE_COLUMNS), output / 'reposts', args.format))
+    if channel_texts is not None:
+        # Тексты анализируются после загрузки всех каналов, по одному каналу
+        analytics = {}
+        for group_link, result, error in results:
+            if error is None:
+                analytics[group_link] = analyze_texts(channel_texts.pop(group_link), args.tz)
+        for name, frame in build_text_frames(analytics).items():
+            written.append(write_frame(frame, output / name, args.format))
+    if args.metrics:
+        # Для упавших каналов записываются замеры до ошибки
+        metrics_by_channel = {
+            group_link: result['metrics'] if error is None else channel_metrics[group_link].to_dict()
+            for group_link, result, error in results
+        }
+        if args.metrics == 'json':
+            written.append(write_metrics_json(output / 'metrics.json', metrics_by_channel))
+        else:
+            written.append(write_metrics_prometheus(output / 'metrics.prom', metrics_by_channel))
+    for path in written:
+        logger.info("Записан файл %s", path)
+
+    return 1 if any(error is not None for _, _, error in results) else 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(asctime)s %(levelname)s %(message)s'
+    )
+
+    text = "\n".join(args.channels)
+    if args.channels_file:
+        text += "\n" + Path(args.channels_file).read_text(encoding='utf-8')
+    group_links = parse_group_links(text)
+    if not group_links:
+        logger.error("Не указаны каналы")
+        return 2
+    if not args.api_id or not args.api_hash:
+        logger.error("Укажите --api-id и --api-hash или TG_API_ID и TG_API_HASH")
+        return 2
+    if args.days < 1:
+        logger.error("Период анализа должен быть не меньше 1 дня")
+        return 2
+    if args.backfill and args.no_store:
+        logger.error("Для --backfill нужно локальное хранилище (без --no-store)")
+        return 2
+
+    service = ClientService()
+    try:
+        return service.run(run(service, args, group_links))
+    finally:
+        service.shutdown()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import re
+import threading
+import time
+
+from telethon import TelegramClient
+
+from metrics import instrument_client
+
+# Как часто проверять соединение клиента (секунды)
+HEALTH_CHECK_INTERVAL = 60
+# Время ожидания ответа на проверочный запрос (секунды)
+HEALTH_CHECK_TIMEOUT = 15
+
+def phone_account(phone):
+    """Ключ аккаунта и файл сессии для входа по номеру телефона"""
+    digits = re.sub(r'\D', '', phone)
+    return f"phone:{digits}", f"session_{digits}"
+
+def string_session_account(session_string):
+    """Ключ аккаунта для строки сессии (сама строка в ключ не попадает)"""
+    digest = hashlib.sha256(session_string.strip().encode()).hexdigest()[:16]
+    return f"string:{digest}"
+
+class ClientService:
+    """Долгоживущие клиенты Telegram в отдельном потоке с циклом событий
+
+    Клиенты создаются один раз на аккаунт и переиспользуются между запусками
+    анализа, поэтому рукопожатие MTProto и кэш entity не теряются.
+    Сессии Streamlit и пакетные задания передают корутины через submit()/run();
+    фоновая задача периодически проверяет соединения и переподключает клиентов.
+    """
+
+    def __init__(self, health_check_interval=HEALTH_CHECK_INTERVAL):
+        self.health_check_interval = health_check_interval
+        self._clients = {}
+        self._checked_at = {}
+        self._locks = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name='telegram-client-service', daemon=True)
+        self._thread.start()
+        self._health_check = self.submit(self._health_loop())
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def submit(self, coro):
+        """Запуск корутины в цикле сервиса; возвращает concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro, timeout=None):
+        """Запуск корутины в цикле сервиса с ожиданием результата"""
+        return self.submit(coro).result(timeout)
+
+    def _lock(self, account):
+        if account not in self._locks:
+            self._locks[account] = asyncio.Lock()
+        return self._locks[account]
+
+    async def get_client(self, account, factory):
+        """Подключенный клиент аккаунта; factory() создает клиента при первом обращении"""
+        async with self._lock(account):
+            client = self._clients.get(account)
+            if client is None:
+                client = instrument_client(factory())
+                self._clients[account] = client
+            await self._ensure_connected(account, client)
+            return client
+
+    async def get_session_client(self, account, session, api_id, api_hash):
+        """Клиент аккаунта с сессией session (файл или StringSession)"""
+        return await self.get_client(account, lambda: TelegramClient(session, int(api_id), api_hash))
+
+    async def _ensure_connected(self, account, client):
+        if not client.is_connected():
+            await client.connect()
+            self._checked_at[account] = time.monotonic()
+            return
+
+        if time.monotonic() - self._checked_at.get(account, 0) < self.health_check_interval:
+            return
+        try:
+            await asyncio.wait_for(client.get_me(input_peer=True), HEALTH_CHECK_TIMEOUT)
+        except Exception:
+            # Соединение зависло или разорвано: переподключаемся
+            await client.disconnect()
+            await client.connect()
+        self._checked_at[account] = time.monotonic()
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            for account, client in list(self._clients.items()):
+                lock = self._lock(account)
+                if lock.locked():
+                    # Клиент сейчас выдается или проверяется
+                    continue
+                async with lock:
+                    try:
+                        await self._ensure_connected(account, client)
+                    except Exception:
+                        pass
+
+    async def drop_client(self, account):
+        """Отключение и удаление клиента аккаунта"""
+        async with self._lock(account):
+            client = self._clients.pop(account, None)
+            self._checked_at.pop(account, None)
+            if client is not None:
+                await client.disconnect()
+
+    def accounts(self):
+        return list(self._clients)
+
+    def shutdown(self):
+        """Отключение всех клиентов и остановка цикла"""
+        async def disconnect_all():
+            for account in list(self._clients):
+                await self.drop_client(account)
+
+        self._health_check.cancel()
+        self.run(disconnect_all())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
@@ -0,0 +1,175 @@
+import telethon
+import pandas as pd
+
+from scheduler import ErrorCollector, run_bounded
+from session_pool import run_pooled
+from analyzer import get_group_entity
+
+# Число веток комментариев, загружаемых одновременно
+DEFAULT_THREAD_CONCURRENCY = 10
+# Размер пачки комментариев при записи в хранилище
+COMMENT_BATCH_SIZE = 500
+
+def count_reactions(message):
+    """Суммарное число реакций на сообщение"""
+    if not getattr(message, 'reactions', None):
+        return 0
+    return sum(reaction.count for reaction in message.reactions.results)
+
+def extract_comment_record(message, post_id):
+    """Извлечение полей комментария к посту канала"""
+    reply_to = getattr(message, 'reply_to', None)
+    reply_to_id = getattr(reply_to, 'reply_to_msg_id', None)
+    return {
+        'post_id': post_id,
+        'id': message.id,
+        'date': message.date,
+        'sender_id': message.sender_id,
+        # Ответ на другой комментарий, а не на сам пост: только у таких ответов задан reply_to_top_id
+        'reply_to_id': reply_to_id if getattr(reply_to, 'reply_to_top_id', None) is not None else None,
+        'reactions': count_reactions(message),
+        'text': message.message or '',
+    }
+
+async def fetch_thread(client, group_entity, post, state=None, store=None):
+    """Загрузка ветки комментариев одного поста
+
+    Загрузка продолжается с последнего сохраненного комментария; ветка
+    пропускается целиком, если счетчик ответов поста не изменился. В хранилище
+    комментарии пишутся пачками вместе с позицией, поэтому прерванная ветка
+    (FloodWait, ошибка сети) продолжается с места остановки.
+    """
+    channel_id = group_entity.id
+    post_id = post['id']
+    if state is not None and state['replies_seen'] >= post['replies']:
+        return []
+    last_id = state['last_comment_id'] if state else 0
+
+    comments = []
+    batch = []
+    try:
+        async for message in client.iter_messages(group_entity, reply_to=post_id, min_id=last_id, reverse=True):
+            record = extract_comment_record(message, post_id)
+            comments.append(record)
+            batch.append(record)
+            last_id = max(last_id, record['id'])
+
+            if store is not None and len(batch) >= COMMENT_BATCH_SIZE:
+                store.upsert_comments(channel_id, batch)
+                # replies_seen = 0: ветка загружена не полностью
+                store.set_thread_state(channel_id, post_id, last_id, 0)
+                batch = []
+    except telethon.errors.MsgIdInvalidError:
+        # У поста нет ветки обсуждения (комментарии отключены или пост удален)
+        pass
+
+    if store is not None:
+        if batch:
+            store.upsert_comments(channel_id, batch)
+        store.set_thread_state(channel_id, post_id, last_id, post['replies'])
+
+    return comments
+
+async def resolve_thread_entity(thread_client, group_entity, group_link=None, entity_cache=None):
+    """Entity канала для аккаунта пула; None, если аккаунт не может его получить
+
+    access_hash канала у каждого аккаунта свой, а по одному ID канал без
+    имени не находится, поэтому entity разрешается по исходной ссылке
+    (в том числе приглашению) через кэш каналов этого аккаунта.
+    """
+    if group_link is not None:
+        return await get_group_entity(thread_client, group_link, ErrorCollector(), entity_cache=entity_cache)
+    username = getattr(group_entity, 'username', None)
+    if username is None:
+        return None
+    try:
+        return await thread_client.get_entity(username)
+    except (ValueError, telethon.errors.RPCError):
+        return None
+
+async def scrape_comments(client, group_entity, posts, store=None, concurrency=DEFAULT_THREAD_CONCURRENCY, on_done=None, pool=None, group_link=None, entity_cache=None):
+    """Параллельная загрузка комментариев к постам канала
+
+    posts — записи постов (id, replies, ...); загружаются только ветки постов
+    с ответами, не более concurrency одновременно. С пулом аккаунтов
+    (SessionPool) ветки распределяются между аккаунтами; канал разрешается
+    каждым аккаунтом по group_link, а если аккаунт не может его получить,
+    ветки загружаются основным клиентом. Возвращает (комментарии, ошибки),
+    где ошибки — список (post_id, исключение). С хранилищем возвращаются
+    все сохраненные комментарии к этим постам, а не только загруженные в этот раз.
+    """
+    posts = [post for post in posts if post['replies']]
+    # Клиент и entity канала для каждого аккаунта: (клиент, entity)
+    entities = {id(client): (client, group_entity)}
+
+    async def fetch(thread_client, post):
+        resolved = entities.get(id(thread_client))
+        if resolved is None:
+            entity = await resolve_thread_entity(thread_client, group_entity, group_link, entity_cache)
+            resolved = entities[id(thread_client)] = (thread_client, entity) if entity is not None else (client, group_entity)
+        thread_client, entity = resolved
+        # Состояние перечитывается при каждом запуске, в том числе при повторе после FloodWait
+        state = store.get_thread_state(group_entity.id, post['id']) if store is not None else None
+        return await fetch_thread(thread_client, entity, post, state, store)
+
+    if pool is not None:
+        results = await run_pooled(posts, fetch, pool, on_done=on_done)
+    else:
+        async def worker(post):
+            return await fetch(client, post)
+
+        results = await run_bounded(posts, worker, concurrency=concurrency, on_done=on_done)
+
+    failures = [(post['id'], error) for post, comments, error in results if error is not None]
+    if store is not None:
+        comments = store.load_comments(group_entity.id, [post['id'] for post in posts])
+    else:
+        comments = [comment for post, thread, error in results if error is None for comment in thread]
+
+    return comments, failures
+
+def build_posts_comments_frame(posts, comments, sender_names=None):
+    """Плоская таблица постов и комментариев
+
+    Каждый пост идет строкой с kind='post', следом его комментарии
+    с kind='comment'; post_id связывает комментарий с постом.
+    """
+    sender_names = sender_names or {}
+    comments_by_post = {}
+    for comment in comments:
+        comments_by_post.setdefault(comment['post_id'], []).append(comment)
+
+    rows = []
+    for post in sorted(posts, key=lambda post: post['id']):
+        rows.append({
+            'kind': 'post',
+            'post_id': post['id'],
+            'id': post['id'],
+            'date': post['date'],
+            'sender_id': post['sender_id'],
+            'sender': sender_names.get(post['sender_id']),
+            'reply_to_id': None,
+            'views': post['views'],
+            'reactions': post['reactions'],
+            'replies': post['replies'],
+            'text': post.get('text'),
+        })
+        for comment in comments_by_post.get(post['id'], []):
+            rows.append({
+                'kind': 'comment',
+                'post_id': post['id'],
+                'id': comment['id'],
+                'date': comment['date'],
+                'sender_id': comment['sender_id'],
+                'sender': sender_names.get(comment['sender_id']),
+                'reply_to_id': comment['reply_to_id'],
+                'views': None,
+                'reactions': comment['reactions'],
+                'replies': None,
+                'text': comment['text'],
+            })
+
+    return pd.DataFrame(rows, columns=[
+        'kind', 'post_id', 'id', 'date', 'sender_id', 'sender',
+        'reply_to_id', 'views', 'reactions', 'replies', 'text'
+    ])
@@ -0,0 +1,203 @@
+import sqlite3
+import threading
+import time
+import weakref
+from datetime import datetime, timezone
+
+from telethon.tl import types
+
+# Путь к кэшу каналов по умолчанию
+DEFAULT_ENTITY_CACHE_PATH = 'entities.db'
+# Срок жизни связи имя -> канал (секунды); после него канал обновляется по ID
+DEFAULT_ENTITY_TTL = 7 * 24 * 3600
+# Срок жизни снимка полной информации о канале (секунды)
+DEFAULT_CHANNEL_INFO_TTL = 6 * 3600
+
+# Флаги канала в столбце flags
+_FLAGS = ('verified', 'restricted', 'scam', 'fake')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    account_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    entity_id INTEGER NOT NULL,
+    access_hash INTEGER,
+    kind TEXT NOT NULL,
+    title TEXT,
+    username TEXT,
+    date INTEGER,
+    flags INTEGER NOT NULL DEFAULT 0,
+    updated_at INTEGER NOT NULL,
+    PRIMARY KEY (account_id, name)
+);
+
+CREATE INDEX IF NOT EXISTS idx_entities_entity ON entities (account_id, entity_id);
+
+CREATE TABLE IF NOT EXISTS channel_info (
+    channel_id INTEGER PRIMARY KEY,
+    members_count INTEGER,
+    description TEXT,
+    linked_chat_id INTEGER,
+    updated_at INTEGER NOT NULL
+);
+"""
+
+# ID аккаунта каждого клиента: запрашивается один раз за время жизни клиента
+_account_ids = weakref.WeakKeyDictionary()
+
+async def get_account_id(client):
+    """ID пользователя, под которым работает клиент
+
+    access_hash канала свой у каждого аккаунта, поэтому записи кэша
+    разделены по аккаунтам.
+    """
+    account_id = _account_ids.get(client)
+    if account_id is None:
+        me = await client.get_me(input_peer=True)
+        account_id = _account_ids[client] = me.user_id
+    return account_id
+
+def entity_kind(entity):
+    """Тип чата для кэша: broadcast, megagroup, gigagroup или chat"""
+    if isinstance(entity, types.Channel):
+        if entity.gigagroup:
+            return 'gigagroup'
+        return 'broadcast' if entity.broadcast else 'megagroup'
+    return 'chat'
+
+def _build_entity(entity_id, access_hash, kind, title, username, date, flags):
+    """Объект канала или группы Telethon из записи кэша"""
+    date = datetime.fromtimestamp(date, tz=timezone.utc) if date is not None else None
+    if kind == 'chat':
+        return types.Chat(id=entity_id, title=title, photo=types.ChatPhotoEmpty(), participants_count=0, date=date, version=0)
+    return types.Channel(
+        id=entity_id,
+        title=title,
+        photo=types.ChatPhotoEmpty(),
+        date=date,
+        broadcast=kind == 'broadcast',
+        megagroup=kind in ('megagroup', 'gigagroup'),
+        gigagroup=kind == 'gigagroup',
+        access_hash=access_hash,
+        username=username,
+        **{flag: bool(flags & (1 << bit)) for bit, flag in enumerate(_FLAGS)}
+    )
+
+class EntityCache:
+    """Постоянный кэш разрешения ссылок на каналы и информации о них
+
+    Имя из ссылки сопоставляется с ID, access_hash и типом канала, поэтому
+    повторный анализ не вызывает ResolveUsername — один из самых жестко
+    ограничиваемых запросов Telegram. Полная информация о канале (участники,
+    описание, чат обсуждения) хранится снимком со сроком жизни info_ttl.
+    """
+
+    def __init__(self, path=DEFAULT_ENTITY_CACHE_PATH, ttl=DEFAULT_ENTITY_TTL, info_ttl=DEFAULT_CHANNEL_INFO_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.info_ttl = info_ttl
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def lookup(self, account_id, names):
+        """Поиск имен в кэше: ({имя: entity}, {имя: устаревший entity}, множество промахов)
+
+        Устаревшие записи можно обновить одним пакетным запросом по ID
+        вместо разрешения имени.
+        """
+        names = list(dict.fromkeys(name.lower() for name in names))
+        now = int(time.time())
+        found = {}
+        stale = {}
+        with self._lock:
+            for i in range(0, len(names), 500):
+                chunk = names[i:i + 500]
+                cursor = self.conn.execute(
+                    f"""
+                    SELECT name, entity_id, access_hash, kind, title, username, date, flags, updated_at
+                    FROM entities WHERE account_id = ? AND name IN ({','.join('?' * len(chunk))})
+                    """,
+                    [account_id, *chunk]
+                )
+                for name, *fields, updated_at in cursor:
+                    entity = _build_entity(*fields)
+                    if now - updated_at < self.ttl:
+                        found[name] = entity
+                    else:
+                        stale[name] = entity
+        return found, stale, {name for name in names if name not in found and name not in stale}
+
+    def get(self, account_id, name):
+        """Entity по имени из ссылки; None, если записи нет или она устарела"""
+        return self.lookup(account_id, [name])[0].get(name.lower())
+
+    def put(self, account_id, name, entity):
+        """Сохранение разрешенного имени; каналы без access_hash (min) не сохраняются"""
+        if not isinstance(entity, (types.Channel, types.Chat)) or getattr(entity, 'min', False):
+            return
+        date = int(entity.date.timestamp()) if getattr(entity, 'date', None) else None
+        flags = sum(1 << bit for bit, flag in enumerate(_FLAGS) if getattr(entity, flag, False))
+        with self._lock, self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO entities (account_id, name, entity_id, access_hash, kind, title, username, date, flags, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (account_id, name) DO UPDATE SET
+                    entity_id = excluded.entity_id,
+                    access_hash = excluded.access_hash,
+                    kind = excluded.kind,
+                    title = excluded.title,
+                    username = excluded.username,
+                    date = excluded.date,
+                    flags = excluded.flags,
+                    updated_at = excluded.updated_at
+                """,
+                (
+                    account_id, name.lower(), entity.id, getattr(entity, 'access_hash', None), entity_kind(entity),
+                    entity.title, getattr(entity, 'username', None), date, flags, int(time.time()),
+                )
+            )
+
+    def invalidate(self, account_id=None, name=None):
+        """Удаление записи имени, всех записей аккаунта или всего кэша"""
+        with self._lock, self.conn:
+            if account_id is None:
+                self.conn.execute("DELETE FROM entities")
+                self.conn.execute("DELETE FROM channel_info")
+            elif name is None:
+                self.conn.execute("DELETE FROM entities WHERE account_id = ?", (account_id,))
+            else:
+                self.conn.execute("DELETE FROM entities WHERE account_id = ? AND name = ?", (account_id, name.lower()))
+
+    def get_info(self, channel_id):
+        """Снимок полной информации о канале; None, если его нет или он устарел"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT members_count, description, linked_chat_id, updated_at FROM channel_info WHERE channel_id = ?",
+                (channel_id,)
+            ).fetchone()
+        if row is None or int(time.time()) - row[3] >= self.info_ttl:
+            return None
+        return {'members_count': row[0], 'description': row[1], 'linked_chat_id': row[2]}
+
+    def put_info(self, channel_id, info):
+        """Сохранение снимка {'members_count', 'description', 'linked_chat_id'}"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO channel_info (channel_id, members_count, description, linked_chat_id, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (channel_id) DO UPDATE SET
+                    members_count = excluded.members_count,
+                    description = excluded.description,
+                    linked_chat_id = excluded.linked_chat_id,
+                    updated_at = excluded.updated_at
+                """,
+                (channel_id, info['members_count'], info['description'], info['linked_chat_id'], int(time.time()))
+            )
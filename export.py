@@ -0,0 +1,211 @@
+import csv
+import json
+from datetime import datetime
+
+from telethon import utils
+
+from analyzer import format_sender_name, reactions_breakdown
+from media import extract_media_record
+
+# Форматы выгрузки сообщений
+EXPORT_FORMATS = ('jsonl', 'csv', 'parquet', 'xlsx')
+# Строк в одной группе строк Parquet
+PARQUET_ROW_GROUP_SIZE = 10_000
+# Наибольшее число строк листа Excel, включая заголовок
+XLSX_MAX_ROWS = 1_048_576
+
+# Поля выгружаемого сообщения в порядке столбцов
+EXPORT_FIELDS = (
+    'channel', 'id', 'date', 'text', 'views', 'reactions', 'reactions_detail',
+    'replies', 'sender_id', 'sender', 'forward_from_id', 'forward_from_name',
+    'forward_date', 'forward_post_id', 'media_kind', 'media_file_id', 'media_size',
+    'media_mime_type', 'media_url',
+)
+
+def extract_export_record(message, channel=None):
+    """Поля сообщения для выгрузки"""
+    breakdown = reactions_breakdown(message)
+    sender = getattr(message, 'sender', None)
+    fwd = getattr(message, 'fwd_from', None)
+    media = extract_media_record(message) or {}
+    return {
+        'channel': channel,
+        'id': message.id,
+        'date': message.date,
+        'text': message.message or '',
+        'views': getattr(message, 'views', None) or 0,
+        'reactions': sum(breakdown.values()),
+        'reactions_detail': json.dumps(breakdown, ensure_ascii=False) if breakdown else None,
+        'replies': message.replies.replies if getattr(message, 'replies', None) else 0,
+        'sender_id': message.sender_id,
+        'sender': format_sender_name(sender, message.sender_id) if sender is not None else None,
+        'forward_from_id': utils.get_peer_id(fwd.from_id) if fwd and fwd.from_id else None,
+        'forward_from_name': fwd.from_name if fwd else None,
+        'forward_date': fwd.date if fwd else None,
+        'forward_post_id': fwd.channel_post if fwd else None,
+        'media_kind': media.get('kind'),
+        'media_file_id': media.get('file_id'),
+        'media_size': media.get('size'),
+        'media_mime_type': media.get('mime_type'),
+        'media_url': media.get('url'),
+    }
+
+class ExportWriter:
+    """Потоковая запись сообщений в файл
+
+    Записи передаются по одной через write(); в памяти держится не больше
+    одной группы строк, поэтому потребление памяти не зависит от длины окна.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+
+    def write(self, record):
+        self.count += 1
+        self._write(record)
+
+    def _write(self, record):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class JsonlWriter(ExportWriter):
+    def __init__(self, path):
+        super().__init__(path)
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False, default=_json_default))
+        self._file.write('\n')
+
+    def close(self):
+        self._file.close()
+
+class CsvWriter(ExportWriter):
+    def __init__(self, path):
+        super().__init__(path)
+        self._file = open(path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=EXPORT_FIELDS)
+        self._writer.writeheader()
+
+    def _write(self, record):
+        self._writer.writerow({
+            key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in record.items()
+        })
+
+    def close(self):
+        self._file.close()
+
+class ParquetWriter(ExportWriter):
+    """Запись в Parquet группами строк по row_group_size"""
+
+    def __init__(self, path, row_group_size=PARQUET_ROW_GROUP_SIZE):
+        super().__init__(path)
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Для выгрузки в Parquet установите пакет pyarrow")
+        self._pa = pa
+        self._schema = pa.schema([
+            ('channel', pa.string()),
+            ('id', pa.int64()),
+            ('date', pa.timestamp('s', tz='UTC')),
+            ('text', pa.string()),
+            ('views', pa.int64()),
+            ('reactions', pa.int64()),
+            ('reactions_detail', pa.string()),
+            ('replies', pa.int64()),
+            ('sender_id', pa.int64()),
+            ('sender', pa.string()),
+            ('forward_from_id', pa.int64()),
+            ('forward_from_name', pa.string()),
+            ('forward_date', pa.timestamp('s', tz='UTC')),
+            ('forward_post_id', pa.int64()),
+            ('media_kind', pa.string()),
+            ('media_file_id', pa.int64()),
+            ('media_size', pa.int64()),
+            ('media_mime_type', pa.string()),
+            ('media_url', pa.string()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._rows = []
+        self.row_group_size = row_group_size
+
+    def _write(self, record):
+        self._rows.append(record)
+        if len(self._rows) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if self._rows:
+            self._writer.write_table(self._pa.Table.from_pylist(self._rows, schema=self._schema))
+            self._rows = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+class XlsxWriter(ExportWriter):
+    """Запись в XLSX в режиме constant_memory: строки сразу уходят на диск
+
+    Когда лист заполнен до max_rows строк (предел Excel), запись
+    продолжается на новом листе messages_2, messages_3 и т. д.
+    """
+
+    def __init__(self, path, max_rows=XLSX_MAX_ROWS):
+        super().__init__(path)
+        import xlsxwriter
+        self._workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'remove_timezone': True})
+        self._date_format = self._workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+        self.max_rows = max_rows
+        self._sheets = 0
+        self._add_sheet()
+
+    def _add_sheet(self):
+        self._sheets += 1
+        self._sheet = self._workbook.add_worksheet('messages' if self._sheets == 1 else f"messages_{self._sheets}")
+        self._sheet.write_row(0, 0, EXPORT_FIELDS)
+        self._row = 0
+
+    def _write(self, record):
+        if self._row + 1 >= self.max_rows:
+            self._add_sheet()
+        self._row += 1
+        row = self._row
+        for col, field in enumerate(EXPORT_FIELDS):
+            value = record.get(field)
+            if isinstance(value, datetime):
+                self._sheet.write_datetime(row, col, value, self._date_format)
+            elif value is not None:
+                self._sheet.write(row, col, value)
+
+    def close(self):
+        self._workbook.close()
+
+_WRITERS = {
+    'jsonl': JsonlWriter,
+    'csv': CsvWriter,
+    'parquet': ParquetWriter,
+    'xlsx': XlsxWriter,
+}
+
+def open_export_writer(path, export_format):
+    """Потоковый писатель для формата из EXPORT_FORMATS"""
+    if export_format not in _WRITERS:
+        raise ValueError(f"Неизвестный формат выгрузки: {export_format}")
+    return _WRITERS[export_format](path)
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
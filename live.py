@@ -0,0 +1,269 @@
+import heapq
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from telethon import events, utils
+from telethon.tl.types import PeerChannel
+
+from aggregation import DEFAULT_TIMEZONE
+from analyzer import extract_message_record, format_sender_name, get_channel_full_info, get_group_entity
+from comments import extract_comment_record
+
+# Сколько последних сообщений показывать в ленте
+LIVE_RECENT_SIZE = 50
+# Интервал обновления панели live-режима (секунды)
+LIVE_REFRESH_SECONDS = 2
+# Окно подсчета скорости поступления (секунды)
+LIVE_RATE_WINDOW = 60
+
+class LiveAggregates:
+    """Скользящие агрегаты, обновляемые по одному сообщению
+
+    Счетчики по дням и по отправителям меняются на разницу между старой
+    и новой версией сообщения, поэтому новые и отредактированные сообщения
+    учитываются за O(1), без пересчета окна. Обновления приходят из цикла
+    событий клиента, чтение — из потока интерфейса, доступ защищен блокировкой.
+    """
+
+    def __init__(self, days_count, tz=DEFAULT_TIMEZONE, recent_size=LIVE_RECENT_SIZE):
+        self.days_count = days_count
+        self.zone = ZoneInfo(tz)
+        self._lock = threading.Lock()
+        # день -> [сообщения, просмотры, реакции, ответы]
+        self._days = {}
+        # отправитель -> [сообщения, реакции]
+        self._senders = {}
+        self._names = {}
+        self._records = {}
+        self._window_start = None
+        self.comments = 0
+        self.recent = deque(maxlen=recent_size)
+        self._arrivals = deque()
+
+    def _day(self, date):
+        return date.astimezone(self.zone).strftime('%Y-%m-%d')
+
+    def _apply(self, record, sign):
+        day = self._days.setdefault(self._day(record['date']), [0, 0, 0, 0])
+        day[0] += sign
+        day[1] += sign * record['views']
+        day[2] += sign * record['reactions']
+        day[3] += sign * record['replies']
+        if record['sender_id']:
+            sender = self._senders.setdefault(record['sender_id'], [0, 0])
+            sender[0] += sign
+            sender[1] += sign * record['reactions']
+
+    def add(self, channel_id, record, sender_name=None, text=None, live=True):
+        """Учет нового или измененного сообщения канала"""
+        if record['date'] < datetime.now(timezone.utc) - timedelta(days=self.days_count):
+            return
+        key = (channel_id, record['id'])
+        with self._lock:
+            previous = self._records.get(key)
+            if previous is not None:
+                self._apply(previous, -1)
+            self._apply(record, 1)
+            self._records[key] = record
+            if sender_name and record['sender_id']:
+                self._names[record['sender_id']] = sender_name
+            if live and previous is None:
+                self._arrivals.append(time.monotonic())
+                self.recent.appendleft({
+                    'kind': 'post',
+                    'channel_id': channel_id,
+                    'id': record['id'],
+                    'date': record['date'],
+                    'sender': sender_name,
+                    'text': (text or '')[:200],
+                })
+
+    def add_comment(self, channel_id, comment, sender_name=None):
+        """Учет нового комментария"""
+        with self._lock:
+            self.comments += 1
+            self._arrivals.append(time.monotonic())
+            self.recent.appendleft({
+                'kind': 'comment',
+                'channel_id': channel_id,
+                'id': comment['id'],
+                'date': comment['date'],
+                'sender': sender_name,
+                'text': comment['text'][:200],
+            })
+
+    def _prune(self, window_start):
+        """Удаление сообщений, вышедших за начало окна"""
+        if self._window_start == window_start:
+            return
+        self._window_start = window_start
+        for key, record in list(self._records.items()):
+            if self._day(record['date']) < window_start:
+                self._apply(record, -1)
+                del self._records[key]
+        for day in [day for day in self._days if day < window_start]:
+            del self._days[day]
+        for sender_id in [sender_id for sender_id, counts in self._senders.items() if counts[0] <= 0]:
+            del self._senders[sender_id]
+            self._names.pop(sender_id, None)
+
+    def snapshot(self, top_n=10):
+        """Текущее состояние в формате статистики get_messages_stats"""
+        now = datetime.now(timezone.utc)
+        days = []
+        current = now - timedelta(days=self.days_count)
+        while current <= now:
+            days.append(self._day(current))
+            current += timedelta(days=1)
+        if days[-1] != self._day(now):
+            days.append(self._day(now))
+
+        with self._lock:
+            self._prune(days[0])
+            values = [self._days.get(day, [0, 0, 0, 0]) for day in days]
+            top_by_count = heapq.nlargest(top_n, self._senders.items(), key=lambda item: item[1][0])
+            top_by_reactions = heapq.nlargest(top_n, self._senders.items(), key=lambda item: item[1][1])
+            names = dict(self._names)
+            recent = list(self.recent)
+            comments = self.comments
+            cutoff = time.monotonic() - LIVE_RATE_WINDOW
+            while self._arrivals and self._arrivals[0] < cutoff:
+                self._arrivals.popleft()
+            last_minute = len(self._arrivals)
+
+        def series(column):
+            return {'dates': list(days), 'values': [value[column] for value in values]}
+
+        return {
+            'total_messages': sum(value[0] for value in values),
+            'total_views': sum(value[1] for value in values),
+            'total_reactions': sum(value[2] for value in values),
+            'total_replies': sum(value[3] for value in values),
+            'messages_per_day': series(0),
+            'views_per_day': series(1),
+            'reactions_per_day': series(2),
+            'replies_per_day': series(3),
+            'top_users': {
+                str(sender_id): {'name': names.get(sender_id, f"User {sender_id}"), 'count': counts[0]}
+                for sender_id, counts in top_by_count
+            },
+            'top_users_by_reactions': {
+                str(sender_id): {'name': names.get(sender_id, f"User {sender_id}"), 'reactions': counts[1]}
+                for sender_id, counts in top_by_reactions
+            },
+            'comments': comments,
+            'messages_last_minute': last_minute,
+            'recent': recent,
+        }
+
+class LiveMonitor:
+    """Прием новых постов и комментариев через события Telegram
+
+    Подписывается на NewMessage и MessageEdited каналов и их групп
+    обсуждения, сохраняет сообщения в хранилище (если оно передано)
+    и обновляет LiveAggregates. С entity_cache каналы и их группы
+    обсуждения берутся из кэша без запросов к Telegram.
+    """
+
+    def __init__(self, client, aggregates, store=None, entity_cache=None):
+        self.client = client
+        self.aggregates = aggregates
+        self.store = store
+        self.entity_cache = entity_cache
+        self.channels = {}
+        # Отмеченные ID чатов (как event.chat_id) -> ID канала
+        self._channel_peers = {}
+        self._discussion_peers = {}
+        # (чат обсуждения, ID копии поста) -> ID поста в канале
+        self._post_ids = {}
+        self._handlers = []
+        self.running = False
+
+    async def start(self, group_links, error_container):
+        """Подписка на каналы; возвращает число каналов, на которые удалось подписаться"""
+        window_start = datetime.now(timezone.utc) - timedelta(days=self.aggregates.days_count)
+        for group_link in group_links:
+            entity = await get_group_entity(self.client, group_link, error_container, entity_cache=self.entity_cache)
+            if entity is None:
+                continue
+            self.channels[entity.id] = entity
+            self._channel_peers[utils.get_peer_id(entity)] = entity.id
+
+            if getattr(entity, 'broadcast', False):
+                full_info = await get_channel_full_info(self.client, entity, entity_cache=self.entity_cache)
+                linked_chat_id = full_info['linked_chat_id']
+                if linked_chat_id:
+                    self._discussion_peers[utils.get_peer_id(PeerChannel(linked_chat_id))] = entity.id
+
+            # Начальное состояние окна берется из хранилища
+            if self.store is not None:
+                self.store.set_channel_info(entity.id, getattr(entity, 'title', None), getattr(entity, 'username', None))
+                for record in self.store.load_messages(entity.id, window_start, datetime.now(timezone.utc)):
+                    self.aggregates.add(entity.id, record, live=False)
+
+        chats = list(self._channel_peers) + list(self._discussion_peers)
+        if not chats:
+            return 0
+        self._handlers = [
+            (self._on_message, events.NewMessage(chats=chats)),
+            (self._on_message, events.MessageEdited(chats=chats)),
+        ]
+        for callback, event in self._handlers:
+            self.client.add_event_handler(callback, event)
+        self.running = True
+        return len(self.channels)
+
+    def stop(self):
+        for callback, event in self._handlers:
+            self.client.remove_event_handler(callback, event)
+        self._handlers = []
+        self.running = False
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    async def _on_message(self, event):
+        message = event.message
+        sender = getattr(message, 'sender', None)
+        sender_name = format_sender_name(sender, message.sender_id) if sender is not None else None
+
+        channel_id = self._channel_peers.get(event.chat_id)
+        if channel_id is not None:
+            record = extract_message_record(message)
+            if self.store is not None:
+                self.store.upsert_messages(channel_id, [record])
+            edited = isinstance(event, events.MessageEdited.Event)
+            self.aggregates.add(channel_id, record, sender_name, message.message, live=not edited)
+            return
+
+        channel_id = self._discussion_peers.get(event.chat_id)
+        if channel_id is None:
+            return
+        fwd = getattr(message, 'fwd_from', None)
+        if fwd is not None and fwd.channel_post:
+            # Автоматическая копия поста канала в группе обсуждения
+            self._post_ids[(event.chat_id, message.id)] = fwd.channel_post
+            return
+        reply_to = getattr(message, 'reply_to', None)
+        if reply_to is None or isinstance(event, events.MessageEdited.Event):
+            return
+
+        post_id = await self._resolve_post_id(event.chat_id, reply_to.reply_to_top_id or reply_to.reply_to_msg_id)
+        if post_id is None:
+            return
+        comment = extract_comment_record(message, post_id)
+        if self.store is not None:
+            self.store.upsert_comments(channel_id, [comment])
+        self.aggregates.add_comment(channel_id, comment, sender_name)
+
+    async def _resolve_post_id(self, chat_id, copy_id):
+        """ID поста канала по ID его копии в группе обсуждения"""
+        key = (chat_id, copy_id)
+        if key not in self._post_ids:
+            copy = await self.client.get_messages(chat_id, ids=copy_id)
+            fwd = getattr(copy, 'fwd_from', None) if copy else None
+            self._post_ids[key] = fwd.channel_post if fwd else None
+        return self._post_ids[key]
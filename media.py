@@ -0,0 +1,289 @@
+import asyncio
+import hashlib
+import json
+import mimetypes
+import os
+
+import telethon
+from telethon.tl import types
+
+from scheduler import FloodWaitGate, DEFAULT_FLOOD_RETRIES
+
+# Каталог загруженных медиафайлов по умолчанию
+DEFAULT_MEDIA_DIR = 'media'
+# Число одновременных загрузок
+DEFAULT_MEDIA_CONCURRENCY = 3
+# Наибольший размер загружаемого файла по умолчанию (байт)
+DEFAULT_MEDIA_MAX_SIZE = 20 * 1024 * 1024
+# Размер блока при вычислении хэша файла
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Типы медиа, которые определяются в сообщениях
+MEDIA_KINDS = (
+    'photo', 'video', 'video_note', 'gif', 'sticker', 'audio', 'voice',
+    'document', 'webpage', 'poll', 'geo', 'contact', 'other',
+)
+# Подписи типов медиа
+MEDIA_KIND_LABELS = {
+    'photo': "Фото", 'video': "Видео", 'video_note': "Видеосообщения", 'gif': "GIF",
+    'sticker': "Стикеры", 'audio': "Аудио", 'voice': "Голосовые", 'document': "Документы",
+    'webpage': "Превью ссылок", 'poll': "Опросы", 'geo': "Геопозиции", 'contact': "Контакты",
+    'other': "Прочее",
+}
+# Типы медиа, у которых есть файл для загрузки
+DOWNLOADABLE_KINDS = ('photo', 'video', 'video_note', 'gif', 'sticker', 'audio', 'voice', 'document')
+
+# Файл индекса загрузок в каталоге медиа: {ID файла Telegram: имя файла}
+_INDEX_FILE = 'index.json'
+_PARTIAL_DIR = '.partial'
+
+def _document_kind(document):
+    """Тип документа по его атрибутам"""
+    attributes = getattr(document, 'attributes', None) or []
+    for attribute in attributes:
+        if isinstance(attribute, types.DocumentAttributeSticker):
+            return 'sticker'
+    for attribute in attributes:
+        if isinstance(attribute, types.DocumentAttributeAnimated):
+            return 'gif'
+    for attribute in attributes:
+        if isinstance(attribute, types.DocumentAttributeVideo):
+            return 'video_note' if attribute.round_message else 'video'
+        if isinstance(attribute, types.DocumentAttributeAudio):
+            return 'voice' if attribute.voice else 'audio'
+    return 'document'
+
+def _largest_photo_size(photo):
+    """(размер в байтах, ширина, высота) самой большой версии фото"""
+    best = (None, None, None)
+    for size in getattr(photo, 'sizes', None) or []:
+        if isinstance(size, types.PhotoSize):
+            candidate = (size.size, size.w, size.h)
+        elif isinstance(size, types.PhotoSizeProgressive):
+            candidate = (max(size.sizes), size.w, size.h)
+        else:
+            continue
+        if best[0] is None or candidate[0] > best[0]:
+            best = candidate
+    return best
+
+def extract_media_record(message):
+    """Метаданные медиа сообщения; None, если медиа нет
+
+    Вычисляется по уже загруженному объекту сообщения, без запросов к Telegram.
+    """
+    media = getattr(message, 'media', None)
+    if media is None or isinstance(media, types.MessageMediaEmpty):
+        return None
+    record = {
+        'kind': 'other', 'file_id': None, 'size': None, 'mime_type': None,
+        'file_name': None, 'width': None, 'height': None, 'duration': None, 'url': None,
+    }
+    if isinstance(media, types.MessageMediaPhoto) and isinstance(media.photo, types.Photo):
+        size, width, height = _largest_photo_size(media.photo)
+        record.update(kind='photo', file_id=media.photo.id, size=size, mime_type='image/jpeg', width=width, height=height)
+    elif isinstance(media, types.MessageMediaDocument) and isinstance(media.document, types.Document):
+        document = media.document
+        record.update(kind=_document_kind(document), file_id=document.id, size=document.size, mime_type=document.mime_type)
+        for attribute in document.attributes:
+            if isinstance(attribute, types.DocumentAttributeFilename):
+                record['file_name'] = attribute.file_name
+            elif isinstance(attribute, (types.DocumentAttributeVideo, types.DocumentAttributeImageSize)):
+                record.update(width=attribute.w, height=attribute.h)
+                record['duration'] = getattr(attribute, 'duration', None)
+            elif isinstance(attribute, types.DocumentAttributeAudio):
+                record['duration'] = attribute.duration
+    elif isinstance(media, types.MessageMediaWebPage):
+        record.update(kind='webpage', url=getattr(media.webpage, 'url', None))
+    elif isinstance(media, types.MessageMediaPoll):
+        record['kind'] = 'poll'
+    elif isinstance(media, (types.MessageMediaGeo, types.MessageMediaGeoLive, types.MessageMediaVenue)):
+        record['kind'] = 'geo'
+    elif isinstance(media, types.MessageMediaContact):
+        record['kind'] = 'contact'
+    return record
+
+def _file_extension(media_record):
+    if media_record['kind'] == 'photo':
+        return '.jpg'
+    if media_record['file_name'] and '.' in media_record['file_name']:
+        return os.path.splitext(media_record['file_name'])[1].lower()
+    return mimetypes.guess_extension(media_record['mime_type'] or '') or ''
+
+def _file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as media_file:
+        for block in iter(lambda: media_file.read(HASH_BLOCK_SIZE), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+class MediaDownloader:
+    """Фоновая загрузка медиафайлов пулом воркеров
+
+    submit() только проверяет ограничения и ставит сообщение в очередь,
+    поэтому не задерживает обход сообщений; файлы загружаются не более
+    concurrency одновременно. Один файл Telegram (по ID) загружается один раз,
+    в том числе между запусками (индекс в каталоге), а файлы хранятся под
+    именем SHA-256 содержимого, так что одинаковые файлы с разными ID
+    занимают место один раз. Ссылки на файлы в сообщении действуют только
+    для загрузившего его аккаунта, поэтому с пулом аккаунтов в submit()
+    передается клиент, получивший сообщение: файл загружается им, а пауза
+    после FloodWait у каждого аккаунта своя. Использование:
+
+        async with MediaDownloader(client, 'media') as downloader:
+            ... downloader.submit(message) ...
+        downloader.stats
+    """
+
+    def __init__(self, client, directory=DEFAULT_MEDIA_DIR, concurrency=DEFAULT_MEDIA_CONCURRENCY,
+                 max_size=DEFAULT_MEDIA_MAX_SIZE, kinds=DOWNLOADABLE_KINDS, max_retries=DEFAULT_FLOOD_RETRIES):
+        self.client = client
+        self.directory = directory
+        self.concurrency = concurrency
+        self.max_size = max_size
+        self.kinds = set(kinds) & set(DOWNLOADABLE_KINDS)
+        self.max_retries = max_retries
+        self.stats = {
+            'queued': 0, 'downloaded': 0, 'cached': 0, 'duplicates': 0,
+            'skipped': 0, 'failed': 0, 'bytes': 0,
+        }
+        self.files = []
+        self.errors = []
+        self._index = {}
+        self._seen = set()
+        self._queue = None
+        self._workers = []
+        # Паузы после FloodWait по клиентам аккаунтов
+        self._gates = {}
+
+    def _load_index(self):
+        path = os.path.join(self.directory, _INDEX_FILE)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as index_file:
+                self._index = {int(file_id): name for file_id, name in json.load(index_file).items()}
+
+    def _save_index(self):
+        path = os.path.join(self.directory, _INDEX_FILE)
+        with open(path + '.tmp', 'w', encoding='utf-8') as index_file:
+            json.dump({str(file_id): name for file_id, name in self._index.items()}, index_file)
+        os.replace(path + '.tmp', path)
+
+    def start(self):
+        os.makedirs(os.path.join(self.directory, _PARTIAL_DIR), exist_ok=True)
+        self._load_index()
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    def submit(self, message, channel=None, media_record=None, client=None):
+        """Постановка медиа сообщения в очередь; False, если файл не загружается
+
+        Файл пропускается, если его тип не выбран, размер больше max_size
+        или файл с тем же ID уже загружен либо ожидает загрузки. client —
+        аккаунт, которым получено сообщение (по умолчанию основной).
+        """
+        media_record = media_record or extract_media_record(message)
+        if media_record is None or media_record['kind'] not in self.kinds:
+            return False
+        file_id = media_record['file_id']
+        if media_record['size'] is not None and media_record['size'] > self.max_size:
+            self.stats['skipped'] += 1
+            return False
+        if file_id in self._seen:
+            self.stats['duplicates'] += 1
+            return False
+        self._seen.add(file_id)
+        name = self._index.get(file_id)
+        if name is not None and os.path.exists(os.path.join(self.directory, name)):
+            self.stats['cached'] += 1
+            self._add_file(message, channel, media_record, name)
+            return False
+        self.stats['queued'] += 1
+        self._queue.put_nowait((message, channel, media_record, client or self.client))
+        return True
+
+    def _add_file(self, message, channel, media_record, name):
+        self.files.append({
+            'channel': channel,
+            'message_id': message.id,
+            'kind': media_record['kind'],
+            'file_id': media_record['file_id'],
+            'path': os.path.join(self.directory, name),
+        })
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._download(*item)
+            except Exception as e:
+                self.stats['failed'] += 1
+                self.errors.append((item[2]['file_id'], str(e)))
+            finally:
+                self._queue.task_done()
+
+    async def _download(self, message, channel, media_record, client):
+        partial = os.path.join(self.directory, _PARTIAL_DIR, str(media_record['file_id']))
+        gate = self._gates.get(id(client))
+        if gate is None:
+            gate = self._gates[id(client)] = FloodWaitGate()
+        attempt = 0
+        while True:
+            await gate.wait()
+            try:
+                # Telethon может добавить к имени расширение, поэтому берется возвращенный путь
+                partial = await client.download_media(message, file=partial)
+                break
+            except telethon.errors.FloodWaitError as e:
+                gate.block(e.seconds)
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+        if partial is None:
+            raise RuntimeError("Медиа сообщения недоступно для загрузки")
+
+        # Хэш считается в потоке, чтобы чтение файла не останавливало цикл событий
+        loop = asyncio.get_running_loop()
+        digest = await loop.run_in_executor(None, _file_sha256, partial)
+        size = os.path.getsize(partial)
+        name = digest + _file_extension(media_record)
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            os.remove(partial)
+            self.stats['cached'] += 1
+        else:
+            os.replace(partial, path)
+            self.stats['downloaded'] += 1
+            self.stats['bytes'] += size
+        self._index[media_record['file_id']] = name
+        self._add_file(message, channel, media_record, name)
+
+    async def close(self):
+        """Ожидание загрузки всех файлов очереди и остановка воркеров"""
+        if self._queue is None:
+            return
+        await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._save_index()
+
+    async def abort(self):
+        """Остановка воркеров без ожидания незагруженных файлов (после ошибки)"""
+        if self._queue is None:
+            return
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._save_index()
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.close()
+        else:
+            await self.abort()
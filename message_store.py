@@ -0,0 +1,1168 @@
+import json
+import sqlite3
+from datetime import datetime, timezone
+
+from text_search import build_match_query, index_terms
+
+# Путь к локальному хранилищу сообщений по умолчанию
+DEFAULT_STORE_PATH = 'messages.db'
+# Наибольшее число результатов поиска по умолчанию
+DEFAULT_SEARCH_LIMIT = 100
+# Число строк в топах источников и получателей репостов по умолчанию
+DEFAULT_REPOST_LIMIT = 20
+
+# Типы документов полнотекстового индекса
+SEARCH_KINDS = {'post': 0, 'comment': 1}
+
+# Типы связи репоста с источником
+REPOST_KINDS = {'forward': 0, 'link': 1}
+
+# Шаги агрегатов по времени: часы и сутки UTC (длина шага в секундах)
+ROLLUP_GRAINS = {'hour': 3600, 'day': 86400}
+# Счетчики почасовых и суточных агрегатов в порядке столбцов таблицы rollups
+ROLLUP_COUNTERS = ('messages', 'views', 'reactions', 'replies')
+
+# Поля метаданных медиа в порядке столбцов таблицы media
+MEDIA_FIELDS = ('kind', 'file_id', 'size', 'mime_type', 'file_name', 'width', 'height', 'duration', 'url')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    channel_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    date INTEGER NOT NULL,
+    views INTEGER NOT NULL DEFAULT 0,
+    reactions INTEGER NOT NULL DEFAULT 0,
+    replies INTEGER NOT NULL DEFAULT 0,
+    sender_id INTEGER,
+    updated_at INTEGER NOT NULL,
+    text TEXT,
+    reactions_detail TEXT,
+    PRIMARY KEY (channel_id, message_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_messages_channel_date ON messages (channel_id, date);
+
+CREATE TABLE IF NOT EXISTS media (
+    channel_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    file_id INTEGER,
+    size INTEGER,
+    mime_type TEXT,
+    file_name TEXT,
+    width INTEGER,
+    height INTEGER,
+    duration REAL,
+    url TEXT,
+    PRIMARY KEY (channel_id, message_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_media_file ON media (file_id);
+
+CREATE TABLE IF NOT EXISTS reposts (
+    channel_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    source_id INTEGER NOT NULL,
+    source_username TEXT NOT NULL,
+    kind INTEGER NOT NULL,
+    source_post_id INTEGER,
+    date INTEGER NOT NULL,
+    lag INTEGER,
+    PRIMARY KEY (channel_id, message_id, source_id, source_username)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_reposts_source_post ON reposts (source_id, source_username, source_post_id);
+
+CREATE TABLE IF NOT EXISTS repost_edges (
+    channel_id INTEGER NOT NULL,
+    source_id INTEGER NOT NULL,
+    source_username TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    forwards INTEGER NOT NULL,
+    lag_count INTEGER NOT NULL,
+    lag_sum INTEGER NOT NULL,
+    lag_min INTEGER,
+    first_date INTEGER NOT NULL,
+    last_date INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, source_id, source_username)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_repost_edges_source ON repost_edges (source_id, source_username, count);
+
+CREATE TABLE IF NOT EXISTS rollups (
+    channel_id INTEGER NOT NULL,
+    grain INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    messages INTEGER NOT NULL,
+    views INTEGER NOT NULL,
+    reactions INTEGER NOT NULL,
+    replies INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, grain, bucket)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_authors (
+    channel_id INTEGER NOT NULL,
+    grain INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    sender_id INTEGER NOT NULL,
+    messages INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, grain, bucket, sender_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_reactions (
+    channel_id INTEGER NOT NULL,
+    grain INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    reaction TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, grain, bucket, reaction)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS comments (
+    channel_id INTEGER NOT NULL,
+    post_id INTEGER NOT NULL,
+    comment_id INTEGER NOT NULL,
+    date INTEGER NOT NULL,
+    sender_id INTEGER,
+    reply_to_id INTEGER,
+    reactions INTEGER NOT NULL DEFAULT 0,
+    text TEXT,
+    updated_at INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, post_id, comment_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS comment_threads (
+    channel_id INTEGER NOT NULL,
+    post_id INTEGER NOT NULL,
+    last_comment_id INTEGER NOT NULL,
+    replies_seen INTEGER NOT NULL,
+    synced_at INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, post_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS backfill_jobs (
+    channel_id INTEGER PRIMARY KEY,
+    start_date INTEGER NOT NULL,
+    min_id INTEGER NOT NULL,
+    max_id INTEGER NOT NULL,
+    created_at INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS backfill_chunks (
+    channel_id INTEGER NOT NULL,
+    low_id INTEGER NOT NULL,
+    high_id INTEGER NOT NULL,
+    cursor_id INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    messages INTEGER NOT NULL DEFAULT 0,
+    views INTEGER NOT NULL DEFAULT 0,
+    reactions INTEGER NOT NULL DEFAULT 0,
+    replies INTEGER NOT NULL DEFAULT 0,
+    updated_at INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, low_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS channels (
+    channel_id INTEGER PRIMARY KEY,
+    title TEXT,
+    username TEXT,
+    updated_at INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS search_docs (
+    doc_id INTEGER PRIMARY KEY,
+    kind INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    post_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    date INTEGER NOT NULL,
+    UNIQUE (channel_id, kind, post_id, message_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_search_docs_date ON search_docs (date);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    terms,
+    content = '',
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    channel_id INTEGER PRIMARY KEY,
+    high_water_id INTEGER NOT NULL,
+    covered_from INTEGER NOT NULL,
+    synced_at INTEGER NOT NULL
+);
+"""
+
+def _to_timestamp(value):
+    """Перевод datetime в unix-время (секунды)"""
+    return int(value.timestamp())
+
+def _from_timestamp(value):
+    """Перевод unix-времени в datetime с часовым поясом UTC"""
+    return datetime.fromtimestamp(value, tz=timezone.utc)
+
+def _now_timestamp():
+    return int(datetime.now(timezone.utc).timestamp())
+
+def _rollup_ranges(start_date, end_date):
+    """Диапазоны агрегатов для периода: [(код шага, первый, последний номер)]
+
+    Полные сутки внутри периода берутся из суточных агрегатов, неполные
+    сутки на краях — из часовых. Границы периода округляются до часа.
+    """
+    hour, day = ROLLUP_GRAINS['hour'], ROLLUP_GRAINS['day']
+    hours_per_day = day // hour
+    first_hour = _to_timestamp(start_date) // hour
+    last_hour = _to_timestamp(end_date) // hour
+    first_day = -(-first_hour // hours_per_day)
+    end_day = (last_hour + 1) // hours_per_day
+    if first_day >= end_day:
+        return [(0, first_hour, last_hour)] if first_hour <= last_hour else []
+    ranges = [(1, first_day, end_day - 1)]
+    if first_hour < first_day * hours_per_day:
+        ranges.append((0, first_hour, first_day * hours_per_day - 1))
+    if end_day * hours_per_day <= last_hour:
+        ranges.append((0, end_day * hours_per_day, last_hour))
+    return ranges
+
+class MessageStore:
+    """Локальное хранилище сообщений в SQLite
+
+    Сообщения хранятся по ключу (channel_id, message_id) с индексом по дате,
+    для каждого канала запоминается high-water mark — последний загруженный ID
+    и дата, начиная с которой история канала загружена без пропусков.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self._migrate()
+        self.conn.commit()
+
+    def _migrate(self):
+        """Добавление столбцов, появившихся после создания файла хранилища"""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(messages)")}
+        for column in ('text', 'reactions_detail'):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE messages ADD COLUMN {column} TEXT")
+        # Агрегаты для хранилищ, созданных до их появления
+        if (
+            self.conn.execute("SELECT 1 FROM rollups LIMIT 1").fetchone() is None
+            and self.conn.execute("SELECT 1 FROM messages LIMIT 1").fetchone() is not None
+        ):
+            self._rebuild_rollups()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def upsert_messages(self, channel_id, records):
+        """Запись пачки сообщений; существующие строки обновляются"""
+        with self.conn:
+            self._upsert_messages(channel_id, records)
+
+    def _upsert_messages(self, channel_id, records):
+        """Запись сообщений и обновление поискового индекса для изменившихся текстов
+
+        Записи без поля text (или с text=None) текст в хранилище не меняют,
+        то же для reactions_detail — числа реакций по типам (хранится в JSON).
+        Метаданные медиа (поле media) заменяются, если поле есть в записи;
+        новые источники репостов (поле reposts) добавляются в граф репостов.
+        Почасовые и суточные агрегаты изменяются на разницу с сохраненными значениями.
+        """
+        updated_at = _now_timestamp()
+        rows = [
+            (
+                channel_id,
+                record['id'],
+                _to_timestamp(record['date']),
+                record['views'],
+                record['reactions'],
+                record['replies'],
+                record['sender_id'],
+                updated_at,
+                record.get('text'),
+                json.dumps(record['reactions_detail'], ensure_ascii=False) if record.get('reactions_detail') is not None else None,
+            )
+            for record in records
+        ]
+        old_rows = self._load_rows(
+            "SELECT message_id, text, views, reactions, replies, reactions_detail FROM messages WHERE channel_id = ? AND message_id IN ({})",
+            channel_id,
+            [record['id'] for record in records]
+        )
+        old_texts = {message_id: row[0] for message_id, row in old_rows.items()}
+        self._update_rollups(channel_id, records, old_rows)
+        self.conn.executemany(
+            """
+            INSERT INTO messages (channel_id, message_id, date, views, reactions, replies, sender_id, updated_at, text, reactions_detail)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (channel_id, message_id) DO UPDATE SET
+                views = excluded.views,
+                reactions = excluded.reactions,
+                replies = excluded.replies,
+                updated_at = excluded.updated_at,
+                text = COALESCE(excluded.text, messages.text),
+                reactions_detail = COALESCE(excluded.reactions_detail, messages.reactions_detail)
+            """,
+            rows
+        )
+        self._upsert_media(channel_id, records)
+        self._insert_reposts(channel_id, records)
+        for record in records:
+            text = record.get('text')
+            if text is not None and text != old_texts.get(record['id']):
+                self._index_document(SEARCH_KINDS['post'], channel_id, 0, record['id'], record['date'], old_texts.get(record['id']), text)
+
+    def _update_rollups(self, channel_id, records, old_rows):
+        """Изменение агрегатов на разницу между записями и сохраненными строками
+
+        old_rows — {ID: (text, views, reactions, replies, reactions_detail)}
+        до записи. Новое сообщение добавляет себя в агрегаты часа и суток
+        своей даты (и в число сообщений автора), у сохраненного учитывается
+        только изменение просмотров, реакций и ответов.
+        """
+        counters = {}
+        authors = {}
+        reactions = {}
+        for record in records:
+            timestamp = _to_timestamp(record['date'])
+            buckets = [(grain, timestamp // step) for grain, step in enumerate(ROLLUP_GRAINS.values())]
+            detail = record.get('reactions_detail')
+            old = old_rows.get(record['id'])
+            if old is None:
+                delta = (1, record['views'], record['reactions'], record['replies'])
+                detail_delta = dict(detail or {})
+                if record['sender_id']:
+                    for bucket in buckets:
+                        key = (*bucket, record['sender_id'])
+                        authors[key] = authors.get(key, 0) + 1
+                old_detail = None
+            else:
+                delta = (0, record['views'] - old[1], record['reactions'] - old[2], record['replies'] - old[3])
+                old_detail = json.loads(old[4]) if old[4] else {}
+                detail_delta = {}
+                if detail is not None:
+                    for reaction in detail.keys() | old_detail.keys():
+                        detail_delta[reaction] = detail.get(reaction, 0) - old_detail.get(reaction, 0)
+            for bucket in buckets:
+                if any(delta):
+                    total = counters.setdefault(bucket, [0] * len(ROLLUP_COUNTERS))
+                    for i, value in enumerate(delta):
+                        total[i] += value
+                for reaction, count in detail_delta.items():
+                    if count:
+                        key = (*bucket, reaction)
+                        reactions[key] = reactions.get(key, 0) + count
+            # Повтор того же сообщения в пачке считается от только что учтенных значений
+            stored_detail = detail if detail is not None else old_detail
+            old_rows[record['id']] = (
+                record.get('text') if record.get('text') is not None else (old[0] if old else None),
+                record['views'], record['reactions'], record['replies'],
+                json.dumps(stored_detail) if stored_detail else None,
+            )
+
+        self.conn.executemany(
+            f"""
+            INSERT INTO rollups (channel_id, grain, bucket, {', '.join(ROLLUP_COUNTERS)}) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (channel_id, grain, bucket) DO UPDATE SET
+                {', '.join(f'{column} = {column} + excluded.{column}' for column in ROLLUP_COUNTERS)}
+            """,
+            [(channel_id, *bucket, *total) for bucket, total in counters.items()]
+        )
+        self.conn.executemany(
+            """
+            INSERT INTO rollup_authors (channel_id, grain, bucket, sender_id, messages) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (channel_id, grain, bucket, sender_id) DO UPDATE SET messages = messages + excluded.messages
+            """,
+            [(channel_id, *key, count) for key, count in authors.items()]
+        )
+        self.conn.executemany(
+            """
+            INSERT INTO rollup_reactions (channel_id, grain, bucket, reaction, count) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (channel_id, grain, bucket, reaction) DO UPDATE SET count = count + excluded.count
+            """,
+            [(channel_id, *key, count) for key, count in reactions.items()]
+        )
+        # Реакции, которые сняли полностью, не хранятся
+        self.conn.executemany(
+            "DELETE FROM rollup_reactions WHERE channel_id = ? AND grain = ? AND bucket = ? AND reaction = ? AND count <= 0",
+            [(channel_id, *key) for key, count in reactions.items() if count < 0]
+        )
+
+    def _rebuild_rollups(self):
+        """Пересчет всех агрегатов по сохраненным сообщениям"""
+        for table in ('rollups', 'rollup_authors', 'rollup_reactions'):
+            self.conn.execute(f"DELETE FROM {table}")
+        for grain, step in enumerate(ROLLUP_GRAINS.values()):
+            self.conn.execute(
+                f"""
+                INSERT INTO rollups (channel_id, grain, bucket, {', '.join(ROLLUP_COUNTERS)})
+                SELECT channel_id, ?, date / ?, COUNT(*), SUM(views), SUM(reactions), SUM(replies)
+                FROM messages GROUP BY channel_id, date / ?
+                """,
+                (grain, step, step)
+            )
+            self.conn.execute(
+                """
+                INSERT INTO rollup_authors (channel_id, grain, bucket, sender_id, messages)
+                SELECT channel_id, ?, date / ?, sender_id, COUNT(*)
+                FROM messages WHERE sender_id IS NOT NULL AND sender_id != 0
+                GROUP BY channel_id, date / ?, sender_id
+                """,
+                (grain, step, step)
+            )
+            self.conn.execute(
+                """
+                INSERT INTO rollup_reactions (channel_id, grain, bucket, reaction, count)
+                SELECT m.channel_id, ?, m.date / ?, r.key, SUM(r.value)
+                FROM messages m, json_each(m.reactions_detail) r
+                WHERE m.reactions_detail IS NOT NULL
+                GROUP BY m.channel_id, m.date / ?, r.key
+                HAVING SUM(r.value) > 0
+                """,
+                (grain, step, step)
+            )
+
+    def rebuild_rollups(self):
+        """Перестроение агрегатов по времени по всем сохраненным сообщениям
+
+        При обычной работе агрегаты обновляются вместе с записью сообщений.
+        """
+        with self.conn:
+            self._rebuild_rollups()
+
+    def _upsert_media(self, channel_id, records):
+        """Запись метаданных медиа; у сообщений без медиа строка удаляется"""
+        media_records = [record for record in records if 'media' in record]
+        self.conn.executemany(
+            f"""
+            INSERT OR REPLACE INTO media (channel_id, message_id, {', '.join(MEDIA_FIELDS)})
+            VALUES (?, ?, {', '.join('?' * len(MEDIA_FIELDS))})
+            """,
+            [
+                (channel_id, record['id'], *(record['media'][field] for field in MEDIA_FIELDS))
+                for record in media_records if record['media'] is not None
+            ]
+        )
+        self.conn.executemany(
+            "DELETE FROM media WHERE channel_id = ? AND message_id = ?",
+            [(channel_id, record['id']) for record in media_records if record['media'] is None]
+        )
+
+    def _insert_reposts(self, channel_id, records):
+        """Добавление новых репостов и пересчет ребер графа только по ним
+
+        Источник задается ID канала (source_id) или, если канал известен
+        только по ссылке t.me/username, username при source_id = 0; такие
+        источники переводятся на ID в set_channel_info. Ссылки канала
+        на самого себя не учитываются.
+        """
+        records = [record for record in records if record.get('reposts')]
+        if not records:
+            return
+        usernames = {
+            source['source_username'] for record in records for source in record['reposts']
+            if source['source_id'] is None and source['source_username']
+        }
+        ids_by_username = self._channel_ids_by_username(usernames)
+        existing = set()
+        ids = [record['id'] for record in records]
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            existing.update(self.conn.execute(
+                f"SELECT message_id, source_id, source_username FROM reposts WHERE channel_id = ? AND message_id IN ({','.join('?' * len(chunk))})",
+                [channel_id, *chunk]
+            ))
+
+        rows = []
+        edges = {}
+        for record in records:
+            date = _to_timestamp(record['date'])
+            for source in record['reposts']:
+                source_id = source['source_id'] or ids_by_username.get(source['source_username'], 0)
+                username = '' if source_id else source['source_username']
+                key = (record['id'], source_id, username)
+                if source_id == channel_id or key in existing:
+                    continue
+                existing.add(key)
+                source_date = source['source_date']
+                if source_date is None and source_id and source['source_post_id']:
+                    row = self.conn.execute(
+                        "SELECT date FROM messages WHERE channel_id = ? AND message_id = ?",
+                        (source_id, source['source_post_id'])
+                    ).fetchone()
+                    source_date = _from_timestamp(row[0]) if row else None
+                lag = max(0, date - _to_timestamp(source_date)) if source_date is not None else None
+                forward = source['kind'] == 'forward'
+                rows.append((channel_id, record['id'], source_id, username, REPOST_KINDS[source['kind']], source['source_post_id'], date, lag))
+
+                edge = edges.setdefault((source_id, username), [0, 0, 0, 0, None, date, date])
+                edge[0] += 1
+                edge[1] += forward
+                if lag is not None:
+                    edge[2] += 1
+                    edge[3] += lag
+                    edge[4] = lag if edge[4] is None else min(edge[4], lag)
+                edge[5] = min(edge[5], date)
+                edge[6] = max(edge[6], date)
+
+        self.conn.executemany(
+            """
+            INSERT INTO reposts (channel_id, message_id, source_id, source_username, kind, source_post_id, date, lag)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows
+        )
+        self.conn.executemany(
+            """
+            INSERT INTO repost_edges (channel_id, source_id, source_username, count, forwards, lag_count, lag_sum, lag_min, first_date, last_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (channel_id, source_id, source_username) DO UPDATE SET
+                count = count + excluded.count,
+                forwards = forwards + excluded.forwards,
+                lag_count = lag_count + excluded.lag_count,
+                lag_sum = lag_sum + excluded.lag_sum,
+                lag_min = MIN(COALESCE(lag_min, excluded.lag_min), COALESCE(excluded.lag_min, lag_min)),
+                first_date = MIN(first_date, excluded.first_date),
+                last_date = MAX(last_date, excluded.last_date)
+            """,
+            [(channel_id, source_id, username, *edge) for (source_id, username), edge in edges.items()]
+        )
+
+    def _channel_ids_by_username(self, usernames):
+        """ID сохраненных каналов по username (в нижнем регистре)"""
+        if not usernames:
+            return {}
+        usernames = list(usernames)
+        cursor = self.conn.execute(
+            f"SELECT LOWER(username), channel_id FROM channels WHERE LOWER(username) IN ({','.join('?' * len(usernames))})",
+            usernames
+        )
+        return dict(cursor.fetchall())
+
+    def _resolve_repost_username(self, channel_id, username):
+        """Перевод репостов со ссылкой на username канала на его ID
+
+        Ребра канала-источника пересчитываются по репостам целиком.
+        """
+        username = username.lower()
+        if self.conn.execute(
+            "SELECT 1 FROM reposts WHERE source_id = 0 AND source_username = ? LIMIT 1", (username,)
+        ).fetchone() is None:
+            return
+        self.conn.execute(
+            "UPDATE OR IGNORE reposts SET source_id = ?, source_username = '' WHERE source_id = 0 AND source_username = ?",
+            (channel_id, username)
+        )
+        self.conn.execute("DELETE FROM reposts WHERE source_id = 0 AND source_username = ?", (username,))
+        # Задержка ссылок считается по сохраненной дате исходного поста
+        self.conn.execute(
+            """
+            UPDATE reposts SET lag = MAX(0, date - (
+                SELECT m.date FROM messages m WHERE m.channel_id = reposts.source_id AND m.message_id = reposts.source_post_id
+            ))
+            WHERE source_id = ? AND source_username = '' AND lag IS NULL AND source_post_id IS NOT NULL
+            """,
+            (channel_id,)
+        )
+        self.conn.execute("DELETE FROM reposts WHERE channel_id = ? AND source_id = ?", (channel_id, channel_id))
+        self.conn.execute(
+            "DELETE FROM repost_edges WHERE (source_id = 0 AND source_username = ?) OR (source_id = ? AND source_username = '')",
+            (username, channel_id)
+        )
+        self.conn.execute(
+            """
+            INSERT INTO repost_edges (channel_id, source_id, source_username, count, forwards, lag_count, lag_sum, lag_min, first_date, last_date)
+            SELECT channel_id, source_id, '', COUNT(*), SUM(kind = ?), COUNT(lag), COALESCE(SUM(lag), 0), MIN(lag), MIN(date), MAX(date)
+            FROM reposts
+            WHERE source_id = ? AND source_username = ''
+            GROUP BY channel_id
+            """,
+            (REPOST_KINDS['forward'], channel_id)
+        )
+
+    def _load_rows(self, sql, channel_id, ids):
+        """Сохраненные строки по ID: {id: остальные столбцы}; sql содержит {} для списка ID"""
+        rows = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            for message_id, *row in self.conn.execute(sql.format(','.join('?' * len(chunk))), [channel_id, *chunk]):
+                rows[message_id] = row
+        return rows
+
+    def _load_texts(self, sql, channel_id, ids, *params):
+        """Сохраненные тексты по ID: {id: текст}; sql содержит {} для списка ID"""
+        texts = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            cursor = self.conn.execute(sql.format(','.join('?' * len(chunk))), [channel_id, *params, *chunk])
+            texts.update(cursor.fetchall())
+        return texts
+
+    def _index_document(self, kind, channel_id, post_id, message_id, date, old_text, text):
+        """Замена документа в полнотекстовом индексе
+
+        Индекс без собственного хранения текста (contentless FTS5): для удаления
+        старой версии ее основы вычисляются заново из прежнего текста.
+        """
+        row = self.conn.execute(
+            "SELECT doc_id FROM search_docs WHERE channel_id = ? AND kind = ? AND post_id = ? AND message_id = ?",
+            (channel_id, kind, post_id, message_id)
+        ).fetchone()
+        if row is not None and old_text:
+            self.conn.execute(
+                "INSERT INTO search_index (search_index, rowid, terms) VALUES ('delete', ?, ?)",
+                (row[0], index_terms(old_text))
+            )
+        terms = index_terms(text)
+        if not terms:
+            if row is not None:
+                self.conn.execute("DELETE FROM search_docs WHERE doc_id = ?", (row[0],))
+            return
+        if row is None:
+            doc_id = self.conn.execute(
+                "INSERT INTO search_docs (kind, channel_id, post_id, message_id, date) VALUES (?, ?, ?, ?, ?)",
+                (kind, channel_id, post_id, message_id, _to_timestamp(date))
+            ).lastrowid
+        else:
+            doc_id = row[0]
+        self.conn.execute("INSERT INTO search_index (rowid, terms) VALUES (?, ?)", (doc_id, terms))
+
+    def load_messages(self, channel_id, start_date, end_date, with_text=False):
+        """Сообщения канала за период в порядке возрастания ID
+
+        С with_text=True в записях также текст и reactions_detail (для анализа текста).
+        Метаданные медиа возвращаются в поле media (None, если медиа нет).
+        """
+        cursor = self.conn.execute(
+            f"""
+            SELECT m.message_id, m.date, m.views, m.reactions, m.replies, m.sender_id, m.text, m.reactions_detail,
+                {', '.join('media.' + field for field in MEDIA_FIELDS)}
+            FROM messages m
+            LEFT JOIN media ON media.channel_id = m.channel_id AND media.message_id = m.message_id
+            WHERE m.channel_id = ? AND m.date >= ? AND m.date <= ?
+            ORDER BY m.message_id
+            """,
+            (channel_id, _to_timestamp(start_date), _to_timestamp(end_date))
+        )
+        records = []
+        for message_id, date, views, reactions, replies, sender_id, text, reactions_detail, *media in cursor:
+            record = {
+                'id': message_id,
+                'date': _from_timestamp(date),
+                'views': views,
+                'reactions': reactions,
+                'replies': replies,
+                'sender_id': sender_id,
+                'media': dict(zip(MEDIA_FIELDS, media)) if media[0] is not None else None,
+            }
+            if with_text:
+                record['text'] = text or ''
+                record['reactions_detail'] = json.loads(reactions_detail) if reactions_detail else {}
+            records.append(record)
+        return records
+
+    def get_last_id_before(self, channel_id, date):
+        """ID последнего сохраненного сообщения раньше указанной даты"""
+        row = self.conn.execute(
+            "SELECT MAX(message_id) FROM messages WHERE channel_id = ? AND date < ?",
+            (channel_id, _to_timestamp(date))
+        ).fetchone()
+        return row[0]
+
+    def get_sync_state(self, channel_id):
+        """Состояние синхронизации канала или None, если канал не загружался"""
+        row = self.conn.execute(
+            "SELECT high_water_id, covered_from, synced_at FROM sync_state WHERE channel_id = ?",
+            (channel_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'high_water_id': row[0],
+            'covered_from': _from_timestamp(row[1]),
+            'synced_at': _from_timestamp(row[2]),
+        }
+
+    def set_sync_state(self, channel_id, high_water_id, covered_from):
+        """Сохранение high-water mark и начала непрерывно загруженной истории"""
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO sync_state (channel_id, high_water_id, covered_from, synced_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (channel_id) DO UPDATE SET
+                    high_water_id = excluded.high_water_id,
+                    covered_from = excluded.covered_from,
+                    synced_at = excluded.synced_at
+                """,
+                (channel_id, high_water_id, _to_timestamp(covered_from), _now_timestamp())
+            )
+
+    def get_backfill_job(self, channel_id):
+        """Задание дозагрузки истории канала или None"""
+        row = self.conn.execute(
+            "SELECT start_date, min_id, max_id, created_at FROM backfill_jobs WHERE channel_id = ?",
+            (channel_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'start_date': _from_timestamp(row[0]),
+            'min_id': row[1],
+            'max_id': row[2],
+            'created_at': _from_timestamp(row[3]),
+        }
+
+    def save_backfill_job(self, channel_id, start_date, min_id, max_id, chunks):
+        """Создание или расширение задания вниз по истории новыми диапазонами chunks
+
+        chunks — список (low_id, high_id): в диапазон входят сообщения
+        с low_id < id <= high_id. Уже существующие диапазоны не меняются.
+        """
+        now = _now_timestamp()
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO backfill_jobs (channel_id, start_date, min_id, max_id, created_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (channel_id) DO UPDATE SET
+                    start_date = excluded.start_date,
+                    min_id = excluded.min_id
+                """,
+                (channel_id, _to_timestamp(start_date), min_id, max_id, now)
+            )
+            self.conn.executemany(
+                """
+                INSERT OR IGNORE INTO backfill_chunks (channel_id, low_id, high_id, cursor_id, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [(channel_id, low_id, high_id, low_id, now) for low_id, high_id in chunks]
+            )
+
+    def get_backfill_chunks(self, channel_id):
+        """Диапазоны задания дозагрузки с контрольными точками в порядке ID"""
+        cursor = self.conn.execute(
+            """
+            SELECT low_id, high_id, cursor_id, done, messages, views, reactions, replies
+            FROM backfill_chunks
+            WHERE channel_id = ?
+            ORDER BY low_id
+            """,
+            (channel_id,)
+        )
+        return [
+            {
+                'low_id': low_id,
+                'high_id': high_id,
+                'cursor_id': cursor_id,
+                'done': bool(done),
+                'messages': messages,
+                'views': views,
+                'reactions': reactions,
+                'replies': replies,
+            }
+            for low_id, high_id, cursor_id, done, messages, views, reactions, replies in cursor
+        ]
+
+    def checkpoint_backfill_chunk(self, channel_id, low_id, records, cursor_id, done=False):
+        """Запись пачки сообщений диапазона вместе с его контрольной точкой
+
+        Сообщения, позиция и частичные итоги диапазона сохраняются в одной
+        транзакции, поэтому после сбоя загрузка продолжается ровно с cursor_id.
+        """
+        with self.conn:
+            self._upsert_messages(channel_id, records)
+            self.conn.execute(
+                """
+                UPDATE backfill_chunks SET
+                    cursor_id = ?,
+                    done = ?,
+                    messages = messages + ?,
+                    views = views + ?,
+                    reactions = reactions + ?,
+                    replies = replies + ?,
+                    updated_at = ?
+                WHERE channel_id = ? AND low_id = ?
+                """,
+                (
+                    cursor_id,
+                    int(done),
+                    len(records),
+                    sum(record['views'] for record in records),
+                    sum(record['reactions'] for record in records),
+                    sum(record['replies'] for record in records),
+                    _now_timestamp(),
+                    channel_id,
+                    low_id,
+                )
+            )
+
+    def upsert_comments(self, channel_id, records):
+        """Запись пачки комментариев; существующие строки обновляются"""
+        updated_at = _now_timestamp()
+        rows = [
+            (
+                channel_id,
+                record['post_id'],
+                record['id'],
+                _to_timestamp(record['date']),
+                record['sender_id'],
+                record['reply_to_id'],
+                record['reactions'],
+                record['text'],
+                updated_at,
+            )
+            for record in records
+        ]
+        old_texts = {}
+        for post_id in {record['post_id'] for record in records}:
+            texts = self._load_texts(
+                "SELECT comment_id, text FROM comments WHERE channel_id = ? AND post_id = ? AND comment_id IN ({})",
+                channel_id,
+                [record['id'] for record in records if record['post_id'] == post_id],
+                post_id
+            )
+            old_texts.update(((post_id, comment_id), text) for comment_id, text in texts.items())
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT INTO comments (channel_id, post_id, comment_id, date, sender_id, reply_to_id, reactions, text, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (channel_id, post_id, comment_id) DO UPDATE SET
+                    reactions = excluded.reactions,
+                    text = excluded.text,
+                    updated_at = excluded.updated_at
+                """,
+                rows
+            )
+            for record in records:
+                old_text = old_texts.get((record['post_id'], record['id']))
+                if record['text'] != old_text:
+                    self._index_document(
+                        SEARCH_KINDS['comment'], channel_id, record['post_id'], record['id'],
+                        record['date'], old_text, record['text'] or ''
+                    )
+
+    def load_comments(self, channel_id, post_ids):
+        """Комментарии к указанным постам в порядке (post_id, comment_id)"""
+        post_ids = list(post_ids)
+        comments = []
+        for i in range(0, len(post_ids), 500):
+            chunk = post_ids[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            cursor = self.conn.execute(
+                f"""
+                SELECT post_id, comment_id, date, sender_id, reply_to_id, reactions, text
+                FROM comments
+                WHERE channel_id = ? AND post_id IN ({placeholders})
+                """,
+                [channel_id, *chunk]
+            )
+            comments.extend(
+                {
+                    'post_id': post_id,
+                    'id': comment_id,
+                    'date': _from_timestamp(date),
+                    'sender_id': sender_id,
+                    'reply_to_id': reply_to_id,
+                    'reactions': reactions,
+                    'text': text,
+                }
+                for post_id, comment_id, date, sender_id, reply_to_id, reactions, text in cursor
+            )
+        comments.sort(key=lambda comment: (comment['post_id'], comment['id']))
+        return comments
+
+    def set_channel_info(self, channel_id, title, username=None):
+        """Название канала для фильтров и результатов поиска"""
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO channels (channel_id, title, username, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (channel_id) DO UPDATE SET
+                    title = excluded.title,
+                    username = excluded.username,
+                    updated_at = excluded.updated_at
+                """,
+                (channel_id, title, username, _now_timestamp())
+            )
+            if username:
+                self._resolve_repost_username(channel_id, username)
+
+    def get_channels(self):
+        """Сохраненные сведения о каналах: [{'id', 'title', 'username'}]"""
+        cursor = self.conn.execute("SELECT channel_id, title, username FROM channels ORDER BY title")
+        return [{'id': channel_id, 'title': title, 'username': username} for channel_id, title, username in cursor]
+
+    def list_channels(self):
+        """Каналы, по которым есть сохраненные сообщения: {ID: название}"""
+        cursor = self.conn.execute(
+            """
+            SELECT s.channel_id, COALESCE(c.title, CAST(s.channel_id AS TEXT))
+            FROM (SELECT DISTINCT channel_id FROM rollups) s
+            LEFT JOIN channels c ON c.channel_id = s.channel_id
+            ORDER BY 2
+            """
+        )
+        return dict(cursor.fetchall())
+
+    def _rollup_query(self, table, columns, channel_ids, ranges):
+        """Объединение строк таблицы агрегатов по диапазонам (код шага, первый, последний)"""
+        channel_ids = list(channel_ids)
+        parts = []
+        params = []
+        for grain, first, last in ranges:
+            parts.append(
+                f"SELECT {columns} FROM {table} "
+                f"WHERE channel_id IN ({','.join('?' * len(channel_ids))}) AND grain = ? AND bucket BETWEEN ? AND ?"
+            )
+            params.extend([*channel_ids, grain, first, last])
+        return ' UNION ALL '.join(parts), params
+
+    def rollup_totals(self, channel_ids, start_date, end_date):
+        """Итоги каналов за период по агрегатам, без чтения сообщений
+
+        Возвращает messages, views, reactions, replies, authors (число разных
+        авторов во всех каналах) и reactions_by_type ({реакция: количество}
+        по убыванию). Границы периода учитываются с точностью до часа.
+        """
+        totals = dict.fromkeys(ROLLUP_COUNTERS, 0)
+        totals.update(authors=0, reactions_by_type={})
+        ranges = _rollup_ranges(start_date, end_date)
+        channel_ids = list(channel_ids)
+        if not ranges or not channel_ids:
+            return totals
+        sql, params = self._rollup_query('rollups', ', '.join(ROLLUP_COUNTERS), channel_ids, ranges)
+        row = self.conn.execute(
+            f"SELECT {', '.join(f'COALESCE(SUM({column}), 0)' for column in ROLLUP_COUNTERS)} FROM ({sql})",
+            params
+        ).fetchone()
+        totals.update(zip(ROLLUP_COUNTERS, row))
+        sql, params = self._rollup_query('rollup_authors', 'sender_id', channel_ids, ranges)
+        totals['authors'] = self.conn.execute(f"SELECT COUNT(DISTINCT sender_id) FROM ({sql})", params).fetchone()[0]
+        sql, params = self._rollup_query('rollup_reactions', 'reaction, count', channel_ids, ranges)
+        totals['reactions_by_type'] = dict(self.conn.execute(
+            f"SELECT reaction, SUM(count) FROM ({sql}) GROUP BY reaction HAVING SUM(count) > 0 ORDER BY 2 DESC",
+            params
+        ).fetchall())
+        return totals
+
+    def rollup_hours(self, channel_ids, start_date, end_date):
+        """Почасовые агрегаты каналов за период (суммы по каналам)
+
+        Возвращает столбцы {'date': [начало часа, unix-время], 'messages': [...], ...}
+        в порядке времени; часы без сообщений пропускаются.
+        """
+        step = ROLLUP_GRAINS['hour']
+        ranges = [(0, _to_timestamp(start_date) // step, _to_timestamp(end_date) // step)]
+        sql, params = self._rollup_query('rollups', 'bucket, ' + ', '.join(ROLLUP_COUNTERS), channel_ids, ranges)
+        rows = self.conn.execute(
+            f"SELECT bucket * ?, {', '.join(f'SUM({column})' for column in ROLLUP_COUNTERS)} FROM ({sql}) GROUP BY bucket ORDER BY bucket",
+            [step, *params]
+        ).fetchall()
+        columns = ('date', *ROLLUP_COUNTERS)
+        return {column: list(values) for column, values in zip(columns, zip(*rows))} if rows else {column: [] for column in columns}
+
+    def rollup_hour_authors(self, channel_ids, start_date, end_date):
+        """Авторы по часам за период: {'date': [начало часа], 'sender_id': [...]}"""
+        step = ROLLUP_GRAINS['hour']
+        ranges = [(0, _to_timestamp(start_date) // step, _to_timestamp(end_date) // step)]
+        sql, params = self._rollup_query('rollup_authors', 'bucket, sender_id', channel_ids, ranges)
+        rows = self.conn.execute(f"SELECT DISTINCT bucket * ?, sender_id FROM ({sql})", [step, *params]).fetchall()
+        return {'date': [row[0] for row in rows], 'sender_id': [row[1] for row in rows]}
+
+    def _repost_edges(self, where, params, limit):
+        cursor = self.conn.execute(
+            f"""
+            SELECT e.channel_id, target.title, e.source_id, e.source_username, source.title,
+                e.count, e.forwards, e.lag_count, e.lag_sum, e.lag_min, e.first_date, e.last_date
+            FROM repost_edges e
+            LEFT JOIN channels source ON e.source_id != 0 AND source.channel_id = e.source_id
+            LEFT JOIN channels target ON target.channel_id = e.channel_id
+            WHERE {where}
+            ORDER BY e.count DESC
+            LIMIT ?
+            """,
+            (*params, -1 if limit is None else limit)
+        )
+        return [
+            {
+                'target_id': target_id,
+                'target': target_title or str(target_id),
+                'source_id': source_id or None,
+                'source_username': source_username or None,
+                'source': source_title or (f"@{source_username}" if source_username else str(source_id)),
+                'count': count,
+                'forwards': forwards,
+                'links': count - forwards,
+                'avg_lag': lag_sum / lag_count if lag_count else None,
+                'min_lag': lag_min,
+                'first_date': _from_timestamp(first_date),
+                'last_date': _from_timestamp(last_date),
+            }
+            for (target_id, target_title, source_id, source_username, source_title,
+                 count, forwards, lag_count, lag_sum, lag_min, first_date, last_date) in cursor
+        ]
+
+    def top_repost_sources(self, channel_id, limit=DEFAULT_REPOST_LIMIT):
+        """Каналы, чьи посты канал пересылает или на которые ссылается, по убыванию числа репостов"""
+        return self._repost_edges("e.channel_id = ?", (channel_id,), limit)
+
+    def top_repost_targets(self, source_id, limit=DEFAULT_REPOST_LIMIT):
+        """Каналы, которые репостят канал source_id, по убыванию числа репостов"""
+        return self._repost_edges("e.source_id = ? AND e.source_username = ''", (source_id,), limit)
+
+    def get_repost_edges(self, channel_ids=None):
+        """Все ребра графа репостов; с channel_ids — только входящие в эти каналы"""
+        if channel_ids is None:
+            return self._repost_edges("1", (), None)
+        channel_ids = list(channel_ids)
+        return self._repost_edges(f"e.channel_id IN ({','.join('?' * len(channel_ids))})", channel_ids, None)
+
+    def repost_propagation(self, channel_id, post_id, max_depth=5):
+        """Путь распространения поста: репосты поста и репосты этих репостов
+
+        Возвращает шаги в порядке времени с глубиной (1 — прямой репост),
+        каналом, ID сообщения, типом связи и задержкой относительно
+        непосредственного источника.
+        """
+        kinds = {code: kind for kind, code in REPOST_KINDS.items()}
+        cursor = self.conn.execute(
+            """
+            WITH RECURSIVE path (depth, channel_id, message_id, kind, date, lag) AS (
+                SELECT 1, channel_id, message_id, kind, date, lag
+                FROM reposts
+                WHERE source_id = ? AND source_username = '' AND source_post_id = ?
+                UNION
+                SELECT path.depth + 1, r.channel_id, r.message_id, r.kind, r.date, r.lag
+                FROM path
+                JOIN reposts r ON r.source_id = path.channel_id AND r.source_username = '' AND r.source_post_id = path.message_id
+                WHERE path.depth < ?
+            )
+            SELECT path.depth, path.channel_id, c.title, path.message_id, path.kind, path.date, path.lag
+            FROM path
+            LEFT JOIN channels c ON c.channel_id = path.channel_id
+            ORDER BY path.date, path.depth
+            """,
+            (channel_id, post_id, max_depth)
+        )
+        return [
+            {
+                'depth': depth,
+                'channel_id': step_channel_id,
+                'channel': title,
+                'message_id': message_id,
+                'kind': kinds[kind],
+                'date': _from_timestamp(date),
+                'lag': lag,
+            }
+            for depth, step_channel_id, title, message_id, kind, date, lag in cursor
+        ]
+
+    def search(self, query, channel_ids=None, start_date=None, end_date=None, kinds=None, limit=DEFAULT_SEARCH_LIMIT, order='rank'):
+        """Полнотекстовый поиск по сохраненным постам и комментариям
+
+        query разбирается build_match_query (слова по основам, "фразы",
+        слово*, -слово). Фильтры по каналам, датам и типам ('post', 'comment')
+        необязательны; order — 'rank' (релевантность BM25) или 'date'
+        (сначала новые). Возвращает список словарей с текстом и названием канала.
+        """
+        match = build_match_query(query)
+        if match is None:
+            return []
+        conditions = ["search_index MATCH ?"]
+        params = [match]
+        if channel_ids:
+            conditions.append(f"d.channel_id IN ({','.join('?' * len(channel_ids))})")
+            params.extend(channel_ids)
+        if start_date is not None:
+            conditions.append("d.date >= ?")
+            params.append(_to_timestamp(start_date))
+        if end_date is not None:
+            conditions.append("d.date <= ?")
+            params.append(_to_timestamp(end_date))
+        if kinds:
+            conditions.append(f"d.kind IN ({','.join('?' * len(kinds))})")
+            params.extend(SEARCH_KINDS[kind] for kind in kinds)
+        params.append(limit)
+        order_by = "d.date DESC" if order == 'date' else "rank, d.date DESC"
+        cursor = self.conn.execute(
+            f"""
+            SELECT d.kind, d.channel_id, ch.title, d.post_id, d.message_id, d.date,
+                   COALESCE(m.text, c.text), bm25(search_index) AS rank
+            FROM search_index
+            JOIN search_docs d ON d.doc_id = search_index.rowid
+            LEFT JOIN messages m ON d.kind = 0 AND m.channel_id = d.channel_id AND m.message_id = d.message_id
+            LEFT JOIN comments c ON d.kind = 1 AND c.channel_id = d.channel_id AND c.post_id = d.post_id AND c.comment_id = d.message_id
+            LEFT JOIN channels ch ON ch.channel_id = d.channel_id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY {order_by}
+            LIMIT ?
+            """,
+            params
+        )
+        kind_names = {value: name for name, value in SEARCH_KINDS.items()}
+        return [
+            {
+                'kind': kind_names[kind],
+                'channel_id': channel_id,
+                'channel': title,
+                'post_id': post_id or message_id,
+                'id': message_id,
+                'date': _from_timestamp(date),
+                'text': text,
+                'rank': rank,
+            }
+            for kind, channel_id, title, post_id, message_id, date, text, rank in cursor
+        ]
+
+    def rebuild_search_index(self):
+        """Перестроение поискового индекса по всем сохраненным текстам
+
+        Нужно после изменения правил разбора текста; при обычной работе
+        индекс обновляется вместе с записью сообщений.
+        """
+        with self.conn:
+            self.conn.execute("INSERT INTO search_index (search_index) VALUES ('delete-all')")
+            self.conn.execute("DELETE FROM search_docs")
+            sources = (
+                (SEARCH_KINDS['post'], "SELECT channel_id, 0, message_id, date, text FROM messages WHERE text IS NOT NULL AND text != ''"),
+                (SEARCH_KINDS['comment'], "SELECT channel_id, post_id, comment_id, date, text FROM comments WHERE text IS NOT NULL AND text != ''"),
+            )
+            for kind, sql in sources:
+                for channel_id, post_id, message_id, date, text in self.conn.execute(sql).fetchall():
+                    self._index_document(kind, channel_id, post_id, message_id, _from_timestamp(date), None, text)
+
+    def get_thread_state(self, channel_id, post_id):
+        """Состояние загрузки ветки комментариев или None, если ветка не загружалась"""
+        row = self.conn.execute(
+            "SELECT last_comment_id, replies_seen FROM comment_threads WHERE channel_id = ? AND post_id = ?",
+            (channel_id, post_id)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'last_comment_id': row[0], 'replies_seen': row[1]}
+
+    def set_thread_state(self, channel_id, post_id, last_comment_id, replies_seen):
+        """Сохранение последнего загруженного комментария ветки"""
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO comment_threads (channel_id, post_id, last_comment_id, replies_seen, synced_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (channel_id, post_id) DO UPDATE SET
+                    last_comment_id = excluded.last_comment_id,
+                    replies_seen = excluded.replies_seen,
+                    synced_at = excluded.synced_at
+                """,
+                (channel_id, post_id, last_comment_id, replies_seen, _now_timestamp())
+            )
@@ -0,0 +1,187 @@
+import contextvars
+import json
+import time
+from contextlib import contextmanager
+
+# Сообщений на одной странице iter_messages (один запрос к API)
+TELEGRAM_PAGE_SIZE = 100
+
+# Этапы в порядке вывода и их подписи
+STAGES = {
+    'entity': "Поиск канала",
+    'full_channel': "GetFullChannelRequest",
+    'fetch': "Загрузка страниц",
+    'senders': "Имена отправителей",
+    'aggregation': "Агрегирование",
+    'render': "Отрисовка",
+}
+
+# Замеры задачи, в которой выполняются запросы к API (см. FetchMetrics.track)
+_current_metrics = contextvars.ContextVar('fetch_metrics', default=None)
+
+def count_api_call(count=1):
+    """Учет отправленных запросов в замерах текущей задачи, если они отслеживаются"""
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.api_calls += count
+
+def instrument_client(client):
+    """Подсчет всех запросов клиента Telethon в замерах задачи, которая их отправила
+
+    Перехватывается TelegramClient._call, через который проходят все
+    запросы, включая страницы iter_messages и загрузку файлов.
+    """
+    if getattr(client, '_metrics_instrumented', False):
+        return client
+    call = client._call
+
+    async def counted_call(sender, request, *args, **kwargs):
+        count_api_call(len(request) if isinstance(request, (list, tuple)) else 1)
+        return await call(sender, request, *args, **kwargs)
+
+    client._call = counted_call
+    client._metrics_instrumented = True
+    return client
+
+class FetchMetrics:
+    """Замеры одного запуска: время этапов, сообщения, запросы к API, FloodWait
+
+    Передается явно, как хранилище и кэш отправителей; функции, которым
+    он не передан, создают собственный и результат не сохраняют.
+    Запросы считаются по-настоящему: клиент, подготовленный
+    instrument_client, учитывает каждый запрос в замерах, включенных
+    track() в текущей задаче (и в задачах, запущенных из нее).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        # этап -> [секунды, число замеров]
+        self.stages = {}
+        self.messages = 0
+        self.expected_messages = None
+        self.api_calls = 0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0
+
+    @contextmanager
+    def stage(self, name):
+        """Замер времени этапа"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timing = self.stages.setdefault(name, [0.0, 0])
+            timing[0] += time.perf_counter() - start
+            timing[1] += 1
+
+    @contextmanager
+    def track(self):
+        """Учет запросов к API, отправленных в этом блоке, в этих замерах"""
+        token = _current_metrics.set(self)
+        try:
+            yield self
+        finally:
+            _current_metrics.reset(token)
+
+    def add_messages(self, messages):
+        """Учет загруженных сообщений"""
+        self.messages += messages
+
+    def expect(self, min_id, max_id):
+        """Оценка числа сообщений окна по разнице граничных ID"""
+        self.expected_messages = (self.expected_messages or 0) + max(0, max_id - min_id - 1)
+
+    def flood_wait(self, seconds):
+        self.flood_waits += 1
+        self.flood_wait_seconds += seconds
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def messages_per_second(self):
+        fetch_seconds = self.stages.get('fetch', [0.0])[0]
+        return self.messages / fetch_seconds if fetch_seconds else 0.0
+
+    def merge(self, other):
+        """Добавление замеров другого запуска (итог по нескольким каналам)"""
+        for name, (seconds, count) in other.stages.items():
+            timing = self.stages.setdefault(name, [0.0, 0])
+            timing[0] += seconds
+            timing[1] += count
+        self.messages += other.messages
+        if other.expected_messages is not None:
+            self.expected_messages = (self.expected_messages or 0) + other.expected_messages
+        self.api_calls += other.api_calls
+        self.flood_waits += other.flood_waits
+        self.flood_wait_seconds += other.flood_wait_seconds
+
+    def to_dict(self):
+        return {
+            'elapsed_seconds': round(self.elapsed, 3),
+            'messages': self.messages,
+            'expected_messages': self.expected_messages,
+            'messages_per_second': round(self.messages_per_second, 1),
+            'api_calls': self.api_calls,
+            'flood_waits': self.flood_waits,
+            'flood_wait_seconds': self.flood_wait_seconds,
+            'stages': {
+                name: {'seconds': round(seconds, 3), 'count': count}
+                for name, (seconds, count) in sorted(self.stages.items(), key=lambda item: _stage_order(item[0]))
+            },
+        }
+
+def _stage_order(name):
+    names = list(STAGES)
+    return names.index(name) if name in names else len(names)
+
+def metrics_frame_rows(metrics):
+    """Строки таблицы этапов для интерфейса: этап, секунды, замеры"""
+    return [
+        {'stage': STAGES.get(name, name), 'seconds': timing['seconds'], 'count': timing['count']}
+        for name, timing in metrics['stages'].items()
+    ]
+
+def write_metrics_json(path, metrics_by_channel):
+    """Замеры по каналам в JSON: {канал: FetchMetrics.to_dict()}"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(metrics_by_channel, f, ensure_ascii=False, indent=2)
+    return path
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_prometheus(metrics_by_channel):
+    """Замеры по каналам в текстовом формате Prometheus (для node_exporter textfile)"""
+    gauges = [
+        ('tg_scraper_elapsed_seconds', "Время анализа канала", 'elapsed_seconds'),
+        ('tg_scraper_messages', "Загружено сообщений", 'messages'),
+        ('tg_scraper_expected_messages', "Оценка числа сообщений окна", 'expected_messages'),
+        ('tg_scraper_messages_per_second', "Скорость загрузки сообщений", 'messages_per_second'),
+        ('tg_scraper_api_calls', "Запросов к API Telegram", 'api_calls'),
+        ('tg_scraper_flood_waits', "Число FloodWait", 'flood_waits'),
+        ('tg_scraper_flood_wait_seconds', "Суммарное ожидание FloodWait", 'flood_wait_seconds'),
+    ]
+    lines = []
+    for metric, description, key in gauges:
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} gauge")
+        for channel, metrics in metrics_by_channel.items():
+            if metrics.get(key) is not None:
+                lines.append(f'{metric}{{channel="{_escape_label(channel)}"}} {metrics[key]}')
+    lines.append("# HELP tg_scraper_stage_seconds Время этапа анализа")
+    lines.append("# TYPE tg_scraper_stage_seconds gauge")
+    for channel, metrics in metrics_by_channel.items():
+        for name, timing in metrics['stages'].items():
+            lines.append(f'tg_scraper_stage_seconds{{channel="{_escape_label(channel)}",stage="{name}"}} {timing["seconds"]}')
+    return "\n".join(lines) + "\n"
+
+def write_metrics_prometheus(path, metrics_by_channel):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(format_prometheus(metrics_by_channel))
+    return path
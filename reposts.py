@@ -0,0 +1,151 @@
+"""Граф репостов между каналами по локальному хранилищу
+
+Примеры:
+    python -m reposts --channel news              # откуда канал берет посты
+    python -m reposts --channel news --targets    # кто репостит канал
+    python -m reposts --post news/1234            # путь распространения поста
+
+Ребра графа (источник -> канал: число репостов и задержка) обновляются
+при записи сообщений в хранилище, поэтому запросы не пересчитывают
+их по сообщениям. Источники — пересылки (fwd_from) и ссылки t.me на
+посты и каналы.
+"""
+import argparse
+import re
+import sys
+
+from telethon.tl import types
+
+from message_store import MessageStore, DEFAULT_STORE_PATH, DEFAULT_REPOST_LIMIT
+
+# Глубина поиска пути распространения поста по умолчанию
+DEFAULT_PROPAGATION_DEPTH = 5
+
+# Ссылки t.me на канал или пост: t.me/name, t.me/name/123, t.me/s/name/123, t.me/c/123456/789
+_TME_LINK_RE = re.compile(
+    r"(?:https?://)?(?:t\.me|telegram\.me|telegram\.dog)/(?:c/(\d+)|(?:s/)?([A-Za-z][A-Za-z0-9_]{3,31}))(?:/(\d+))?",
+    re.IGNORECASE
+)
+# Служебные пути t.me, которые не являются каналами
+_TME_RESERVED = frozenset({'joinchat', 'addstickers', 'addemoji', 'share', 'proxy', 'socks', 'iv', 'login', 'setlanguage', 'addlist', 'boost'})
+
+def _link_sources(text):
+    """Источники из ссылок t.me: [(ID канала или None, username или None, ID поста или None)]"""
+    sources = []
+    for channel_id, username, post_id in _TME_LINK_RE.findall(text or ''):
+        if username and username.lower() in _TME_RESERVED:
+            continue
+        sources.append((
+            int(channel_id) if channel_id else None,
+            username.lower() if username else None,
+            int(post_id) if post_id else None,
+        ))
+    return sources
+
+def extract_repost_sources(message):
+    """Источники репоста в сообщении: пересылка из канала и ссылки t.me
+
+    Возвращает список словарей kind ('forward' или 'link'), source_id,
+    source_username, source_post_id, source_date (дата исходного поста,
+    если известна). Вычисляется по уже загруженному сообщению.
+    """
+    sources = []
+    fwd = getattr(message, 'fwd_from', None)
+    if fwd is not None and isinstance(getattr(fwd, 'from_id', None), types.PeerChannel):
+        sources.append({
+            'kind': 'forward',
+            'source_id': fwd.from_id.channel_id,
+            'source_username': None,
+            'source_post_id': fwd.channel_post,
+            'source_date': fwd.date,
+        })
+
+    texts = [getattr(message, 'message', None) or '']
+    for entity in getattr(message, 'entities', None) or []:
+        if isinstance(entity, types.MessageEntityTextUrl):
+            texts.append(entity.url)
+    seen = set()
+    for text in texts:
+        for source_id, username, post_id in _link_sources(text):
+            if (source_id, username) in seen:
+                continue
+            seen.add((source_id, username))
+            sources.append({
+                'kind': 'link',
+                'source_id': source_id,
+                'source_username': username,
+                'source_post_id': post_id,
+                'source_date': None,
+            })
+    return sources
+
+def format_lag(seconds):
+    """Задержка репоста в читаемом виде"""
+    if seconds is None:
+        return "—"
+    seconds = int(seconds)
+    if seconds < 3600:
+        return f"{seconds // 60} мин"
+    if seconds < 86400:
+        return f"{seconds / 3600:.1f} ч"
+    return f"{seconds / 86400:.1f} дн"
+
+def _resolve_channel(store, name):
+    """ID канала по ID, названию или @username из хранилища"""
+    name = name.lstrip('@').lower()
+    for channel in store.get_channels():
+        if name in (str(channel['id']), (channel['title'] or '').lower(), (channel['username'] or '').lower()):
+            return channel['id']
+    if name.lstrip('-').isdigit():
+        return int(name)
+    return None
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m reposts', description="Граф репостов между каналами")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--channel', help="Канал: ID, название или @username")
+    group.add_argument('--post', help="Пост в виде канал/ID для пути распространения")
+    parser.add_argument('--targets', action='store_true', help="Каналы, которые репостят канал, вместо его источников")
+    parser.add_argument('--depth', type=int, default=DEFAULT_PROPAGATION_DEPTH, help="Глубина пути распространения")
+    parser.add_argument('--limit', type=int, default=DEFAULT_REPOST_LIMIT)
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help="Локальное хранилище сообщений")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    with MessageStore(args.store) as store:
+        if args.post:
+            name, _, post_id = args.post.rpartition('/')
+            channel_id = _resolve_channel(store, name)
+            if channel_id is None or not post_id.isdigit():
+                print("Укажите пост в виде канал/ID", file=sys.stderr)
+                return 2
+            steps = store.repost_propagation(channel_id, int(post_id), args.depth)
+            for step in steps:
+                print(
+                    f"{'  ' * (step['depth'] - 1)}{step['date']:%Y-%m-%d %H:%M} "
+                    f"{step['channel'] or step['channel_id']} #{step['message_id']} "
+                    f"({step['kind']}, +{format_lag(step['lag'])})"
+                )
+            print(f"Репостов: {len(steps)}", file=sys.stderr)
+            return 0
+
+        channel_id = _resolve_channel(store, args.channel)
+        if channel_id is None:
+            print("Канал не найден в хранилище", file=sys.stderr)
+            return 2
+        if args.targets:
+            edges = store.top_repost_targets(channel_id, args.limit)
+            key = 'target'
+        else:
+            edges = store.top_repost_sources(channel_id, args.limit)
+            key = 'source'
+    for edge in edges:
+        print(
+            f"{edge['count']:>6}  {edge[key]}  "
+            f"средняя задержка {format_lag(edge['avg_lag'])}, последний {edge['last_date']:%Y-%m-%d}"
+        )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
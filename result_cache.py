@@ -0,0 +1,55 @@
+from collections import OrderedDict
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+# Максимальное число результатов анализа в кэше одной сессии
+DEFAULT_RESULT_CACHE_SIZE = 32
+
+def make_result_key(channel_id, days_count, tz, last_message_id, *options):
+    """Ключ результата анализа канала
+
+    Результат действителен, пока в канале не появилось новое сообщение
+    (last_message_id) и не сменились сутки в часовом поясе анализа — иначе
+    окно сдвигается. options — прочие параметры, влияющие на результат.
+    """
+    today = datetime.now(ZoneInfo(tz)).date()
+    return (channel_id, days_count, tz, last_message_id, today, *options)
+
+class ResultCache:
+    """LRU-кэш результатов анализа с ограничением числа записей
+
+    Первый элемент ключа — ID канала, по нему записи можно сбросить
+    выборочно. Значения не копируются: получатель не должен их изменять.
+    """
+
+    def __init__(self, max_entries=DEFAULT_RESULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, channel_id=None):
+        """Сброс записей канала или всего кэша, если channel_id не указан"""
+        if channel_id is None:
+            self._entries.clear()
+            return
+        for key in [key for key in self._entries if key[0] == channel_id]:
+            del self._entries[key]
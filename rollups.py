@@ -0,0 +1,134 @@
+"""Показатели сохраненных сообщений за любой период без обращения к Telegram
+
+Примеры:
+    python -m rollups news --days 7                        # по дням за неделю
+    python -m rollups news --days 2 --period hour          # по часам
+    python -m rollups news --days 7 --compare previous     # неделя к прошлой неделе
+    python -m rollups news other --since 2024-01-01 --until 2024-03-31 --compare channels
+
+Почасовые и суточные агрегаты (сообщения, просмотры, реакции по типам,
+ответы, авторы) обновляются при записи сообщений в хранилище, поэтому
+период, набор каналов и сравнения считаются по ним, а не по сообщениям.
+Границы периода учитываются с точностью до часа.
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from aggregation import DEFAULT_TIMEZONE, PERIODS, aggregate_rollup_periods
+from message_store import MessageStore, DEFAULT_STORE_PATH
+from search import parse_date, resolve_channel_ids
+
+# Показатели агрегатов и их подписи
+ROLLUP_METRICS = {
+    'messages': "Сообщения",
+    'views': "Просмотры",
+    'reactions': "Реакции",
+    'replies': "Ответы",
+    'authors': "Авторы",
+}
+
+def rollup_frame(store, channel_ids, start_date, end_date, period='day', tz=DEFAULT_TIMEZONE):
+    """Показатели каналов по периодам окна; индекс — начало периода в часовом поясе tz"""
+    return aggregate_rollup_periods(
+        store.rollup_hours(channel_ids, start_date, end_date),
+        store.rollup_hour_authors(channel_ids, start_date, end_date),
+        start_date, end_date, period, tz
+    )
+
+def previous_period(start_date, end_date):
+    """Период той же длины, который заканчивается перед start_date"""
+    return start_date - (end_date - start_date), start_date - timedelta(seconds=1)
+
+def change_percent(current, previous):
+    """Изменение в процентах; None, если в предыдущем периоде был ноль"""
+    if not previous:
+        return None
+    return round((current - previous) / previous * 100, 1)
+
+def compare_periods(store, channel_ids, start_date, end_date, previous_start=None, previous_end=None):
+    """Итоги каналов за период и за предыдущий период той же длины
+
+    Возвращает {'current': итоги, 'previous': итоги} в формате
+    MessageStore.rollup_totals; предыдущий период можно задать явно.
+    """
+    if previous_start is None:
+        previous_start, previous_end = previous_period(start_date, end_date)
+    return {
+        'current': store.rollup_totals(channel_ids, start_date, end_date),
+        'previous': store.rollup_totals(channel_ids, previous_start, previous_end),
+    }
+
+def build_period_comparison_frame(comparison):
+    """Таблица сравнения периодов: показатели и реакции по типам"""
+    current, previous = comparison['current'], comparison['previous']
+    rows = [(label, current[metric], previous[metric]) for metric, label in ROLLUP_METRICS.items()]
+    reactions = dict.fromkeys([*current['reactions_by_type'], *previous['reactions_by_type']])
+    rows.extend(
+        (f"Реакция {reaction}", current['reactions_by_type'].get(reaction, 0), previous['reactions_by_type'].get(reaction, 0))
+        for reaction in reactions
+    )
+    return pd.DataFrame({
+        'Показатель': [row[0] for row in rows],
+        'Период': [row[1] for row in rows],
+        'Предыдущий период': [row[2] for row in rows],
+        'Изменение': [row[1] - row[2] for row in rows],
+        'Изменение, %': [change_percent(row[1], row[2]) for row in rows],
+    })
+
+def build_channels_comparison_frame(store, channel_ids, start_date, end_date, titles=None):
+    """Таблица сравнения каналов за период: показатели и изменение к предыдущему периоду"""
+    titles = titles or {}
+    previous_start, previous_end = previous_period(start_date, end_date)
+    rows = []
+    for channel_id in channel_ids:
+        current = store.rollup_totals([channel_id], start_date, end_date)
+        previous = store.rollup_totals([channel_id], previous_start, previous_end)
+        row = {'Канал': titles.get(channel_id, str(channel_id))}
+        row.update((label, current[metric]) for metric, label in ROLLUP_METRICS.items())
+        row['Сообщения, изм. %'] = change_percent(current['messages'], previous['messages'])
+        row['Просмотры, изм. %'] = change_percent(current['views'], previous['views'])
+        row['Топ реакция'] = next(iter(current['reactions_by_type']), None)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m rollups', description="Показатели сохраненных сообщений по периодам")
+    parser.add_argument('channels', nargs='+', help="Каналы: ID, название или @username")
+    parser.add_argument('--days', type=int, default=7, help="Последние N дней (если не заданы --since/--until)")
+    parser.add_argument('--since', type=parse_date, help="Начало периода YYYY-MM-DD")
+    parser.add_argument('--until', type=parse_date, help="Конец периода YYYY-MM-DD (включительно)")
+    parser.add_argument('--period', choices=tuple(PERIODS), default='day', help="Шаг ряда показателей")
+    parser.add_argument('--compare', choices=('previous', 'channels'), help="Сравнение с предыдущим периодом или каналов между собой")
+    parser.add_argument('--tz', default=DEFAULT_TIMEZONE, help="Часовой пояс границ периодов")
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help="Локальное хранилище сообщений")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    end_date = args.until + timedelta(days=1) - timedelta(seconds=1) if args.until else datetime.now(timezone.utc)
+    start_date = args.since or end_date - timedelta(days=args.days)
+    with MessageStore(args.store) as store:
+        channel_ids = resolve_channel_ids(store, args.channels)
+        if not channel_ids:
+            print("Каналы не найдены в хранилище", file=sys.stderr)
+            return 2
+        if args.compare == 'previous':
+            frame = build_period_comparison_frame(compare_periods(store, channel_ids, start_date, end_date))
+            index = False
+        elif args.compare == 'channels':
+            titles = {channel['id']: channel['title'] for channel in store.get_channels()}
+            frame = build_channels_comparison_frame(store, channel_ids, start_date, end_date, titles)
+            index = False
+        else:
+            frame = rollup_frame(store, channel_ids, start_date, end_date, args.period, args.tz)
+            frame.index = frame.index.strftime(PERIODS[args.period][1])
+            frame = frame.rename(columns=ROLLUP_METRICS)
+            index = True
+    print(frame.to_string(index=index))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import asyncio
+
+import telethon
+
+# Число каналов, обрабатываемых одновременно
+DEFAULT_CONCURRENCY = 5
+# Число повторов задачи после FloodWaitError
+DEFAULT_FLOOD_RETRIES = 3
+
+class FloodWaitGate:
+    """Общая для всех воркеров пауза после FloodWaitError
+
+    Если Telegram потребовал подождать, новые запросы не отправляет ни один
+    воркер, пока не истечет время ожидания.
+    """
+
+    def __init__(self):
+        self._resume_at = 0.0
+
+    def block(self, seconds):
+        loop = asyncio.get_running_loop()
+        self._resume_at = max(self._resume_at, loop.time() + seconds)
+
+    async def wait(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = self._resume_at - loop.time()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+class ErrorCollector:
+    """Сборщик сообщений об ошибках с интерфейсом error_container
+
+    Используется вместо общего контейнера Streamlit, когда несколько
+    задач выполняются одновременно.
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def error(self, message):
+        self.messages.append(message)
+
+    def warning(self, message):
+        self.messages.append(message)
+
+    def info(self, message):
+        self.messages.append(message)
+
+    def text(self):
+        return "; ".join(self.messages)
+
+async def run_bounded(items, worker, concurrency=DEFAULT_CONCURRENCY, max_retries=DEFAULT_FLOOD_RETRIES, on_done=None, on_flood_wait=None):
+    """Выполнение worker(item) для всех элементов с ограничением параллельности
+
+    При FloodWaitError все воркеры приостанавливаются на требуемое время,
+    после чего задача повторяется. Возвращает список (item, result, error)
+    в порядке исходных элементов; on_done(item, result, error) вызывается
+    по мере завершения задач, on_flood_wait(item, seconds) — при каждом FloodWait.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    gate = FloodWaitGate()
+
+    async def run_one(item):
+        async with semaphore:
+            attempt = 0
+            while True:
+                await gate.wait()
+                try:
+                    outcome = (item, await worker(item), None)
+                    break
+                except telethon.errors.FloodWaitError as e:
+                    gate.block(e.seconds)
+                    if on_flood_wait:
+                        on_flood_wait(item, e.seconds)
+                    attempt += 1
+                    if attempt > max_retries:
+                        outcome = (item, None, e)
+                        break
+                except Exception as e:
+                    outcome = (item, None, e)
+                    break
+        if on_done:
+            on_done(*outcome)
+        return outcome
+
+    return await asyncio.gather(*(run_one(item) for item in items))
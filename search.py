@@ -0,0 +1,71 @@
+"""Поиск по сохраненным постам и комментариям без обращения к Telegram
+
+Пример:
+    python -m search "выборы \"новые каналы\" -спорт" --since 2024-01-01 --channel news
+
+Слова ищутся по основам (кошки = кошкам), "фраза в кавычках" — слова
+подряд, слово* — по началу слова, -слово — исключение. Ищутся сообщения,
+сохраненные в локальном хранилище при анализе, дозагрузке и live-режиме.
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta, timezone
+
+from message_store import MessageStore, DEFAULT_STORE_PATH, DEFAULT_SEARCH_LIMIT, SEARCH_KINDS
+from text_search import make_snippet
+
+def parse_date(value):
+    """Дата YYYY-MM-DD (UTC)"""
+    return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+
+def resolve_channel_ids(store, names):
+    """ID каналов по ID, названию или @username из хранилища"""
+    if not names:
+        return None
+    channels = store.get_channels()
+    ids = []
+    for name in names:
+        name = name.lstrip('@').lower()
+        matched = [
+            channel['id'] for channel in channels
+            if name in (str(channel['id']), (channel['title'] or '').lower(), (channel['username'] or '').lower())
+        ]
+        if not matched and name.lstrip('-').isdigit():
+            matched = [int(name)]
+        ids.extend(matched)
+    return ids
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m search', description="Поиск по сохраненным сообщениям")
+    parser.add_argument('query', help="Поисковый запрос")
+    parser.add_argument('--channel', action='append', help="Канал: ID, название или @username (можно несколько)")
+    parser.add_argument('--since', type=parse_date, help="Не раньше даты YYYY-MM-DD")
+    parser.add_argument('--until', type=parse_date, help="Не позже даты YYYY-MM-DD (включительно)")
+    parser.add_argument('--kind', choices=tuple(SEARCH_KINDS), action='append', help="Только посты или только комментарии")
+    parser.add_argument('--order', choices=('rank', 'date'), default='rank', help="По релевантности или по дате")
+    parser.add_argument('--limit', type=int, default=DEFAULT_SEARCH_LIMIT)
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help="Локальное хранилище сообщений")
+    parser.add_argument('--rebuild', action='store_true', help="Перестроить индекс по сохраненным текстам перед поиском")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    with MessageStore(args.store) as store:
+        if args.rebuild:
+            store.rebuild_search_index()
+        channel_ids = resolve_channel_ids(store, args.channel)
+        if channel_ids == []:
+            print("Каналы не найдены в хранилище", file=sys.stderr)
+            return 2
+        end_date = args.until + timedelta(days=1) - timedelta(seconds=1) if args.until else None
+        results = store.search(args.query, channel_ids, args.since, end_date, args.kind, args.limit, args.order)
+
+    for result in results:
+        kind = "комментарий" if result['kind'] == 'comment' else "пост"
+        print(f"{result['date']:%Y-%m-%d %H:%M} {result['channel'] or result['channel_id']} #{result['post_id']} ({kind} {result['id']})")
+        print(f"    {make_snippet(result['text'], args.query)}")
+    print(f"Найдено: {len(results)}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
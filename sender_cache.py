@@ -0,0 +1,101 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Путь к кэшу имен отправителей по умолчанию
+DEFAULT_SENDER_CACHE_PATH = 'senders.db'
+# Срок жизни записи кэша (секунды)
+DEFAULT_SENDER_TTL = 7 * 24 * 3600
+# Максимальное число имен, хранимых в памяти
+DEFAULT_SENDER_CACHE_SIZE = 100_000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS senders (
+    sender_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+"""
+
+class SenderCache:
+    """LRU-кэш имен отправителей с TTL
+
+    В памяти хранится ограниченное число последних использованных имен,
+    на диске (SQLite) — все имена, поэтому кэш общий для всех каналов
+    и переживает перезапуск приложения.
+    """
+
+    def __init__(self, path=DEFAULT_SENDER_CACHE_PATH, max_size=DEFAULT_SENDER_CACHE_SIZE, ttl=DEFAULT_SENDER_TTL):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def _is_fresh(self, updated_at, now):
+        return now - updated_at < self.ttl
+
+    def _remember(self, sender_id, name, updated_at):
+        self._memory[sender_id] = (name, updated_at)
+        self._memory.move_to_end(sender_id)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def get_many(self, sender_ids):
+        """Поиск имен в кэше: ({sender_id: name}, множество промахов)"""
+        now = int(time.time())
+        found = {}
+        missing = []
+        with self._lock:
+            for sender_id in sender_ids:
+                entry = self._memory.get(sender_id)
+                if entry is not None and self._is_fresh(entry[1], now):
+                    self._memory.move_to_end(sender_id)
+                    found[sender_id] = entry[0]
+                else:
+                    missing.append(sender_id)
+
+            # Промахи памяти ищем на диске
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                cursor = self.conn.execute(
+                    f"SELECT sender_id, name, updated_at FROM senders WHERE sender_id IN ({placeholders})",
+                    chunk
+                )
+                for sender_id, name, updated_at in cursor:
+                    if self._is_fresh(updated_at, now):
+                        found[sender_id] = name
+                        self._remember(sender_id, name, updated_at)
+
+        return found, {sender_id for sender_id in missing if sender_id not in found}
+
+    def put_many(self, names):
+        """Сохранение имен {sender_id: name}"""
+        if not names:
+            return
+        now = int(time.time())
+        with self._lock:
+            for sender_id, name in names.items():
+                self._remember(sender_id, name, now)
+            with self.conn:
+                self.conn.executemany(
+                    """
+                    INSERT INTO senders (sender_id, name, updated_at) VALUES (?, ?, ?)
+                    ON CONFLICT (sender_id) DO UPDATE SET name = excluded.name, updated_at = excluded.updated_at
+                    """,
+                    [(sender_id, name, now) for sender_id, name in names.items()]
+                )
+
+    def prune(self):
+        """Удаление устаревших записей с диска"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM senders WHERE updated_at < ?", (int(time.time()) - self.ttl,))
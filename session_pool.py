@@ -0,0 +1,155 @@
+import asyncio
+
+import telethon
+
+from scheduler import DEFAULT_FLOOD_RETRIES
+
+# Задач, выполняемых одним аккаунтом одновременно
+DEFAULT_ACCOUNT_CONCURRENCY = 3
+# Минимальный интервал между запусками задач на одном аккаунте (секунды)
+DEFAULT_ACCOUNT_MIN_INTERVAL = 0.5
+
+class PooledAccount:
+    """Аккаунт пула: клиент, занятость, бюджет запросов и пауза после FloodWait"""
+
+    def __init__(self, account, client, max_concurrency, min_interval):
+        self.account = account
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.min_interval = min_interval
+        self.active = 0
+        self.next_start = 0.0
+        self.cooldown_until = 0.0
+        self.tasks = 0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0
+
+    def is_ready(self, now):
+        return self.active < self.max_concurrency and self.cooldown_until <= now and self.next_start <= now
+
+    def ready_at(self):
+        """Когда аккаунт сможет взять задачу, если у него есть свободный слот"""
+        return max(self.cooldown_until, self.next_start)
+
+class SessionPool:
+    """Пул авторизованных аккаунтов для распределения задач
+
+    Каждая задача выполняется на наименее загруженном свободном аккаунте.
+    У аккаунта ограничено число одновременных задач и частота их запуска;
+    после FloodWaitError аккаунт уходит на паузу, а задача повторяется
+    на другом аккаунте, поэтому ожидание одного аккаунта не останавливает
+    остальные.
+    """
+
+    def __init__(self, clients, max_concurrency=DEFAULT_ACCOUNT_CONCURRENCY, min_interval=DEFAULT_ACCOUNT_MIN_INTERVAL):
+        """clients — {ключ аккаунта: подключенный TelegramClient}"""
+        if not clients:
+            raise ValueError("Пул аккаунтов пуст")
+        self.accounts = [
+            PooledAccount(account, client, max_concurrency, min_interval)
+            for account, client in clients.items()
+        ]
+        self._changed = asyncio.Condition()
+
+    def __len__(self):
+        return len(self.accounts)
+
+    @property
+    def capacity(self):
+        """Число задач, которые пул может выполнять одновременно"""
+        return sum(account.max_concurrency for account in self.accounts)
+
+    async def acquire(self):
+        """Ожидание свободного аккаунта; возвращает PooledAccount"""
+        loop = asyncio.get_running_loop()
+        async with self._changed:
+            while True:
+                now = loop.time()
+                ready = [account for account in self.accounts if account.is_ready(now)]
+                if ready:
+                    account = min(ready, key=lambda account: (account.active, account.tasks))
+                    account.active += 1
+                    account.tasks += 1
+                    account.next_start = now + account.min_interval
+                    return account
+
+                # Ждем освобождения слота или окончания паузы ближайшего аккаунта
+                waiting = [
+                    account.ready_at() for account in self.accounts
+                    if account.active < account.max_concurrency
+                ]
+                timeout = max(0.0, min(waiting) - now) if waiting else None
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self, account):
+        async with self._changed:
+            account.active -= 1
+            self._changed.notify_all()
+
+    def cooldown(self, account, seconds):
+        """Пауза аккаунта после FloodWaitError"""
+        loop = asyncio.get_running_loop()
+        account.cooldown_until = max(account.cooldown_until, loop.time() + seconds)
+        account.flood_waits += 1
+        account.flood_wait_seconds += seconds
+
+    async def run(self, item, worker, max_retries=None, on_flood_wait=None):
+        """worker(client, item) на свободном аккаунте с переносом при FloodWait"""
+        if max_retries is None:
+            max_retries = DEFAULT_FLOOD_RETRIES * len(self.accounts)
+        attempt = 0
+        while True:
+            account = await self.acquire()
+            try:
+                return await worker(account.client, item)
+            except telethon.errors.FloodWaitError as e:
+                self.cooldown(account, e.seconds)
+                if on_flood_wait:
+                    on_flood_wait(item, e.seconds)
+                attempt += 1
+                if attempt > max_retries:
+                    raise
+            finally:
+                await self.release(account)
+
+    def stats(self):
+        """Нагрузка и ожидания по аккаунтам"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        return [
+            {
+                'account': account.account,
+                'tasks': account.tasks,
+                'active': account.active,
+                'flood_waits': account.flood_waits,
+                'flood_wait_seconds': account.flood_wait_seconds,
+                'cooldown_left': max(0.0, account.cooldown_until - now),
+            }
+            for account in self.accounts
+        ]
+
+async def run_pooled(items, worker, pool, max_retries=None, on_done=None, on_flood_wait=None):
+    """Выполнение worker(client, item) для всех элементов на аккаунтах пула
+
+    Аналог run_bounded для нескольких аккаунтов: возвращает список
+    (item, result, error) в порядке исходных элементов, on_done(item, result,
+    error) вызывается по мере завершения задач, on_flood_wait(item, seconds) —
+    при каждом FloodWait аккаунта.
+    """
+    # Не больше задач в ожидании, чем пул может выполнять одновременно
+    pending = asyncio.Semaphore(pool.capacity)
+
+    async def run_one(item):
+        async with pending:
+            try:
+                outcome = (item, await pool.run(item, worker, max_retries, on_flood_wait), None)
+            except Exception as e:
+                outcome = (item, None, e)
+        if on_done:
+            on_done(*outcome)
+        return outcome
+
+    return await asyncio.gather(*(run_one(item) for item in items))
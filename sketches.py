@@ -0,0 +1,251 @@
+import heapq
+import math
+
+import numpy as np
+
+# Допустимая ошибка топа авторов по умолчанию: доля от суммы весов потока
+DEFAULT_TOP_ERROR = 0.001
+# Допустимая относительная ошибка числа разных авторов по умолчанию
+DEFAULT_DISTINCT_ERROR = 0.01
+# Сколько авторов возвращать в приближенном топе
+SKETCH_TOP_N = 100
+# Размер порции сообщений при обновлении скетчей
+SKETCH_CHUNK_SIZE = 65536
+
+# Границы точности HyperLogLog: 16 регистров ... 256K регистров
+_MIN_PRECISION = 4
+_MAX_PRECISION = 18
+
+def _hash64(values):
+    """64-битный хэш целых чисел (splitmix64), векторно"""
+    h = np.asarray(values, dtype=np.int64).astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+def _bit_length(values):
+    """Число значащих бит каждого элемента массива uint64"""
+    exponents = np.frexp(values.astype(np.float64))[1].astype(np.int64)
+    # Перевод в float64 может округлить число вверх до степени двойки
+    shifted = values >> np.maximum(exponents - 1, 0).astype(np.uint64)
+    return exponents - ((shifted == 0) & (exponents > 0))
+
+def _aggregate(items, weights):
+    """Сумма весов по каждому элементу порции: (элементы, веса)"""
+    unique, inverse = np.unique(items, return_inverse=True)
+    return unique, np.bincount(inverse, weights=weights, minlength=len(unique)).astype(np.int64)
+
+class SpaceSaving:
+    """Тяжелые элементы потока с ограниченной памятью (алгоритм Space-Saving)
+
+    Хранится не больше capacity счетчиков. Вес каждого элемента оценивается
+    сверху с ошибкой не больше error_bound = total / capacity, поэтому любой
+    элемент с весом больше error_bound гарантированно попадает в скетч.
+    Скетчи с одинаковой емкостью сливаются (merge) — например, по каналам
+    или по частям периода.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.total = 0
+        self.counts = {}
+        self.errors = {}
+        # Куча (вес, элемент) с устаревшими записями, которые пропускаются при извлечении
+        self._heap = []
+
+    @classmethod
+    def from_error(cls, error=DEFAULT_TOP_ERROR):
+        """Скетч, который завышает вес не больше чем на долю error суммы весов"""
+        return cls(math.ceil(1 / error))
+
+    @property
+    def error_bound(self):
+        """Наибольшее завышение веса элемента"""
+        return self.total // self.capacity if len(self.counts) >= self.capacity else 0
+
+    def _push(self, item, count):
+        heapq.heappush(self._heap, (count, item))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, item) for item, count in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        while True:
+            count, item = heapq.heappop(self._heap)
+            if self.counts.get(item) == count:
+                return item, count
+
+    def update(self, item, weight=1):
+        """Учет элемента с весом weight"""
+        self.total += weight
+        count = self.counts.get(item)
+        if count is not None:
+            self.counts[item] = count + weight
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = weight
+            self.errors[item] = 0
+        else:
+            # Элемент с наименьшим весом уступает место новому
+            victim, count = self._pop_min()
+            del self.counts[victim]
+            del self.errors[victim]
+            self.counts[item] = count + weight
+            self.errors[item] = count
+        self._push(item, self.counts[item])
+
+    def update_many(self, items, weights=None):
+        """Учет порции элементов
+
+        Веса порции суммируются точно, capacity самых тяжелых элементов
+        образуют скетч порции, который сливается с текущим (merge), —
+        без обработки каждого элемента в Python.
+        """
+        items = np.asarray(items)
+        if not len(items):
+            return
+        unique, totals = _aggregate(items, weights)
+        chunk = SpaceSaving(self.capacity)
+        if len(unique) > self.capacity:
+            kept = np.argpartition(-totals, self.capacity - 1)[:self.capacity]
+            kept = kept[totals[kept] > 0]
+        else:
+            kept = np.flatnonzero(totals)
+        chunk.counts = dict(zip(unique[kept].tolist(), totals[kept].tolist()))
+        chunk.errors = dict.fromkeys(chunk.counts, 0)
+        chunk.total = int(totals.sum())
+        self.merge(chunk)
+
+    def merge(self, other):
+        """Слияние со скетчем той же емкости; возвращает self
+
+        Элементу, которого нет в одном из скетчей, добавляется наименьший
+        вес этого скетча (если он заполнен) — так сохраняется оценка сверху.
+        """
+        def floor(sketch):
+            return min(sketch.counts.values()) if len(sketch.counts) >= sketch.capacity else 0
+
+        own_floor, other_floor = floor(self), floor(other)
+        counts = {}
+        errors = {}
+        for item in self.counts.keys() | other.counts.keys():
+            counts[item] = self.counts.get(item, own_floor) + other.counts.get(item, other_floor)
+            errors[item] = self.errors.get(item, own_floor) + other.errors.get(item, other_floor)
+        kept = heapq.nlargest(self.capacity, counts.items(), key=lambda entry: entry[1])
+        self.counts = dict(kept)
+        self.errors = {item: errors[item] for item in self.counts}
+        self.total += other.total
+        self._heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self._heap)
+        return self
+
+    def top(self, n=SKETCH_TOP_N):
+        """n элементов с наибольшим весом: [(элемент, оценка веса, наибольшее завышение)]"""
+        return [
+            (item, count, self.errors[item])
+            for item, count in heapq.nlargest(n, self.counts.items(), key=lambda entry: entry[1])
+        ]
+
+class HyperLogLog:
+    """Оценка числа различных элементов с памятью 2^precision байт (HyperLogLog)
+
+    Относительная ошибка около 1.04 / sqrt(2^precision). Скетчи одинаковой
+    точности сливаются без потерь (поэлементный максимум регистров).
+    """
+
+    def __init__(self, precision=14):
+        if not _MIN_PRECISION <= precision <= _MAX_PRECISION:
+            raise ValueError(f"Точность HyperLogLog должна быть от {_MIN_PRECISION} до {_MAX_PRECISION}")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @classmethod
+    def from_error(cls, error=DEFAULT_DISTINCT_ERROR):
+        """Скетч с относительной ошибкой не больше error (в пределах допустимой точности)"""
+        precision = math.ceil(math.log2((1.04 / error) ** 2))
+        return cls(min(max(precision, _MIN_PRECISION), _MAX_PRECISION))
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add_many(self, items):
+        """Учет порции целых чисел"""
+        if not len(items):
+            return
+        hashes = _hash64(items)
+        suffix_bits = 64 - self.precision
+        indexes = (hashes >> np.uint64(suffix_bits)).astype(np.int64)
+        suffixes = hashes & np.uint64((1 << suffix_bits) - 1)
+        # Позиция первой единицы в оставшихся битах
+        ranks = (suffix_bits + 1 - _bit_length(suffixes)).astype(np.uint8)
+        np.maximum.at(self.registers, indexes, ranks)
+
+    def merge(self, other):
+        """Слияние со скетчем той же точности; возвращает self"""
+        if other.precision != self.precision:
+            raise ValueError("Сливать можно только скетчи одинаковой точности")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        """Оценка числа различных элементов"""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        # Для малого числа элементов точнее линейный подсчет по пустым регистрам
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+class AuthorSketch:
+    """Приближенная статистика авторов с ограниченной памятью
+
+    Топ по сообщениям и по реакциям (SpaceSaving) и число разных авторов
+    (HyperLogLog) вместо словаря на каждого отправителя. Обновляется
+    порциями по SKETCH_CHUNK_SIZE сообщений; скетчи с одинаковыми
+    параметрами ошибки сливаются по каналам и частям периода.
+    """
+
+    def __init__(self, top_error=DEFAULT_TOP_ERROR, distinct_error=DEFAULT_DISTINCT_ERROR):
+        self.top_error = top_error
+        self.distinct_error = distinct_error
+        self.by_messages = SpaceSaving.from_error(top_error)
+        self.by_reactions = SpaceSaving.from_error(top_error)
+        self.distinct = HyperLogLog.from_error(distinct_error)
+
+    def update(self, sender_ids, reactions):
+        """Учет сообщений: массивы ID отправителей (0 — без отправителя) и реакций"""
+        sender_ids = np.asarray(sender_ids, dtype=np.int64)
+        reactions = np.asarray(reactions, dtype=np.int64)
+        for start in range(0, len(sender_ids), SKETCH_CHUNK_SIZE):
+            chunk = sender_ids[start:start + SKETCH_CHUNK_SIZE]
+            mask = chunk != 0
+            senders = chunk[mask]
+            self.by_messages.update_many(senders)
+            self.by_reactions.update_many(senders, reactions[start:start + SKETCH_CHUNK_SIZE][mask])
+            self.distinct.add_many(senders)
+
+    def merge(self, other):
+        """Слияние со скетчем с теми же параметрами ошибки; возвращает self"""
+        self.by_messages.merge(other.by_messages)
+        self.by_reactions.merge(other.by_reactions)
+        self.distinct.merge(other.distinct)
+        return self
+
+    def count(self):
+        """Оценка числа разных авторов"""
+        return self.distinct.count()
+
+def merge_author_sketches(sketches):
+    """Общий скетч авторов нескольких каналов или периодов; None, если скетчей нет
+
+    Исходные скетчи не изменяются.
+    """
+    sketches = list(sketches)
+    if not sketches:
+        return None
+    merged = AuthorSketch(sketches[0].top_error, sketches[0].distinct_error)
+    for sketch in sketches:
+        merged.merge(sketch)
+    return merged
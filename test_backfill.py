@@ -0,0 +1,68 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from backfill import backfill_channel, plan_chunks
+from benchmark import FakeClient, SyntheticChannel
+from message_store import MessageStore
+
+# Сообщений в синтетическом канале
+CHANNEL_SIZE = 1200
+# Номер запроса страницы истории, на котором загрузка обрывается
+FAIL_ON_PAGE = 8
+
+class FailingClient(FakeClient):
+    """FakeClient, который обрывает загрузку на fail_on_page-й странице истории"""
+
+    def __init__(self, channels, fail_on_page):
+        super().__init__(channels)
+        self.fail_on_page = fail_on_page
+
+    async def _request(self, name):
+        await super()._request(name)
+        if name == 'GetHistoryRequest' and self.api_calls[name] == self.fail_on_page:
+            raise ConnectionError("соединение разорвано")
+
+def run_backfill(client, store, channel, start_date):
+    return asyncio.run(backfill_channel(client, store, channel.entity, start_date))
+
+def test_plan_chunks_cover_window_without_gaps():
+    chunks = plan_chunks(10, 12_346, chunk_size=5000)
+    assert chunks[0][0] == 10
+    assert chunks[-1][1] == 12_345
+    assert all(high == next_low for (_, high), (next_low, _) in zip(chunks, chunks[1:]))
+
+def test_backfill_resumes_from_checkpoint(tmp_path):
+    channel = SyntheticChannel(CHANNEL_SIZE, days=1, deleted_ratio=0)
+    start_date = datetime.now(timezone.utc) - timedelta(days=2)
+    with MessageStore(str(tmp_path / 'messages.db')) as store:
+        summary, failures = run_backfill(FailingClient([channel], FAIL_ON_PAGE), store, channel, start_date)
+        assert len(failures) == 1
+        # Сохранена только полная пачка до обрыва, позиция — ее последнее сообщение
+        [chunk] = store.get_backfill_chunks(channel.entity.id)
+        assert not chunk['done']
+        assert chunk['messages'] == 500
+        assert chunk['cursor_id'] == channel.ids[499]
+        assert store.get_sync_state(channel.entity.id) is None
+
+        client = FakeClient([channel])
+        summary, failures = run_backfill(client, store, channel, start_date)
+        assert failures == []
+        # Повторный запуск запрашивает только оставшиеся сообщения
+        assert client.api_calls['GetHistoryRequest'] == (CHANNEL_SIZE - 500 + 99) // 100
+        assert summary['messages'] == CHANNEL_SIZE
+        assert summary['progress'] == 1.0
+        now = datetime.now(timezone.utc)
+        stored = store.load_messages(channel.entity.id, start_date, now)
+        assert [record['id'] for record in stored] == channel.ids.tolist()
+        assert store.get_sync_state(channel.entity.id)['high_water_id'] == channel.ids[-1]
+
+def test_finished_backfill_is_not_fetched_again(tmp_path):
+    channel = SyntheticChannel(300, days=1, deleted_ratio=0)
+    start_date = datetime.now(timezone.utc) - timedelta(days=2)
+    with MessageStore(str(tmp_path / 'messages.db')) as store:
+        run_backfill(FakeClient([channel]), store, channel, start_date)
+        client = FakeClient([channel])
+        summary, failures = run_backfill(client, store, channel, start_date)
+        assert failures == []
+        assert summary['messages'] == 300
+        assert client.api_calls['GetHistoryRequest'] == 0
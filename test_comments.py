@@ -0,0 +1,37 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from telethon.tl.types import MessageReplyHeader
+
+from comments import extract_comment_record
+
+# ID поста канала и его копии в группе обсуждения
+POST_ID = 100
+DISCUSSION_TOP_ID = 5000
+
+def make_message(message_id, reply_to):
+    return SimpleNamespace(
+        id=message_id,
+        date=datetime(2024, 1, 1, tzinfo=timezone.utc),
+        sender_id=42,
+        reply_to=reply_to,
+        reactions=None,
+        message="текст",
+    )
+
+def test_direct_reply_to_post_has_no_reply_to_id():
+    # Ответ на сам пост: reply_to_msg_id указывает на копию поста, reply_to_top_id не задан
+    message = make_message(5001, MessageReplyHeader(reply_to_msg_id=DISCUSSION_TOP_ID))
+    record = extract_comment_record(message, POST_ID)
+    assert record['post_id'] == POST_ID
+    assert record['reply_to_id'] is None
+
+def test_reply_to_comment_keeps_comment_id():
+    # Ответ на комментарий: reply_to_msg_id — комментарий, reply_to_top_id — копия поста
+    reply_to = MessageReplyHeader(reply_to_msg_id=5001, reply_to_top_id=DISCUSSION_TOP_ID)
+    record = extract_comment_record(make_message(5002, reply_to), POST_ID)
+    assert record['reply_to_id'] == 5001
+
+def test_message_without_reply_header():
+    record = extract_comment_record(make_message(5003, None), POST_ID)
+    assert record['reply_to_id'] is None
@@ -0,0 +1,45 @@
+import re
+import zipfile
+from datetime import datetime, timezone
+
+from export import EXPORT_FIELDS, XlsxWriter
+
+def make_record(message_id):
+    return {
+        'channel': 'test',
+        'id': message_id,
+        'date': datetime(2024, 1, 1, tzinfo=timezone.utc),
+        'text': f"сообщение {message_id}",
+        'views': 10,
+    }
+
+def read_sheets(path):
+    """Имена листов и число строк на каждом (с заголовком) без openpyxl"""
+    with zipfile.ZipFile(path) as archive:
+        names = re.findall(r'<sheet name="([^"]+)"', archive.read('xl/workbook.xml').decode())
+        rows = [
+            len(re.findall(r'<row ', archive.read(f'xl/worksheets/sheet{i}.xml').decode()))
+            for i in range(1, len(names) + 1)
+        ]
+    return dict(zip(names, rows))
+
+def test_xlsx_splits_rows_across_sheets(tmp_path):
+    path = str(tmp_path / 'messages.xlsx')
+    # На листе не больше 4 строк: заголовок и 3 сообщения
+    with XlsxWriter(path, max_rows=4) as writer:
+        for message_id in range(7):
+            writer.write(make_record(message_id))
+    assert read_sheets(path) == {'messages': 4, 'messages_2': 4, 'messages_3': 2}
+
+def test_xlsx_every_sheet_has_header(tmp_path):
+    path = str(tmp_path / 'messages.xlsx')
+    with XlsxWriter(path, max_rows=2) as writer:
+        for message_id in range(2):
+            writer.write(make_record(message_id))
+    with zipfile.ZipFile(path) as archive:
+        sheets = [archive.read(f'xl/worksheets/sheet{i}.xml').decode() for i in (1, 2)]
+    for sheet in sheets:
+        # В режиме constant_memory строки записываются прямо в ячейки
+        first_row = re.search(r'<row [^>]*>(.*?)</row>', sheet).group(1)
+        assert tuple(re.findall(r'<t>([^<]*)</t>', first_row)) == EXPORT_FIELDS
+        assert 'сообщение' in sheet
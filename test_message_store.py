@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta, timezone
+
+from message_store import MessageStore
+
+# ID канала в тестах
+CHANNEL_ID = 1
+# Начало тестовой истории
+BASE_DATE = datetime(2024, 1, 1, 10, tzinfo=timezone.utc)
+
+def make_record(message_id, views=100, reactions_detail=None, replies=0, sender_id=7, text=None, hours=0):
+    detail = reactions_detail or {}
+    return {
+        'id': message_id,
+        'date': BASE_DATE + timedelta(hours=hours),
+        'views': views,
+        'reactions': sum(detail.values()),
+        'replies': replies,
+        'sender_id': sender_id,
+        'text': text,
+        'reactions_detail': detail,
+    }
+
+def dump_rollups(store):
+    return {
+        table: sorted(store.conn.execute(f"SELECT * FROM {table}").fetchall())
+        for table in ('rollups', 'rollup_authors', 'rollup_reactions')
+    }
+
+def totals(store):
+    return store.rollup_totals([CHANNEL_ID], BASE_DATE - timedelta(days=1), BASE_DATE + timedelta(days=2))
+
+def test_rollup_deltas_match_rebuild(tmp_path):
+    with MessageStore(str(tmp_path / 'messages.db')) as store:
+        store.upsert_messages(CHANNEL_ID, [
+            make_record(1, views=100, reactions_detail={'👍': 3, '🔥': 1}, replies=2, sender_id=7),
+            make_record(2, views=50, reactions_detail={'👍': 1}, sender_id=8, hours=1),
+            make_record(3, views=10, sender_id=7, hours=30),
+        ])
+        # Повторная синхронизация: изменились просмотры, реакции и ответы
+        store.upsert_messages(CHANNEL_ID, [
+            make_record(1, views=150, reactions_detail={'👍': 5}, replies=4, sender_id=7),
+            make_record(2, views=60, reactions_detail={'👍': 1, '❤': 2}, sender_id=8, hours=1),
+        ])
+        incremental = dump_rollups(store)
+        store.rebuild_rollups()
+        assert incremental == dump_rollups(store)
+
+def test_resync_does_not_double_count_messages_or_authors(tmp_path):
+    with MessageStore(str(tmp_path / 'messages.db')) as store:
+        records = [make_record(1, sender_id=7), make_record(2, sender_id=8, hours=1)]
+        store.upsert_messages(CHANNEL_ID, records)
+        store.upsert_messages(CHANNEL_ID, records)
+        # Повтор того же сообщения внутри пачки тоже учитывается один раз
+        store.upsert_messages(CHANNEL_ID, [make_record(1, views=300, sender_id=7), make_record(1, views=300, sender_id=7)])
+        result = totals(store)
+        assert result['messages'] == 2
+        assert result['views'] == 400
+        assert result['authors'] == 2
+        author_messages = store.conn.execute(
+            "SELECT SUM(messages) FROM rollup_authors WHERE grain = 0"
+        ).fetchone()[0]
+        assert author_messages == 2
+
+def test_removed_reaction_type_is_dropped(tmp_path):
+    with MessageStore(str(tmp_path / 'messages.db')) as store:
+        store.upsert_messages(CHANNEL_ID, [make_record(1, reactions_detail={'👍': 2, '🔥': 1})])
+        store.upsert_messages(CHANNEL_ID, [make_record(1, reactions_detail={'👍': 2})])
+        assert totals(store)['reactions_by_type'] == {'👍': 2}
+        reactions = store.conn.execute("SELECT DISTINCT reaction FROM rollup_reactions").fetchall()
+        assert reactions == [('👍',)]
+
+def test_record_without_detail_keeps_reaction_types(tmp_path):
+    with MessageStore(str(tmp_path / 'messages.db')) as store:
+        store.upsert_messages(CHANNEL_ID, [make_record(1, reactions_detail={'👍': 2})])
+        record = make_record(1, views=200)
+        record['reactions'] = 2
+        record['reactions_detail'] = None
+        store.upsert_messages(CHANNEL_ID, [record])
+        assert totals(store)['reactions_by_type'] == {'👍': 2}
+        assert totals(store)['views'] == 200
+
+def search_ids(store, query):
+    return [result['id'] for result in store.search(query)]
+
+def test_search_reindexes_edited_text(tmp_path):
+    with MessageStore(str(tmp_path / 'messages.db')) as store:
+        store.upsert_messages(CHANNEL_ID, [make_record(1, text="кошки гуляют по крыше"), make_record(2, text="погода")])
+        assert search_ids(store, "кошка") == [1]
+
+        # Старые основы удаляются из индекса без хранения текста в нем
+        store.upsert_messages(CHANNEL_ID, [make_record(1, text="собаки спят")])
+        assert search_ids(store, "кошка") == []
+        assert search_ids(store, "собака") == [1]
+
+        # Запись без текста текст и индекс не меняет
+        store.upsert_messages(CHANNEL_ID, [make_record(1, views=500)])
+        assert search_ids(store, "собака") == [1]
+
+def test_search_drops_document_for_empty_text(tmp_path):
+    with MessageStore(str(tmp_path / 'messages.db')) as store:
+        store.upsert_messages(CHANNEL_ID, [make_record(1, text="кошки гуляют")])
+        store.upsert_messages(CHANNEL_ID, [make_record(1, text="")])
+        assert search_ids(store, "кошка") == []
+        assert store.conn.execute("SELECT COUNT(*) FROM search_docs").fetchone()[0] == 0
+
+def test_rebuild_search_index_matches_incremental(tmp_path):
+    with MessageStore(str(tmp_path / 'messages.db')) as store:
+        store.upsert_messages(CHANNEL_ID, [make_record(1, text="кошки гуляют"), make_record(2, text="кошка спит")])
+        store.upsert_messages(CHANNEL_ID, [make_record(2, text="собака спит")])
+        incremental = sorted(search_ids(store, "кошка")), sorted(search_ids(store, "спит"))
+        store.rebuild_search_index()
+        assert (sorted(search_ids(store, "кошка")), sorted(search_ids(store, "спит"))) == incremental == ([1], [2])
@@ -0,0 +1,85 @@
+import asyncio
+
+import telethon
+
+from session_pool import SessionPool, run_pooled
+
+# Пауза аккаунта после FloodWait в тестах (секунды)
+FLOOD_SECONDS = 30
+
+def flood_wait(seconds=FLOOD_SECONDS):
+    return telethon.errors.FloodWaitError(request=None, capture=seconds)
+
+def test_flood_wait_moves_task_to_other_account():
+    async def scenario():
+        pool = SessionPool({'a': 'client-a', 'b': 'client-b'}, min_interval=0)
+        calls = []
+
+        async def worker(client, item):
+            calls.append(client)
+            if client == 'client-a':
+                raise flood_wait()
+            return f"{item} via {client}"
+
+        floods = []
+        result = await pool.run('task', worker, on_flood_wait=lambda item, seconds: floods.append((item, seconds)))
+        return result, calls, floods, pool.stats()
+
+    result, calls, floods, stats = asyncio.run(scenario())
+    assert result == 'task via client-b'
+    assert calls == ['client-a', 'client-b']
+    assert floods == [('task', FLOOD_SECONDS)]
+    a, b = stats
+    assert a['flood_waits'] == 1 and a['flood_wait_seconds'] == FLOOD_SECONDS
+    assert FLOOD_SECONDS - 1 < a['cooldown_left'] <= FLOOD_SECONDS
+    assert a['active'] == b['active'] == 0
+    assert b['flood_waits'] == 0
+
+def test_account_in_cooldown_gets_no_tasks():
+    async def scenario():
+        pool = SessionPool({'a': 'client-a', 'b': 'client-b'}, max_concurrency=1, min_interval=0)
+        pool.cooldown(pool.accounts[0], FLOOD_SECONDS)
+
+        async def worker(client, item):
+            await asyncio.sleep(0.01)
+            return client
+
+        outcomes = await run_pooled(range(4), worker, pool)
+        return outcomes, pool.stats()
+
+    outcomes, stats = asyncio.run(scenario())
+    assert [result for _, result, error in outcomes if error is None] == ['client-b'] * 4
+    assert [account['tasks'] for account in stats] == [0, 4]
+
+def test_cooldown_expires_and_account_is_reused():
+    async def scenario():
+        pool = SessionPool({'a': 'client-a'}, min_interval=0)
+        attempts = []
+
+        async def worker(client, item):
+            attempts.append(asyncio.get_running_loop().time())
+            if len(attempts) == 1:
+                raise flood_wait(1)
+            return client
+
+        result = await pool.run('task', worker)
+        return result, attempts
+
+    result, attempts = asyncio.run(scenario())
+    assert result == 'client-a'
+    # Повтор на том же аккаунте только после окончания паузы
+    assert attempts[1] - attempts[0] >= 0.9
+
+def test_retries_exhausted_raise_flood_wait():
+    async def scenario():
+        pool = SessionPool({'a': 'client-a', 'b': 'client-b'}, min_interval=0)
+
+        async def worker(client, item):
+            raise flood_wait(0)
+
+        outcomes = await run_pooled(['task'], worker, pool, max_retries=2)
+        return outcomes, pool.stats()
+
+    [(item, result, error)], stats = asyncio.run(scenario())
+    assert isinstance(error, telethon.errors.FloodWaitError)
+    assert sum(account['flood_waits'] for account in stats) == 3
@@ -0,0 +1,77 @@
+from collections import Counter
+
+import numpy as np
+
+from sketches import AuthorSketch, HyperLogLog, SpaceSaving, merge_author_sketches
+
+# Емкость SpaceSaving в тестах
+CAPACITY = 50
+# Размер порции при обновлении скетча
+CHUNK = 2000
+
+def zipf_stream(size, seed):
+    rng = np.random.default_rng(seed)
+    return rng.zipf(1.3, size) % 5000
+
+def check_space_saving(sketch, exact):
+    bound = sketch.error_bound
+    assert bound <= sketch.total // sketch.capacity
+    for item, estimate in sketch.counts.items():
+        # Оценка сверху, завышение не больше error_bound и собственной ошибки элемента
+        assert exact[item] <= estimate <= exact[item] + bound
+        assert estimate - sketch.errors[item] <= exact[item]
+    for item, count in exact.items():
+        if count > bound:
+            assert item in sketch.counts
+
+def test_space_saving_error_bound():
+    stream = zipf_stream(50_000, seed=1)
+    sketch = SpaceSaving(CAPACITY)
+    for start in range(0, len(stream), CHUNK):
+        sketch.update_many(stream[start:start + CHUNK])
+    exact = Counter(stream.tolist())
+    assert sketch.total == len(stream)
+    check_space_saving(sketch, exact)
+    top = [item for item, _, _ in sketch.top(3)]
+    assert top == [item for item, _ in exact.most_common(3)]
+
+def test_space_saving_single_updates_match_bounds():
+    stream = zipf_stream(5000, seed=2)
+    sketch = SpaceSaving(CAPACITY)
+    for item in stream.tolist():
+        sketch.update(item)
+    check_space_saving(sketch, Counter(stream.tolist()))
+
+def test_space_saving_merge_keeps_bounds():
+    first, second = zipf_stream(20_000, seed=3), zipf_stream(30_000, seed=4)
+    left, right = SpaceSaving(CAPACITY), SpaceSaving(CAPACITY)
+    left.update_many(first)
+    right.update_many(second)
+    left.merge(right)
+    assert left.total == len(first) + len(second)
+    check_space_saving(left, Counter(first.tolist()) + Counter(second.tolist()))
+
+def test_hyperloglog_relative_error():
+    for distinct in (100, 10_000, 200_000):
+        sketch = HyperLogLog.from_error(0.01)
+        items = np.arange(distinct, dtype=np.int64) + 10_000_000
+        sketch.add_many(np.concatenate([items, items[:distinct // 2]]))
+        assert abs(sketch.count() - distinct) <= 3 * sketch.relative_error * distinct
+
+def test_hyperloglog_merge_equals_union():
+    left, right, union = HyperLogLog(12), HyperLogLog(12), HyperLogLog(12)
+    first, second = np.arange(0, 60_000), np.arange(40_000, 100_000)
+    left.add_many(first)
+    right.add_many(second)
+    union.add_many(np.concatenate([first, second]))
+    assert left.merge(right).count() == union.count()
+    assert np.array_equal(left.registers, union.registers)
+
+def test_merged_author_sketches_count_shared_authors_once():
+    first, second = AuthorSketch(), AuthorSketch()
+    first.update(np.arange(1, 1001), np.ones(1000))
+    second.update(np.arange(501, 1501), np.ones(1000))
+    merged = merge_author_sketches([first, second])
+    assert abs(merged.count() - 1500) <= 3 * merged.distinct.relative_error * 1500
+    # Исходные скетчи не изменяются
+    assert first.by_messages.total == 1000
@@ -0,0 +1,42 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from analyzer import sync_channel_messages
+from benchmark import FakeClient, SyntheticChannel
+from message_store import MessageStore
+
+# Окно анализа в днях
+WINDOW_DAYS = 7
+
+def sync(client, store, channel):
+    start_date = datetime.now(timezone.utc) - timedelta(days=WINDOW_DAYS)
+    return asyncio.run(sync_channel_messages(client, store, channel.entity, start_date))
+
+def stored_views(store, channel):
+    now = datetime.now(timezone.utc)
+    records = store.load_messages(channel.entity.id, now - timedelta(days=WINDOW_DAYS), now)
+    return {record['id']: record['views'] for record in records}
+
+def test_resync_refreshes_channel_younger_than_refresh_window(tmp_path):
+    # Все сообщения моложе окна актуализации: раньше повторная синхронизация их не обновляла
+    channel = SyntheticChannel(50, days=1, deleted_ratio=0)
+    client = FakeClient([channel])
+    with MessageStore(str(tmp_path / 'messages.db')) as store:
+        assert sync(client, store, channel) == 50
+        channel.views += 1000
+        assert sync(client, store, channel) == 50
+        assert stored_views(store, channel) == dict(zip(channel.ids.tolist(), channel.views.tolist()))
+
+def test_resync_refreshes_only_refresh_window(tmp_path):
+    channel = SyntheticChannel(100, days=WINDOW_DAYS, deleted_ratio=0)
+    client = FakeClient([channel])
+    with MessageStore(str(tmp_path / 'messages.db')) as store:
+        assert sync(client, store, channel) == 100
+        old_views = stored_views(store, channel)
+        channel.views += 1000
+        refreshed = sync(client, store, channel)
+        assert 0 < refreshed < 100
+        views = stored_views(store, channel)
+        changed = [message_id for message_id in views if views[message_id] != old_views[message_id]]
+        # Обновлены ровно последние refreshed сообщений
+        assert changed == channel.ids[-refreshed:].tolist()
@@ -0,0 +1,262 @@
+import os
+import re
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from aggregation import DEFAULT_TIMEZONE
+from text_search import stem_word
+
+# Число строк в топах ключевых слов, биграмм и сущностей
+TEXT_TOP_N = 20
+# Минимальная длина ключевого слова
+MIN_WORD_LENGTH = 3
+# Сообщений, начиная с которых подсчет разбивается на части для пула процессов
+TEXT_PROCESS_THRESHOLD = 50_000
+# Сообщений в одной части при подсчете в пуле процессов
+TEXT_CHUNK_SIZE = 20_000
+
+# Служебные слова, не учитываемые в ключевых словах и биграммах
+STOPWORDS = frozenset("""
+и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по
+только ее мне было вот от меня еще нет о из ему теперь когда даже ну вдруг ли если
+уже или ни быть был него до вас нибудь опять уж вам ведь там потом себя ничего ей
+может они тут где есть надо ней для мы тебя их чем была сам чтоб без будто чего раз
+тоже себе под будет ж тогда кто этот того потому этого какой совсем ним здесь этом
+один почти мой тем чтобы нее сейчас были куда зачем всех никогда можно при наконец
+два об другой хоть после над больше тот через эти нас про всего них какая много
+разве три эту моя впрочем хорошо свою этой перед иногда лучше чуть том нельзя такой
+им более всегда конечно всю между это эта также так же который которая которые
+которых которого году года лет очень свой свои своих время сегодня пока ещё
+the and for that with this from are was were you your have has not but all can
+will one out about they their there what when which who how more also its our
+""".split())
+
+_WORD_RE = r"[a-zа-я]+"
+_HASHTAG_RE = r"(?<!\w)#(\w+)"
+_MENTION_RE = r"(?<!\w)@(\w{4,32})"
+_DOMAIN_RE = r"(?:https?://|www\.)(?:www\.)?([^\s/?#:]+)"
+# Ссылки, хэштеги и упоминания убираются из текста перед выделением слов
+_ENTITY_RE = re.compile(r"(?:https?://|www\.)\S+|(?<!\w)[#@]\w+")
+
+class TextColumns:
+    """Накопитель текста и реакций сообщений для анализа текста
+
+    append принимает запись extract_message_record и подходит как on_record
+    для get_messages_stats/analyze_channel.
+    """
+
+    def __init__(self):
+        self.dates = array('q')
+        self.texts = []
+        self.reactions = []
+
+    def __len__(self):
+        return len(self.dates)
+
+    def append(self, record):
+        self.dates.append(int(record['date'].timestamp()))
+        self.texts.append(record.get('text') or '')
+        self.reactions.append(record.get('reactions_detail') or {})
+
+    def chunks(self, size):
+        """Части накопителя: (даты, тексты, реакции)"""
+        dates = np.frombuffer(self.dates, dtype=np.int64)
+        for start in range(0, len(self), size):
+            yield dates[start:start + size], self.texts[start:start + size], self.reactions[start:start + size]
+
+def _empty_counts(names):
+    index = pd.MultiIndex.from_arrays([[] for _ in names], names=names) if len(names) > 1 else pd.Index([], name=names[0])
+    return pd.Series([], index=index, dtype=np.int64)
+
+def _value_counts(frame):
+    """Число одинаковых строк frame: Series с индексом по его столбцам"""
+    if frame.empty:
+        return _empty_counts(list(frame.columns))
+    counts = frame.value_counts(sort=False)
+    if len(frame.columns) == 1:
+        counts.index = counts.index.get_level_values(0).rename(frame.columns[0])
+    return counts.astype(np.int64)
+
+def _merge_counts(parts, names):
+    """Сумма частичных подсчетов с одинаковым индексом"""
+    parts = [part for part in parts if not part.empty]
+    if not parts:
+        return _empty_counts(names)
+    if len(parts) == 1:
+        return parts[0]
+    return pd.concat(parts).groupby(level=list(range(len(names)))).sum()
+
+def _found(texts, pattern):
+    """Все совпадения pattern во всех текстах одним столбцом"""
+    values = texts.str.findall(pattern).explode().dropna()
+    return values[values != '']
+
+def count_text_chunk(dates, texts, reactions, tz=DEFAULT_TIMEZONE):
+    """Аддитивные подсчеты по части сообщений
+
+    Слова, биграммы и реакции считаются по дням (в часовом поясе tz),
+    хэштеги, упоминания и домены ссылок — за весь период. Подсчеты разных
+    частей складываются merge_text_counts, поэтому части можно обрабатывать
+    в разных процессах.
+    """
+    days = pd.to_datetime(np.asarray(dates, dtype=np.int64), unit='s', utc=True).tz_convert(tz).tz_localize(None).normalize()
+    texts = pd.Series(texts, dtype=object).str.lower().str.replace('ё', 'е', regex=False)
+
+    # Слова: позиция сообщения в индексе, соседние строки одного сообщения — соседние слова
+    words = texts.str.replace(_ENTITY_RE, ' ', regex=True).str.findall(_WORD_RE).explode().dropna()
+    message = words.index.to_numpy()
+    words = words.to_numpy(dtype=object)
+    word_days = days[message]
+    keep = ~pd.Series(words).isin(STOPWORDS).to_numpy() & (pd.Series(words).str.len().to_numpy() >= MIN_WORD_LENGTH)
+
+    # Биграммы: оба слова значимые и стоят подряд в одном сообщении
+    paired = keep[:-1] & keep[1:] & (message[:-1] == message[1:])
+    bigrams = pd.DataFrame({
+        'date': word_days[:-1][paired],
+        'bigram': pd.Series(words[:-1][paired], dtype=object) + ' ' + pd.Series(words[1:][paired], dtype=object),
+    }) if len(words) > 1 else pd.DataFrame({'date': [], 'bigram': []})
+
+    reaction_frame = pd.DataFrame.from_records(reactions, index=days) if reactions else pd.DataFrame()
+    if reaction_frame.empty or not len(reaction_frame.columns):
+        reaction_counts = _empty_counts(['date', 'reaction'])
+    else:
+        reaction_counts = reaction_frame.groupby(level=0).sum().stack()
+        reaction_counts.index.names = ['date', 'reaction']
+        reaction_counts = reaction_counts[reaction_counts > 0].astype(np.int64)
+
+    domains = _found(texts, _DOMAIN_RE).str.removeprefix('www.')
+    return {
+        'messages': len(texts),
+        'words': _value_counts(pd.DataFrame({'date': word_days[keep], 'word': words[keep]})),
+        'bigrams': _value_counts(bigrams),
+        'hashtags': _value_counts(pd.DataFrame({'hashtag': _found(texts, _HASHTAG_RE)})),
+        'mentions': _value_counts(pd.DataFrame({'mention': _found(texts, _MENTION_RE)})),
+        'domains': _value_counts(pd.DataFrame({'domain': domains})),
+        'reactions': reaction_counts,
+    }
+
+# Названия уровней индекса подсчетов count_text_chunk
+_COUNT_LEVELS = {
+    'words': ['date', 'word'],
+    'bigrams': ['date', 'bigram'],
+    'hashtags': ['hashtag'],
+    'mentions': ['mention'],
+    'domains': ['domain'],
+    'reactions': ['date', 'reaction'],
+}
+
+def merge_text_counts(parts):
+    """Сложение подсчетов нескольких частей"""
+    merged = {'messages': sum(part['messages'] for part in parts)}
+    for key, names in _COUNT_LEVELS.items():
+        merged[key] = _merge_counts([part[key] for part in parts], names)
+    return merged
+
+def _count_chunk_args(args):
+    return count_text_chunk(*args)
+
+def count_texts(columns, tz=DEFAULT_TIMEZONE, processes=None):
+    """Подсчеты по всем сообщениям TextColumns
+
+    Большой корпус (от TEXT_PROCESS_THRESHOLD сообщений) делится на части
+    по TEXT_CHUNK_SIZE, которые считаются в пуле из processes процессов
+    (по умолчанию — число ядер); processes=1 отключает пул.
+    """
+    processes = processes or os.cpu_count() or 1
+    chunks = [(dates, texts, reactions, tz) for dates, texts, reactions in columns.chunks(TEXT_CHUNK_SIZE)]
+    if not chunks:
+        return count_text_chunk([], [], [], tz)
+    if len(columns) < TEXT_PROCESS_THRESHOLD or processes < 2 or len(chunks) < 2:
+        return merge_text_counts([count_text_chunk(*chunk) for chunk in chunks])
+    with ProcessPoolExecutor(max_workers=min(processes, len(chunks))) as executor:
+        return merge_text_counts(list(executor.map(_count_chunk_args, chunks)))
+
+def group_word_forms(words):
+    """Объединение форм одного слова по основе
+
+    Основы вычисляются один раз для каждого различного слова; подписью
+    группы становится ее самая частая форма.
+    """
+    if words.empty:
+        return words
+    totals = words.groupby(level='word').sum()
+    stems = pd.Series([stem_word(word) for word in totals.index], index=totals.index)
+    labels = totals.groupby(stems).idxmax()
+    word_labels = labels.reindex(stems.to_numpy()).to_numpy()
+    by_word = pd.Series(word_labels, index=totals.index)
+    frame = words.rename('count').reset_index()
+    frame['word'] = frame['word'].map(by_word)
+    return frame.groupby(['date', 'word'])['count'].sum()
+
+def _top(counts, column, top_n):
+    """Топ значений за весь период: DataFrame (column, count); top_n=None — все значения"""
+    totals = counts.groupby(level=column).sum() if isinstance(counts.index, pd.MultiIndex) else counts
+    totals = totals.sort_values(ascending=False, kind='stable')
+    if top_n is not None:
+        totals = totals.head(top_n)
+    return pd.DataFrame({column: totals.index.tolist(), 'count': totals.to_numpy(dtype=np.int64)})
+
+def _top_per_day(counts, column, top_n):
+    """Топ значений каждого дня: DataFrame (date, column, count)"""
+    frame = counts.rename('count').reset_index()
+    if frame.empty:
+        return pd.DataFrame(columns=['date', column, 'count'])
+    frame = frame.sort_values(['date', 'count'], ascending=[True, False], kind='stable')
+    if top_n is not None:
+        frame = frame.groupby('date').head(top_n)
+    frame['date'] = frame['date'].dt.strftime('%Y-%m-%d')
+    return frame.reset_index(drop=True)
+
+def analyze_texts(columns, tz=DEFAULT_TIMEZONE, top_n=TEXT_TOP_N, processes=None):
+    """Анализ текста и реакций сообщений
+
+    Возвращает словарь таблиц: keywords и keywords_per_day (формы слова
+    объединены по основе), bigrams и bigrams_per_day, hashtags, mentions,
+    domains и распределение реакций reactions (с долей) и reactions_per_day.
+    """
+    counts = count_texts(columns, tz, processes)
+    words = group_word_forms(counts['words'])
+    reactions = _top(counts['reactions'], 'reaction', None)
+    total_reactions = int(reactions['count'].sum())
+    reactions['share'] = (reactions['count'] / total_reactions).round(4) if total_reactions else 0.0
+    return {
+        'messages': counts['messages'],
+        'keywords': _top(words, 'word', top_n),
+        'keywords_per_day': _top_per_day(words, 'word', top_n),
+        'bigrams': _top(counts['bigrams'], 'bigram', top_n),
+        'bigrams_per_day': _top_per_day(counts['bigrams'], 'bigram', top_n),
+        'hashtags': _top(counts['hashtags'], 'hashtag', top_n),
+        'mentions': _top(counts['mentions'], 'mention', top_n),
+        'domains': _top(counts['domains'], 'domain', top_n),
+        'reactions': reactions,
+        'reactions_per_day': _top_per_day(counts['reactions'], 'reaction', None),
+    }
+
+def build_text_frames(analytics):
+    """Таблицы анализа текста нескольких каналов для выгрузки
+
+    analytics — {канал: результат analyze_texts}. Возвращает словарь
+    keywords, ngrams, entities и reactions со столбцом channel.
+    """
+    frames = {'keywords': [], 'ngrams': [], 'entities': [], 'reactions': []}
+    for channel, text in analytics.items():
+        frames['keywords'].append(text['keywords_per_day'].assign(channel=channel))
+        frames['ngrams'].append(text['bigrams_per_day'].assign(channel=channel))
+        for kind in ('hashtag', 'mention', 'domain'):
+            frames['entities'].append(
+                text[f'{kind}s'].rename(columns={kind: 'value'}).assign(channel=channel, kind=kind)
+            )
+        frames['reactions'].append(text['reactions_per_day'].assign(channel=channel))
+    columns = {
+        'keywords': ['channel', 'date', 'word', 'count'],
+        'ngrams': ['channel', 'date', 'bigram', 'count'],
+        'entities': ['channel', 'kind', 'value', 'count'],
+        'reactions': ['channel', 'date', 'reaction', 'count'],
+    }
+    return {
+        name: pd.concat(parts, ignore_index=True)[columns[name]] if parts else pd.DataFrame(columns=columns[name])
+        for name, parts in frames.items()
+    }
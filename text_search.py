@@ -0,0 +1,98 @@
+import re
+import threading
+from functools import lru_cache
+
+import snowballstemmer
+
+# Сколько основ слов держать в кэше стеммера
+STEM_CACHE_SIZE = 200_000
+# Длина фрагмента текста вокруг совпадения
+SNIPPET_LENGTH = 200
+
+_WORD_RE = re.compile(r"[0-9a-zа-я]+")
+_QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+_CYRILLIC_RE = re.compile(r"[а-я]")
+
+_stemmers = threading.local()
+
+def normalize_text(text):
+    """Нижний регистр и «ё» -> «е»"""
+    return text.lower().replace('ё', 'е')
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem_russian(word):
+    """Основа русского слова по алгоритму Snowball (слово в нижнем регистре, без «ё»)"""
+    # Стеммер хранит состояние разбора, поэтому у каждого потока свой
+    stemmer = getattr(_stemmers, 'russian', None)
+    if stemmer is None:
+        stemmer = _stemmers.russian = snowballstemmer.stemmer('russian')
+    return stemmer.stemWord(word)
+
+def stem_word(word):
+    """Основа слова: русские слова стеммируются, остальные не меняются"""
+    if _CYRILLIC_RE.search(word):
+        return stem_russian(word)
+    return word
+
+def tokenize(text):
+    """Слова текста в нормализованном виде"""
+    return _WORD_RE.findall(normalize_text(text or ''))
+
+def index_terms(text):
+    """Строка основ слов текста для полнотекстового индекса"""
+    return ' '.join(stem_word(word) for word in tokenize(text))
+
+def build_match_query(query):
+    """Выражение FTS5 MATCH по запросу пользователя
+
+    Слова ищутся по основам и должны встретиться все; "фраза в кавычках" —
+    основы подряд; слово* — поиск по началу слова без стемминга;
+    -слово исключает сообщения с этим словом. Возвращает None для пустого запроса.
+    """
+    included = []
+    excluded = []
+    for phrase, word in _QUERY_RE.findall(query or ''):
+        if phrase:
+            stems = [stem_word(token) for token in tokenize(phrase)]
+            if stems:
+                included.append('"' + ' '.join(stems) + '"')
+            continue
+        negative = word.startswith('-') and len(word) > 1
+        if negative:
+            word = word[1:]
+        if word.endswith('*'):
+            tokens = tokenize(word[:-1])
+            terms = [f'"{token}"' for token in tokens[:-1]] + ([f'"{tokens[-1]}" *'] if tokens else [])
+        else:
+            terms = [f'"{stem_word(token)}"' for token in tokenize(word)]
+        (excluded if negative else included).extend(terms)
+    if not included:
+        return None
+    expression = ' AND '.join(included)
+    for term in excluded:
+        expression += f' NOT {term}'
+    return expression
+
+def query_words(query):
+    """Основы слов запроса (для выделения совпадений во фрагменте)"""
+    return {stem_word(token) for token in tokenize((query or '').replace('*', ' ').replace('-', ' '))}
+
+def make_snippet(text, query, length=SNIPPET_LENGTH):
+    """Фрагмент текста вокруг первого совпадения со словом запроса"""
+    text = text or ''
+    if len(text) <= length:
+        return text
+    stems = query_words(query)
+    normalized = normalize_text(text)
+    position = 0
+    for match in _WORD_RE.finditer(normalized):
+        if stem_word(match.group()) in stems:
+            position = match.start()
+            break
+    start = max(0, min(position - length // 4, len(text) - length))
+    # Фрагмент начинается с границы слова
+    if start > 0:
+        space = text.find(' ', start, position)
+        start = space + 1 if space != -1 else start
+    snippet = text[start:start + length]
+    return ('…' if start > 0 else '') + snippet + ('…' if start + length < len(text) else '')